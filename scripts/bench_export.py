@@ -0,0 +1,72 @@
+import sys
+from pathlib import Path
+
+# Add parent directory to path for direct execution
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.data_store import DataStore, RegulatoryItem
+from utils.output_generators import OutputGenerators
+from datetime import datetime, timedelta
+from sqlalchemy import text
+import argparse
+import filecmp
+import os
+import resource
+import subprocess
+import tempfile
+import time
+
+# Peak memory and time of the report export on a synthetic SQLite database, each mode in a fresh process:
+#   imports  - interpreter, imports and an opened DataStore only (the floor under every other mode)
+#   orm      - session.query(RegulatoryItem).all() + export_to_csv, the export before streaming
+#   rows     - get_item_rows() + export_to_csv, the streaming=False path
+#   stream   - iter_export_rows() into stream_to_csv and stream_to_jsonl, the default path
+MODES = ('imports', 'orm', 'rows', 'stream')
+
+def build(path: str, n: int, chunk: int = 100000):
+    data_store = DataStore(f'sqlite:///{path}')
+    for start in range(0, n, chunk):
+        data_store.add_items([{'source': ['SEC', 'FINRA', 'FedReg'][i % 3], 'type': 'press_release', 'published_at': datetime(2024, 1, 1) + timedelta(minutes=i),
+                               'title': f'Synthetic regulatory item {i}', 'summary_raw': 's' * 800, 'url': f'https://example.com/items/{i}'}
+                              for i in range(start, min(start + chunk, n))])
+    with data_store.session_scope(write=True) as session:
+        session.execute(text("UPDATE regulatory_items SET is_relevant = 1, impact_overall = 'High', impact_rank = 3, business_area = 'RIA', "
+                             "executive_summary = substr(summary_raw, 1, 400)"))
+    data_store.engine.dispose()
+
+def export(path: str, mode: str, output_dir: str):
+    data_store = DataStore(f'sqlite:///{path}')
+    started = time.perf_counter()
+    if mode == 'orm':
+        with data_store.session_scope() as session:
+            OutputGenerators.export_to_csv(session.query(RegulatoryItem).all(), os.path.join(output_dir, 'orm.csv'))
+    elif mode == 'rows':
+        OutputGenerators.export_to_csv(data_store.get_item_rows(), os.path.join(output_dir, 'rows.csv'))
+    elif mode == 'stream':
+        OutputGenerators.stream_to_csv(data_store.iter_export_rows(), os.path.join(output_dir, 'stream.csv'))
+        OutputGenerators.stream_to_jsonl(data_store.iter_export_rows(), os.path.join(output_dir, 'stream.jsonl'))
+    seconds = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on Linux
+    print(f"{mode:8s} peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024:6d} MB  {seconds:6.1f}s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark peak memory of the CSV/JSON Lines export')
+    parser.add_argument('--rows', type=int, default=500000, help='number of synthetic items')
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--output-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        export(args.db, args.mode, args.output_dir)
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, 'items.db')
+        print(f"Building {args.rows} rows...")
+        build(db, args.rows)
+        for mode in MODES:
+            subprocess.run([sys.executable, __file__, '--mode', mode, '--db', db, '--output-dir', tmp], check=True)
+        identical = filecmp.cmp(os.path.join(tmp, 'orm.csv'), os.path.join(tmp, 'stream.csv'), shallow=False)
+        print(f"orm and stream CSV byte-identical: {identical}")
@@ -0,0 +1,62 @@
+import sys
+from pathlib import Path
+
+# Add parent directory to path for direct execution
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.data_store import DataStore, RegulatoryItem
+from datetime import datetime, timedelta
+from typing import Dict, List
+import argparse
+import json
+import tempfile
+import time
+
+# Ingest time of DataStore.add_items against the per-item path it replaced, on fresh SQLite files.
+# "fresh" adds half the batch to an empty table; "mixed" then adds the whole batch, half of it already stored.
+
+def synthetic_items(n: int) -> List[Dict]:
+    return [{'source': ['SEC', 'FINRA', 'FedReg'][i % 3], 'type': 'press_release', 'published_at': datetime(2025, 1, 1) + timedelta(minutes=i),
+             'title': f'Synthetic regulatory item {i}', 'summary_raw': 's' * 200, 'url': f'https://example.com/items/{i}', 'tags': ['a'], 'entities': []}
+            for i in range(n)]
+
+def per_item_add(data_store: DataStore, items: List[Dict]) -> List[int]:
+    # add_items before the set-based ingest: one SELECT by url and one flush per item
+    added_ids = []
+    with data_store.session_scope(write=True) as session:
+        for item_dict in items:
+            existing = session.query(RegulatoryItem).filter_by(url=item_dict['url']).first()
+            if existing:
+                continue
+            item = RegulatoryItem(source=item_dict['source'], type=item_dict['type'], published_at=item_dict['published_at'], title=item_dict['title'],
+                                  summary_raw=item_dict['summary_raw'], url=item_dict['url'], tags=json.dumps(item_dict.get('tags', [])),
+                                  entities=json.dumps(item_dict.get('entities', [])))
+            session.add(item)
+            session.flush()
+            added_ids.append(item.id)
+    return added_ids
+
+def run(n: int, path: str, add) -> Dict[str, float]:
+    data_store = DataStore(f'sqlite:///{path}')
+    items = synthetic_items(n)
+    started = time.perf_counter()
+    fresh_ids = add(data_store, items[:n // 2])
+    fresh = time.perf_counter() - started
+    started = time.perf_counter()
+    mixed_ids = add(data_store, items)
+    mixed = time.perf_counter() - started
+    assert len(fresh_ids) == n // 2 and len(mixed_ids) == n - n // 2
+    data_store.engine.dispose()
+    return {'fresh': fresh, 'mixed': mixed}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark DataStore.add_items against the per-item ingest path')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='batch sizes to ingest')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            before = run(n, f'{tmp}/per_item_{n}.db', per_item_add)
+            after = run(n, f'{tmp}/bulk_{n}.db', DataStore.add_items)
+            print(f"{n:>7} items  fresh: {before['fresh']:6.2f}s -> {after['fresh']:5.2f}s   mixed: {before['mixed']:6.2f}s -> {after['mixed']:5.2f}s")
@@ -0,0 +1,87 @@
+import sys
+from pathlib import Path
+
+# Add parent directory to path for direct execution
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.data_store import DataStore, RegulatoryItem
+from utils.output_generators import OutputGenerators
+from datetime import datetime, timedelta
+from sqlalchemy import text
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+
+# Rows/sec and peak memory of the projected Core read path against ORM hydration, on a synthetic analyzed table.
+# Each mode runs in a fresh process, once for timing and once under tracemalloc for the peak (tracemalloc slows allocation down).
+#   orm        - session.query(RegulatoryItem).all(), then digest + backlog + changelog
+#   rows       - get_item_rows() over ROW_COLUMNS + tasks, then the same deliverables
+#   orm_frame  - ORM objects turned into a DataFrame of ROW_COLUMNS
+#   frame      - get_items_frame()
+MODES = ('orm', 'rows', 'orm_frame', 'frame')
+
+def build(path: str, n: int, chunk: int = 50000):
+    data_store = DataStore(f'sqlite:///{path}')
+    for start in range(0, n, chunk):
+        data_store.add_items([{'source': ['SEC', 'FINRA', 'FedReg'][i % 3], 'type': 'press_release', 'published_at': datetime(2025, 1, 1) + timedelta(minutes=i),
+                               'title': f'Synthetic regulatory item {i}', 'summary_raw': 's' * 800, 'url': f'https://example.com/items/{i}'}
+                              for i in range(start, min(start + chunk, n))])
+    # Analyses written in SQL: a third relevant, impact levels cycled, with the large executive_summary and tasks columns filled
+    with data_store.session_scope(write=True) as session:
+        session.execute(text("UPDATE regulatory_items SET is_relevant = (id % 3 = 0), business_area = 'RIA', impact_rank = id % 4, "
+                             "impact_overall = CASE id % 4 WHEN 0 THEN 'Low' WHEN 1 THEN 'Medium' WHEN 2 THEN 'High' ELSE 'Critical' END, "
+                             "impact_score = 1 + id % 5, executive_summary = substr(summary_raw, 1, 600), analyzed_at = ingested_at, "
+                             "tasks = '[{\"task\": \"Review item ' || (id % 500) || '\", \"owner_role\": \"Compliance\", \"due_window\": \"30\"}]'"))
+    data_store.engine.dispose()
+
+def read(path: str, mode: str, trace: bool):
+    data_store = DataStore(f'sqlite:///{path}')
+    data_store.count_items()
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    if mode == 'orm':
+        with data_store.session_scope() as session:
+            items = session.query(RegulatoryItem).order_by(RegulatoryItem.id).all()
+    elif mode == 'rows':
+        items = data_store.get_item_rows(columns=DataStore.ROW_COLUMNS + ('tasks',))
+    elif mode == 'orm_frame':
+        with data_store.session_scope() as session:
+            items = pd.DataFrame([{name: getattr(item, name) for name in DataStore.ROW_COLUMNS} for item in session.query(RegulatoryItem).all()])
+    else:
+        items = data_store.get_items_frame()
+    load = time.perf_counter() - started
+    if mode in ('orm', 'rows'):
+        OutputGenerators.generate_impact_digest(items)
+        OutputGenerators.generate_task_backlog(items)
+        OutputGenerators.generate_changelog(items, datetime.utcnow() - timedelta(hours=24))
+    total = time.perf_counter() - started
+    if trace:
+        print(f"{mode:10s} peak {tracemalloc.get_traced_memory()[1] / 1e6:6.0f} MB")
+    else:
+        print(f"{mode:10s} {len(items) / load:9,.0f} rows/s  load {load:5.2f}s  total {total:5.2f}s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the projected read path against ORM hydration')
+    parser.add_argument('--rows', type=int, default=100000, help='number of synthetic items')
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--trace', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        read(args.db, args.mode, args.trace)
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, 'items.db')
+        print(f"Building {args.rows} rows...")
+        build(db, args.rows)
+        for trace in (False, True):
+            for mode in MODES:
+                subprocess.run([sys.executable, __file__, '--mode', mode, '--db', db] + (['--trace'] if trace else []), check=True)
@@ -0,0 +1,116 @@
+import sys
+from pathlib import Path
+
+# Add parent directory to path for direct execution
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.data_store import DataStore
+from utils.task_clustering import TaskClusterer
+from datetime import datetime, timedelta
+from typing import List, Tuple
+import argparse
+import itertools
+import random
+import string
+import tempfile
+import time
+
+# Quality and scaling of TaskClusterer on synthetic backlogs with known groups: each group is one action
+# (verb family x object x rule topic) and its tasks are paraphrases of it. Precision and recall are estimated on sampled pairs.
+VERBS = [['Update', 'Revise', 'Amend', 'Refresh'], ['Review', 'Assess', 'Evaluate', 'Examine'], ['Train', 'Educate', 'Brief'],
+         ['Document', 'Record', 'Memorialize'], ['Implement', 'Deploy', 'Roll out']]
+OBJECTS = ['AML policy', 'KYC procedures', 'best execution review', 'marketing rule disclosures', 'custody controls', 'Reg BI forms',
+           'supervisory procedures', 'trade surveillance alerts', 'cybersecurity incident plan', 'beneficial ownership checks',
+           'complaint handling workflow', 'vendor due diligence', 'record retention schedule', 'privacy notice', 'options account approvals']
+TEMPLATES = ["{verb} {obj} to reflect {topic}", "{verb} the {obj} for {topic}", "{verb} {obj} per {topic}",
+             "{verb} {obj} in light of the {topic}", "{verb} our {obj} to address {topic}"]
+OWNERS = ['Compliance', 'Legal', 'Operations', 'Technology', 'Training']
+
+class SyntheticBacklog:
+    def __init__(self, seed: int = 1):
+        self.random = random.Random(seed)
+        vocabulary = [''.join(self.random.choice(string.ascii_lowercase) for _ in range(self.random.randint(5, 9))) for _ in range(3000)]
+        topics = [f"{self.random.choice(['SEC', 'FINRA', 'Treasury', 'OCC', 'DOL'])} {self.random.choice(vocabulary)} {self.random.choice(vocabulary)} "
+                  f"{self.random.choice(['rule', 'notice', 'guidance', 'release'])}" for _ in range(400)]
+        self.groups = list(itertools.product(range(len(VERBS)), OBJECTS, topics))
+        self.random.shuffle(self.groups)
+
+    def paraphrase(self, group: int) -> str:
+        verbs, obj, topic = self.groups[group]
+        text = self.random.choice(TEMPLATES).format(verb=self.random.choice(VERBS[verbs]), obj=obj, topic=topic)
+        if self.random.random() < 0.3:
+            text = text.lower()
+        if self.random.random() < 0.2:
+            text += '.'
+        return text
+
+    def tasks(self, n: int, groups: int) -> Tuple[List[Tuple[str, str]], List[int]]:
+        # (text, owner_role) pairs and the group each one was drawn from
+        truth = [self.random.randrange(groups) for _ in range(n)]
+        return [(self.paraphrase(group), OWNERS[group % len(OWNERS)]) for group in truth], truth
+
+def evaluate(clusters: List[List[int]], truth: List[int], rng: random.Random, samples: int = 5000) -> Tuple[float, float]:
+    # Recall: pairs from the same group that share a cluster. Precision: pairs from the same cluster that share a group.
+    label = {index: number for number, members in enumerate(clusters) for index in members}
+    by_group = {}
+    for index, group in enumerate(truth):
+        by_group.setdefault(group, []).append(index)
+    same_group = [rng.sample(members, 2) for members in by_group.values() if len(members) > 1][:samples]
+    same_cluster = [rng.sample(members, 2) for members in clusters if len(members) > 1][:samples]
+    recall = sum(label[i] == label[j] for i, j in same_group) / max(len(same_group), 1)
+    precision = sum(truth[i] == truth[j] for i, j in same_cluster) / max(len(same_cluster), 1)
+    return precision, recall
+
+def all_pairs_seconds(clusterer: TaskClusterer, tasks: List[Tuple[str, str]]) -> float:
+    # The quadratic baseline: exact shingle Jaccard on every pair
+    shingles = [set(clusterer.minhash.shingles(text)) for text, _ in tasks]
+    started = time.perf_counter()
+    for i in range(len(shingles)):
+        for j in range(i + 1, len(shingles)):
+            len(shingles[i] & shingles[j]) / len(shingles[i] | shingles[j])
+    return time.perf_counter() - started
+
+def stored_run(backlog: SyntheticBacklog, n: int):
+    # End to end through the tasks table: one task per item, clustered, then re-run with nothing changed
+    with tempfile.TemporaryDirectory() as tmp:
+        data_store = DataStore(f'sqlite:///{tmp}/items.db')
+        tasks, _ = backlog.tasks(n, max(n // 6, 1))
+        ids = data_store.add_items([{'source': 'SEC', 'type': 'press_release', 'published_at': datetime(2025, 1, 1) + timedelta(minutes=i),
+                                     'title': f'Synthetic regulatory item {i}', 'summary_raw': None, 'url': f'https://example.com/items/{i}'} for i in range(n)])
+        for start in range(0, n, 10000):
+            data_store.update_analyses({item_id: {'relevant': True, 'impact_overall': 'Medium', 'tasks': [{'task': text, 'owner_role': owner, 'due_window': '30'}]}
+                                        for item_id, (text, owner) in zip(ids[start:start + 10000], tasks[start:start + 10000])})
+        clusterer = TaskClusterer(data_store)
+        for label in ('first run', 'unchanged rerun'):
+            started = time.perf_counter()
+            result = clusterer.run()
+            print(f"stored n={n} {label}: {time.perf_counter() - started:.2f}s  clusters={result['clusters']} skipped={result['skipped']}")
+        data_store.engine.dispose()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark near-duplicate task clustering')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 20000, 50000], help='backlog sizes; each has size/6 true groups')
+    parser.add_argument('--all-pairs', type=int, default=2000, help='backlog size for the all-pairs baseline')
+    parser.add_argument('--stored', type=int, default=100000, help='tasks written to a temporary database for the end-to-end run (0 to skip)')
+    args = parser.parse_args()
+
+    backlog = SyntheticBacklog()
+    clusterer = TaskClusterer(data_store=None)
+    for n in args.sizes:
+        tasks, truth = backlog.tasks(n, max(n // 6, 1))
+        started = time.perf_counter()
+        clusters = clusterer.cluster(tasks)
+        seconds = time.perf_counter() - started
+        precision, recall = evaluate(clusters, truth, backlog.random)
+        exact = len({(text.lower(), owner.lower()) for text, owner in tasks})
+        print(f"n={n:>6}  groups={len(set(truth)):>5}  exact dedupe={exact:>6}  clusters={len(clusters):>6}  "
+              f"{seconds:5.2f}s  precision={precision:.2f}  recall={recall:.2f}")
+
+    tasks, _ = backlog.tasks(args.all_pairs, max(args.all_pairs // 6, 1))
+    seconds = all_pairs_seconds(clusterer, tasks)
+    largest = max(args.sizes)
+    print(f"all pairs n={args.all_pairs}: {seconds:.2f}s, about {seconds * (largest / args.all_pairs) ** 2 / 60:.0f} min extrapolated to n={largest}")
+
+    if args.stored:
+        stored_run(backlog, args.stored)
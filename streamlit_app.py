@@ -1,12 +1,15 @@
 import streamlit as st
 from datetime import datetime, timedelta
 import pandas as pd
-import json
 import os
 from pathlib import Path
 from utils.orchestrator import RegulatoryIntelligenceOrchestrator
-from utils.data_store import DataStore, RegulatoryItem
-from sqlalchemy import desc
+from utils.data_store import DataStore, PipelineJob
+from utils.dashboard_queries import DashboardQueries
+from utils.job_runner import PipelineJobRunner, JobAlreadyRunning, STAGES
+
+# Seconds between progress polls while a pipeline job is queued or running
+JOB_POLL_SECONDS = 2
 
 # Page configuration
 st.set_page_config(
@@ -173,12 +176,22 @@ st.markdown("""
 def get_orchestrator():
     return RegulatoryIntelligenceOrchestrator()
 
+@st.cache_resource
+def get_job_runner():
+    return PipelineJobRunner(get_orchestrator())
+
 @st.cache_resource
 def get_data_store():
     return DataStore()
 
+@st.cache_resource
+def get_dashboard_queries():
+    return DashboardQueries(get_data_store(), ttl=300)
+
 orchestrator = get_orchestrator()
+runner = get_job_runner()
 data_store = get_data_store()
+queries = get_dashboard_queries()
 
 # Top Navigation Header
 st.markdown("""
@@ -205,43 +218,73 @@ st.markdown("""
 with st.sidebar:
     st.markdown('<div class="section-header">⚙️ Pipeline Control</div>', unsafe_allow_html=True)
     
-    # Run full pipeline button
+    # Run full pipeline in the background; the job panel below polls its row
     if st.button("▶️ Run Full Pipeline", use_container_width=True, help="Ingest, analyze, and generate deliverables"):
-        with st.spinner("Running pipeline... This may take a few minutes"):
-            try:
-                results = orchestrator.run_full_pipeline(limit_analysis=50)
-                st.success(f"""
-                ✅ Pipeline Complete!
-                - **Ingested**: {results['ingested']} items
-                - **Analyzed**: {results['analyzed']} items  
-                - **Reports**: JSON + CSV generated
-                """)
-            except Exception as e:
-                st.error(f"Pipeline error: {str(e)}")
+        try:
+            runner.start(limit_analysis=50)
+        except JobAlreadyRunning as e:
+            st.warning(str(e))
+    
+    latest = runner.latest_job()
+    polling = bool(latest) and latest['status'] in PipelineJob.ACTIVE_STATUSES
+    
+    # While a job is active only this panel reruns, every JOB_POLL_SECONDS; when the job ends the whole app reruns to load its results
+    @st.fragment(run_every=JOB_POLL_SECONDS if polling else None)
+    def job_status():
+        job = runner.latest_job()
+        active = bool(job) and job['status'] in PipelineJob.ACTIVE_STATUSES
+        if polling and not active:
+            st.rerun()
+        if active:
+            stages_done = sum(1 for stage in STAGES if job['progress'].get(stage, {}).get('status') == 'done')
+            analyze = job['progress'].get('analyze', {})
+            detail = f" ({analyze['done']}/{analyze['total']} items, {analyze.get('tokens', 0):,} tokens)" if job['stage'] == 'analyze' and analyze.get('total') else ''
+            st.progress(stages_done / len(STAGES), text=f"Job {job['id']}: {job['stage'] or 'queued'}{detail}")
+            if st.button("⏹️ Cancel", use_container_width=True, disabled=job['cancel_requested']):
+                runner.cancel(job['id'])
+                st.rerun()
+        elif job and job['status'] == 'succeeded':
+            if st.session_state.get('seen_job') != job['id']:
+                st.session_state.seen_job = job['id']
+                queries.invalidate()
+            st.success(f"""
+            ✅ Pipeline Complete!
+            - **Ingested**: {job['result']['ingested']} items ({job['result'].get('duplicates', 0)} linked to an earlier copy)
+            - **Full text**: {job['result'].get('full_text', {}).get('changed', 0)} documents fetched or updated, {job['result'].get('full_text', {}).get('amended', 0)} amended
+            - **Analyzed**: {job['result']['analyzed']} items{' (token budget reached)' if job['result'].get('llm_usage', {}).get('budget_exhausted') else ''}  
+            - **Deferred**: {job['result'].get('deferred', 0)} items to retry after API errors
+            - **Reports**: JSON + CSV generated
+            """)
+        elif job and job['status'] == 'cancelled':
+            st.info(f"Pipeline job {job['id']} cancelled: {job['error']}")
+        elif job and job['status'] == 'failed':
+            st.error(f"Pipeline error: {job['error']}")
+    
+    job_status()
     
     st.markdown("---")
     st.markdown('<div class="section-header">🚨 Active Alerts</div>', unsafe_allow_html=True)
     
     # Get high-impact items
-    high_impact = data_store.get_high_impact_items()
+    high_impact = queries.high_impact_alerts(limit=3)
     
-    if high_impact:
-        st.markdown(f"**{len(high_impact)} High/Critical items detected**")
-        for item in high_impact[:3]:
+    if high_impact['count']:
+        st.markdown(f"**{high_impact['count']} High/Critical items detected**")
+        for item in high_impact['items']:
             st.markdown(f"""
                 <div class="alert-card alert-card-high">
                     <div style="font-weight: 600; margin-bottom: 0.5rem;">
-                        <span class="badge badge-danger">{item.impact_overall}</span>
+                        <span class="badge badge-danger">{item['impact_overall']}</span>
                     </div>
-                    <div style="font-size: 0.875rem;">{item.title[:60]}...</div>
+                    <div style="font-size: 0.875rem;">{item['title'][:60]}...</div>
                     <div style="font-size: 0.75rem; color: #6c757d; margin-top: 0.5rem;">
-                        {item.source} • {item.published_at.strftime('%m/%d/%Y') if item.published_at else 'N/A'}
+                        {item['source']} • {item['published_at'].strftime('%m/%d/%Y') if item['published_at'] else 'N/A'}
                     </div>
                 </div>
             """, unsafe_allow_html=True)
         
-        if len(high_impact) > 3:
-            st.markdown(f"_+{len(high_impact)-3} more high-impact items_")
+        if high_impact['count'] > 3:
+            st.markdown(f"_+{high_impact['count']-3} more high-impact items_")
     else:
         st.markdown("""
             <div class="alert-card alert-card-info">
@@ -455,26 +498,24 @@ with col2:
 st.markdown("---")
 
 # Create tabs for different views
-tab1, tab2, tab3, tab4 = st.tabs(["📊 Impact Digest", "📋 Task Backlog", "📈 Analysis Details", "🔄 Changelog"])
+tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Impact Digest", "📋 Task Backlog", "📈 Analysis Details", "🔄 Changelog", "🔢 LLM Usage"])
 
 with tab1:
     st.markdown("<h3>Impact Digest - Top Regulatory Items</h3>", unsafe_allow_html=True)
     
     # Get all items and generate digest
-    all_items = data_store.session.query(RegulatoryItem).filter(
-        RegulatoryItem.is_relevant == 1
-    ).order_by(desc(RegulatoryItem.impact_overall)).limit(10).all()
+    all_items = queries.impact_digest(limit=10)
     
     if all_items:
         digest_data = []
         for item in all_items:
             digest_data.append({
-                'Title': item.title[:70],
-                'Source': item.source,
-                'Type': item.type,
-                'Impact': item.impact_overall or 'N/A',
-                'Business Area': item.business_area or 'N/A',
-                'Published': item.published_at.strftime('%m/%d') if item.published_at else 'N/A',
+                'Title': item['title'][:70],
+                'Source': item['source'],
+                'Type': item['type'],
+                'Impact': item['impact_overall'] or 'N/A',
+                'Business Area': item['business_area'] or 'N/A',
+                'Published': item['published_at'].strftime('%m/%d') if item['published_at'] else 'N/A',
             })
         
         st.dataframe(pd.DataFrame(digest_data), use_container_width=True)
@@ -485,71 +526,55 @@ with tab1:
             top_item = all_items[0]
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Impact Level", top_item.impact_overall or "N/A")
+                st.metric("Impact Level", top_item['impact_overall'] or "N/A")
             with col2:
-                st.metric("Business Area", top_item.business_area or "N/A")
+                st.metric("Business Area", top_item['business_area'] or "N/A")
             with col3:
-                st.metric("Source", top_item.source)
+                st.metric("Source", top_item['source'])
             
-            st.markdown(f"**{top_item.title}**")
-            st.markdown(f"📅 Published: {top_item.published_at.strftime('%B %d, %Y') if top_item.published_at else 'N/A'}")
-            st.markdown(f"🔗 [View Source]({top_item.url})")
+            st.markdown(f"**{top_item['title']}**")
+            st.markdown(f"📅 Published: {top_item['published_at'].strftime('%B %d, %Y') if top_item['published_at'] else 'N/A'}")
+            st.markdown(f"🔗 [View Source]({top_item['url']})")
             
-            if top_item.executive_summary:
+            if top_item['executive_summary']:
                 st.markdown("<strong>Executive Summary:</strong>", unsafe_allow_html=True)
-                st.markdown(top_item.executive_summary)
+                st.markdown(top_item['executive_summary'])
     else:
         st.info("No analyzed items yet. Run the pipeline to analyze regulatory items.")
 
 with tab2:
     st.markdown("<h3>Task Backlog - Actionable Items</h3>", unsafe_allow_html=True)
     
-    # Get all items with tasks
-    all_items = data_store.session.query(RegulatoryItem).filter(
-        RegulatoryItem.tasks != None
-    ).all()
-    
-    if all_items:
-        task_list = []
-        for item in all_items:
-            try:
-                tasks = json.loads(item.tasks) if isinstance(item.tasks, str) else item.tasks or []
-                for task in tasks:
-                    task_list.append({
-                        'Task': task.get('task', 'N/A')[:70],
-                        'Owner': task.get('owner_role', 'N/A'),
-                        'Due': task.get('due_window', 'N/A'),
-                        'Evidence': task.get('evidence_artifact', 'N/A')[:40],
-                        'Impact Item': item.title[:50],
-                    })
-            except:
-                pass
+    backlog_page = st.number_input("Page", min_value=1, value=1, step=1, key="backlog_page")
+    backlog = queries.task_backlog(page=backlog_page, page_size=50)
+    
+    if backlog['total']:
+        task_df = pd.DataFrame([{
+            'Task': task['task'][:70],
+            'Owner': task['owner_role'],
+            'Due': task['due_window'],
+            'Evidence': task['evidence_artifact'][:40],
+            'Impact Item': task['item_title'][:50],
+        } for task in backlog['tasks']])
+        st.markdown(f"**Showing {len(task_df)} of {backlog['total']} tasks**")
+        st.dataframe(task_df, use_container_width=True)
         
-        if task_list:
-            task_df = pd.DataFrame(task_list)
-            st.dataframe(task_df, use_container_width=True)
-            
-            # Group by owner
-            st.markdown("<h4>Tasks by Owner</h4>", unsafe_allow_html=True)
-            for owner in task_df['Owner'].unique():
-                owner_tasks = task_df[task_df['Owner'] == owner]
-                st.markdown(f"**{owner}** ({len(owner_tasks)} tasks)")
-                for _, row in owner_tasks.iterrows():
-                    st.markdown(f"  - {row['Task']} (Due: {row['Due']})")
-        else:
-            st.info("No tasks generated yet.")
+        st.markdown("**By due window:** " + " · ".join(f"{window}: {count}" for window, count in backlog['by_due_window'].items()))
+        
+        # Group by owner
+        st.markdown("<h4>Tasks by Owner</h4>", unsafe_allow_html=True)
+        for owner, count in backlog['by_owner'].items():
+            st.markdown(f"**{owner}** ({count} tasks)")
+            for _, row in task_df[task_df['Owner'] == owner].iterrows():
+                st.markdown(f"  - {row['Task']} (Due: {row['Due']})")
     else:
-        st.info("No items with tasks yet.")
+        st.info("No tasks generated yet.")
 
 with tab3:
     st.markdown("<h3>Detailed Analysis</h3>", unsafe_allow_html=True)
     
-    # Show all analyzed items with detail
-    all_items = data_store.session.query(RegulatoryItem).filter(
-        RegulatoryItem.is_relevant == 1
-    ).order_by(desc(RegulatoryItem.published_at)).all()
-    
-    if all_items:
+    # Filters are applied in SQL; only one page of items is loaded
+    if queries.counts()['relevant']:
         # Filter options
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -561,40 +586,41 @@ with tab3:
                                         ['RIA', 'Broker-Dealer', 'Retirement', 'AML', 'Marketing', 'Trading', 'Supervision', 'Custody'],
                                         default=['RIA', 'Broker-Dealer', 'Retirement'])
         
-        filtered_items = [i for i in all_items if i.source in source_filter and i.impact_overall in impact_filter and i.business_area in area_filter]
+        details_page = st.number_input("Page", min_value=1, value=1, step=1, key="details_page")
+        details = queries.analysis_details(source_filter, impact_filter, area_filter, page=details_page, page_size=20)
         
-        st.markdown(f"**Showing {len(filtered_items)} of {len(all_items)} items**")
+        st.markdown(f"**Showing {details['total']} of {details['total_relevant']} items**")
         
-        for item in filtered_items[:20]:  # Show max 20
-            with st.expander(f"{item.title[:60]} ({item.impact_overall}) - {item.source}"):
+        for item in details['items']:
+            with st.expander(f"{item['title'][:60]} ({item['impact_overall']}) - {item['source']}"):
                 col1, col2, col3, col4 = st.columns(4)
                 with col1:
-                    st.markdown(f"**Type:** {item.type}")
+                    st.markdown(f"**Type:** {item['type']}")
                 with col2:
-                    st.markdown(f"**Area:** {item.business_area or 'N/A'}")
+                    st.markdown(f"**Area:** {item['business_area'] or 'N/A'}")
                 with col3:
-                    st.markdown(f"**Published:** {item.published_at.strftime('%m/%d') if item.published_at else 'N/A'}")
+                    st.markdown(f"**Published:** {item['published_at'].strftime('%m/%d') if item['published_at'] else 'N/A'}")
                 with col4:
-                    st.markdown(f"**Impact:** {item.impact_overall or 'N/A'}")
+                    st.markdown(f"**Impact:** {item['impact_overall'] or 'N/A'}")
                 
                 st.markdown("**Impact Scores:**")
                 score_col1, score_col2, score_col3, score_col4, score_col5 = st.columns(5)
                 with score_col1:
-                    st.metric("Severity", item.impact_severity or "-")
+                    st.metric("Severity", item['impact_severity'] or "-")
                 with score_col2:
-                    st.metric("Time Sens", item.impact_time_sensitivity or "-")
+                    st.metric("Time Sens", item['impact_time_sensitivity'] or "-")
                 with score_col3:
-                    st.metric("Ops Effort", item.impact_operational_effort or "-")
+                    st.metric("Ops Effort", item['impact_operational_effort'] or "-")
                 with score_col4:
-                    st.metric("Customer", item.impact_customer or "-")
+                    st.metric("Customer", item['impact_customer'] or "-")
                 with score_col5:
-                    st.metric("Enforce Risk", item.impact_enforcement_risk or "-")
+                    st.metric("Enforce Risk", item['impact_enforcement_risk'] or "-")
                 
-                if item.executive_summary:
+                if item['executive_summary']:
                     st.markdown("**Summary:**")
-                    st.markdown(item.executive_summary)
+                    st.markdown(item['executive_summary'])
                 
-                st.markdown(f"[📌 View Full Source]({item.url})")
+                st.markdown(f"[📌 View Full Source]({item['url']})")
     else:
         st.info("No analyzed items yet.")
 
@@ -602,39 +628,71 @@ with tab4:
     st.markdown("<h3>Recent Changes & Escalations</h3>", unsafe_allow_html=True)
     
     # Get items from last 24 hours
-    last_24h = datetime.utcnow() - timedelta(hours=24)
-    new_items = data_store.session.query(RegulatoryItem).filter(
-        RegulatoryItem.ingested_at > last_24h
-    ).order_by(desc(RegulatoryItem.published_at)).all()
-    
-    escalated_items = [i for i in new_items if i.impact_overall in ['High', 'Critical']]
+    changelog = queries.changelog(since=datetime.utcnow() - timedelta(hours=24), limit=10)
+    new_items = changelog['new_items']
+    escalated_items = changelog['escalated_items']
     
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("New Items (24h)", len(new_items))
+        st.metric("New Items (24h)", changelog['new_count'], help=f"{changelog['amended_count']} amended and re-analyzed")
     with col2:
-        st.metric("Escalated", len(escalated_items))
+        st.metric("Escalated", changelog['escalated_count'])
     with col3:
-        st.metric("Total in DB", data_store.session.query(RegulatoryItem).count())
+        st.metric("Total in DB", changelog['total_items'])
     
     st.markdown("---")
     
     if new_items:
-        st.markdown(f"<h4>New Items ({len(new_items)})</h4>", unsafe_allow_html=True)
-        for item in new_items[:10]:
+        st.markdown(f"<h4>New Items ({changelog['new_count']})</h4>", unsafe_allow_html=True)
+        for item in new_items:
             st.markdown(f"""
-            - **{item.title}**  
-              {item.source} | {item.type} | {item.published_at.strftime('%m/%d %H:%M') if item.published_at else 'N/A'}
+            - **{item['title']}**  
+              {item['source']} | {item['type']} | {item['published_at'].strftime('%m/%d %H:%M') if item['published_at'] else 'N/A'}
             """)
     
     if escalated_items:
-        st.markdown(f"<h4>⚠️ Escalated Items ({len(escalated_items)})</h4>", unsafe_allow_html=True)
+        st.markdown(f"<h4>⚠️ Escalated Items ({changelog['escalated_count']})</h4>", unsafe_allow_html=True)
         for item in escalated_items:
             st.markdown(f"""
-            - **{item.title}**  
-              {item.source} | Impact: **{item.impact_overall}** | {item.business_area or 'General'}
+            - **{item['title']}**  
+              {item['source']} | Impact: **{item['impact_overall']}** | {item['business_area'] or 'General'}
             """)
 
+with tab5:
+    st.markdown("<h3>LLM Usage - Last 7 Days</h3>", unsafe_allow_html=True)
+    
+    usage = queries.llm_usage(days=7)
+    total = usage['total']
+    
+    if total['api_calls'] or total['cached']:
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("API Calls", total['api_calls'])
+        with col2:
+            st.metric("Tokens (in / out)", f"{total['input_tokens']:,} / {total['output_tokens']:,}")
+        with col3:
+            st.metric("Avg Latency", f"{total['avg_latency_ms']} ms" if total['avg_latency_ms'] is not None else "N/A")
+        with col4:
+            st.metric("Cache Hits", total['cached'])
+        
+        columns = {'api_calls': 'Calls', 'cached': 'Cached', 'input_tokens': 'Input Tokens', 'output_tokens': 'Output Tokens',
+                   'avg_latency_ms': 'Avg ms', 'max_latency_ms': 'Max ms', 'retries': 'Retries', 'parse_failures': 'Parse Failures'}
+        st.markdown("<h4>By Step</h4>", unsafe_allow_html=True)
+        st.dataframe(pd.DataFrame.from_dict(usage['by_step'], orient='index')[list(columns)].rename(columns=columns), use_container_width=True)
+        st.markdown("<h4>By Source</h4>", unsafe_allow_html=True)
+        st.dataframe(pd.DataFrame.from_dict(usage['by_source'], orient='index')[list(columns)].rename(columns=columns), use_container_width=True)
+        
+        st.markdown("<h4>Recent Runs</h4>", unsafe_allow_html=True)
+        st.dataframe(pd.DataFrame([{
+            'Run': run['run_id'],
+            'Started': run['started_at'].strftime('%m/%d %H:%M') if run['started_at'] else 'N/A',
+            'Calls': run['api_calls'],
+            'Tokens': run['total_tokens'],
+            'Parse Failures': run['parse_failures'],
+        } for run in usage['runs']]), use_container_width=True)
+    else:
+        st.info("No model calls recorded yet. Run the pipeline to analyze regulatory items.")
+
 # Footer
 st.markdown("---")
 footer_time = datetime.now().strftime('%B %d, %Y %I:%M %p')
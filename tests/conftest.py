@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Tests import the app's modules as `utils.*`, like streamlit_app.py does
+sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -0,0 +1,64 @@
+from utils.data_store import DataStore
+from utils.dashboard_queries import DashboardQueries
+from datetime import datetime, timedelta
+import threading
+import time
+import pytest
+
+ANALYSIS = {'relevant': True, 'relevance_reason': 'r', 'business_area': 'RIA', 'impact_severity': 4, 'impact_time_sensitivity': 3,
+            'impact_operational_effort': 3, 'impact_customer': 2, 'impact_enforcement_risk': 4, 'impact_overall': 'High',
+            'executive_summary': 'a\nb', 'tasks': [{'task': 'Update policy', 'owner_role': 'Compliance', 'due_window': '30'}]}
+
+def _items(start: int, count: int):
+    return [{'source': 'SEC', 'type': 'press_release', 'published_at': datetime(2026, 1, 1) + timedelta(hours=i), 'title': f'Item {i}',
+             'summary_raw': f'Summary {i}', 'url': f'https://example.com/{i}'} for i in range(start, start + count)]
+
+@pytest.fixture(params=['file', 'memory'])
+def data_store(request, tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'items.db'}" if request.param == 'file' else 'sqlite://'
+    data_store = DataStore(db_url)
+    data_store.add_items(_items(0, 500))
+    return data_store
+
+def test_readers_and_writer_run_concurrently(data_store):
+    # Many dashboard readers and one pipeline writer at once: no "database is locked", no session errors, no lost writes
+    errors = []
+    stop = threading.Event()
+    queries = DashboardQueries(data_store, ttl=0)
+    reads = [0]
+
+    def reader():
+        try:
+            while not stop.is_set():
+                data_store.get_unanalyzed_items(limit=50)
+                data_store.get_top_impact_rows(limit=10)
+                data_store.count_items(relevant_only=True)
+                queries.changelog()
+                reads[0] += 1
+        except Exception as e:
+            errors.append(e)
+
+    def writer():
+        try:
+            for item_id in range(1, 151):
+                data_store.update_analysis(item_id, ANALYSIS)
+            data_store.add_items(_items(500, 200))
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(8)]
+    for thread in readers:
+        thread.start()
+    write_thread = threading.Thread(target=writer)
+    write_thread.start()
+    write_thread.join(timeout=120)
+    time.sleep(0.2)
+    stop.set()
+    for thread in readers:
+        thread.join(timeout=30)
+
+    assert not write_thread.is_alive()
+    assert errors == []
+    assert reads[0] > 0
+    assert data_store.count_items() == 700
+    assert data_store.count_items(relevant_only=True) == 150
@@ -0,0 +1,155 @@
+from utils.data_store import DataStore, RegulatoryItem
+from utils.full_text import FullTextFetcher
+from sqlalchemy import text
+from datetime import datetime, timedelta
+import hashlib
+import http.server
+import socketserver
+import threading
+import time
+import pytest
+
+PARAGRAPH = "<p>Members must file retail communications within %s business days of first use.</p>"
+
+class Site:
+    # Pages served by the fixture, keyed by path, and what the server saw
+    def __init__(self):
+        self.pages = {}
+        self.requests = []
+        self.in_flight = {}
+        self.max_in_flight = {}
+        self.lock = threading.Lock()
+
+    def page(self, path: str, days: str = '10', script: str = 'v1', status: int = 200, content_type: str = 'text/html; charset=utf-8',
+             headers=None, delay: float = 0.0, etag: bool = False):
+        self.pages[path] = {'days': days, 'script': script, 'status': status, 'content_type': content_type, 'headers': headers or {},
+                            'delay': delay, 'etag': etag}
+
+    def body(self, page) -> bytes:
+        return (f"<html><head><script>var build='{page['script']}';</script></head><body><nav>Menu</nav>"
+                f"<main><h1>Notice</h1>{PARAGRAPH % page['days']}</main></body></html>").encode()
+
+@pytest.fixture
+def site():
+    site = Site()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            host = self.headers.get('Host')
+            with site.lock:
+                site.requests.append({'path': self.path, 'host': host, 'at': time.monotonic(), 'if_none_match': self.headers.get('If-None-Match')})
+                site.in_flight[host] = site.in_flight.get(host, 0) + 1
+                site.max_in_flight[host] = max(site.max_in_flight.get(host, 0), site.in_flight[host])
+            try:
+                page = site.pages[self.path]
+                time.sleep(page['delay'])
+                body = site.body(page)
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                if page['etag'] and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(page['status'])
+                self.send_header('Content-Type', page['content_type'])
+                if page['etag']:
+                    self.send_header('ETag', etag)
+                for name, value in page['headers'].items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            finally:
+                with site.lock:
+                    site.in_flight[host] -= 1
+
+    class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    site.port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield site
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def data_store():
+    return DataStore('sqlite://')
+
+def _add(data_store: DataStore, urls, source: str = 'FINRA'):
+    return data_store.add_items([{'source': source, 'type': 'notice', 'published_at': datetime(2026, 1, 1) + timedelta(hours=i),
+                                  'title': f'Notice {i}', 'summary_raw': None, 'url': url} for i, url in enumerate(urls)])
+
+def _age_documents(data_store: DataStore):
+    with data_store.session_scope(write=True) as session:
+        session.execute(text("UPDATE item_documents SET fetched_at = :at"), {'at': datetime.utcnow() - timedelta(days=2)})
+
+def test_per_host_concurrency_cap_and_interval(site, data_store):
+    for i in range(6):
+        site.page(f'/slow/{i}', delay=0.2)
+    # Two host names for the same server are two hosts to the throttle
+    _add(data_store, [f'http://{host}:{site.port}/slow/{i}' for host in ('127.0.0.1', 'localhost') for i in range(6)])
+    counts = FullTextFetcher(data_store, max_workers=8, per_host=2, min_interval=0.05).run()
+    assert counts['fetched'] == 12
+    assert site.max_in_flight == {f'127.0.0.1:{site.port}': 2, f'localhost:{site.port}': 2}
+    for host in site.max_in_flight:
+        starts = sorted(request['at'] for request in site.requests if request['host'] == host)
+        assert min(later - earlier for earlier, later in zip(starts, starts[1:])) >= 0.04
+
+def test_backs_off_a_host_on_429_and_503(site, data_store):
+    site.page('/limited', status=429, headers={'Retry-After': '1'})
+    site.page('/after')
+    fetcher = FullTextFetcher(data_store, min_interval=0.0)
+    host = f'127.0.0.1:{site.port}'
+    assert fetcher.fetch(f'http://{host}/limited')['http_status'] == 429
+    started = time.monotonic()
+    assert fetcher.fetch(f'http://{host}/after')['status'] == 'ok'
+    assert time.monotonic() - started >= 0.9
+
+    # Without Retry-After the host is left alone for 30s
+    site.page('/unavailable', status=503)
+    assert fetcher.fetch(f'http://{host}/unavailable')['status'] == 'error'
+    assert fetcher.throttle._hosts[host]['next_at'] - time.monotonic() > 25
+
+def test_skips_unsupported_content(site, data_store):
+    site.page('/notice.pdf', content_type='application/pdf')
+    _add(data_store, [f'http://127.0.0.1:{site.port}/notice.pdf', 'ftp://example.com/notice'])
+    counts = FullTextFetcher(data_store, min_interval=0.0).run()
+    assert (counts['fetched'], counts['unsupported']) == (0, 2)
+    assert data_store.get_full_texts([1, 2]) == {}
+
+def test_unchanged_text_is_not_rewritten(site, data_store):
+    site.page('/notice')
+    _add(data_store, [f'http://127.0.0.1:{site.port}/notice'], source='SEC')
+    fetcher = FullTextFetcher(data_store, min_interval=0.0)
+    assert fetcher.run()['changed'] == 1
+    # Markup and script changes do not change the extracted text's hash
+    site.pages['/notice']['script'] = 'v2'
+    counts = fetcher.run(refresh=True)
+    assert (counts['fetched'], counts['changed'], counts['unchanged'], counts['amended']) == (1, 0, 1, 0)
+    site.pages['/notice']['days'] = '30'
+    assert fetcher.run(refresh=True)['changed'] == 1
+    assert 'within 30 business days' in data_store.get_full_text(1)
+
+def test_finra_recheck_uses_conditional_get(site, data_store):
+    site.page('/notice', etag=True)
+    _add(data_store, [f'http://127.0.0.1:{site.port}/notice'])
+    data_store.update_analysis(1, {'relevant': True, 'impact_overall': 'High', 'tasks': []})
+    fetcher = FullTextFetcher(data_store, min_interval=0.0)
+    fetcher.run()
+    # Not due yet: checked less than a day ago
+    assert fetcher.recheck()['fetched'] == 0 and len(site.requests) == 1
+
+    _age_documents(data_store)
+    counts = fetcher.recheck()
+    assert (counts['not_modified'], counts['fetched'], counts['amended']) == (1, 0, 0)
+    assert site.requests[-1]['if_none_match'] is not None
+
+    site.pages['/notice']['days'] = '5'
+    _age_documents(data_store)
+    assert fetcher.recheck()['amended'] == 1
+    with data_store.session_scope() as session:
+        assert session.get(RegulatoryItem, 1).needs_reanalysis == 1
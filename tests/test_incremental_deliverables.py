@@ -0,0 +1,36 @@
+from utils.data_store import DataStore
+from utils.incremental_deliverables import IncrementalDeliverables
+from datetime import datetime, timedelta
+import time
+import pytest
+
+def _analysis(total: int, relevant: bool = True):
+    # Five 1-5 dimensions summing to total, so every item gets a distinct impact score
+    dimensions = [1] * 5
+    for index in range(total - 5):
+        dimensions[index % 5] += 1
+    severity, time_sensitivity, effort, customer, enforcement = dimensions
+    return {'relevant': relevant, 'impact_overall': 'High', 'impact_severity': severity, 'impact_time_sensitivity': time_sensitivity,
+            'impact_operational_effort': effort, 'impact_customer': customer, 'impact_enforcement_risk': enforcement, 'tasks': []}
+
+@pytest.fixture
+def data_store():
+    data_store = DataStore('sqlite://')
+    ids = data_store.add_items([{'source': 'SEC', 'type': 'press_release', 'published_at': datetime(2026, 1, 1) + timedelta(hours=i),
+                                 'title': f'Item {i}', 'summary_raw': None, 'url': f'https://example.com/{i}'} for i in range(20)])
+    data_store.update_analyses({item_id: _analysis(5 + index) for index, item_id in enumerate(ids)})
+    return data_store
+
+def _digest_ids(deliverables):
+    return [item['id'] for item in deliverables['digest']['items']]
+
+@pytest.mark.parametrize('change', [_analysis(5), _analysis(25, relevant=False)], ids=['demoted', 'not_relevant'])
+def test_incremental_digest_refills_when_a_top_item_drops(data_store, change):
+    deliverables = IncrementalDeliverables(data_store)
+    assert _digest_ids(deliverables.generate()) == list(range(20, 10, -1))
+    time.sleep(0.01)
+    data_store.update_analysis(20, change)
+    time.sleep(0.01)
+    incremental = deliverables.generate()
+    assert _digest_ids(incremental) == list(range(19, 9, -1))
+    assert _digest_ids(incremental) == _digest_ids(IncrementalDeliverables(data_store).generate(rebuild=True))
@@ -0,0 +1,178 @@
+from utils.ai_analysis import AIAnalysisPipeline, RetryPolicy, CircuitBreaker, LLMCallFailed
+from utils.data_store import RegulatoryItem
+from utils.orchestrator import RegulatoryIntelligenceOrchestrator
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import json
+import threading
+import time
+import pytest
+
+ANSWERS = {
+    'Is this regulatory item relevant': {'relevant': True, 'business_area': 'RIA', 'reason': 'adviser rule'},
+    'Score impact': {'severity': 4, 'time_sensitivity': 3, 'operational_effort': 3, 'customer_impact': 2, 'enforcement_risk': 4, 'overall': 'High'},
+    'Generate 5 bullets': {'summary': ['a', 'b', 'c', 'd', 'e']},
+    'actionable tasks': {'tasks': [{'task': 'Update policy', 'owner_role': 'Compliance', 'due_window': '30'}]},
+}
+
+class APIStatusError(Exception):
+    # What RetryPolicy reads from anthropic's errors: the status code and the response headers
+    def __init__(self, status_code: int, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+class FaultyMessages:
+    # Raises whatever inject() returns for a call, otherwise answers like the model would
+    def __init__(self, inject):
+        self.inject = inject
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, model, max_tokens, messages, **kwargs):
+        with self._lock:
+            self.calls += 1
+        error = self.inject()
+        if error:
+            raise error
+        prompt = messages[0]['content']
+        answer = next((answer for marker, answer in ANSWERS.items() if marker in prompt), {})
+        return SimpleNamespace(content=[SimpleNamespace(text=json.dumps(answer))], usage=SimpleNamespace(input_tokens=100, output_tokens=20))
+
+class FaultyClient:
+    def __init__(self, inject=lambda: None):
+        self.messages = FaultyMessages(inject)
+
+def _pipeline(client, max_retries: int = 3):
+    return AIAnalysisPipeline(client=client, retry_policy=RetryPolicy(max_retries=max_retries, base_delay=0.001, max_delay=0.5),
+                              circuit_breaker=CircuitBreaker(failure_threshold=100, cooldown=0.01))
+
+def test_retry_after_header_takes_precedence():
+    policy = RetryPolicy(base_delay=1.0, max_delay=60.0)
+    assert policy.delay(0, APIStatusError(429, {'retry-after': '7'})) == 7.0
+    assert policy.delay(0, APIStatusError(429, {'retry-after-ms': '250'})) == 0.25
+    http_date = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < policy.delay(0, APIStatusError(429, {'retry-after': http_date})) <= 30
+
+def test_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(base_delay=1.0, max_delay=10.0)
+    for attempt in range(8):
+        assert 0 <= policy.delay(attempt, APIStatusError(529)) <= min(10.0, 2 ** attempt)
+
+def test_only_overload_and_transport_errors_are_retryable():
+    policy = RetryPolicy()
+    assert [policy.is_retryable(APIStatusError(status)) for status in (408, 429, 500, 529)] == [True] * 4
+    assert [policy.is_retryable(APIStatusError(status)) for status in (400, 401, 413)] == [False] * 3
+    assert policy.is_retryable(ConnectionError()) and not policy.is_retryable(ValueError())
+
+def test_transient_errors_are_retried():
+    errors = [APIStatusError(529), APIStatusError(429, {'retry-after': '0.01'})]
+    client = FaultyClient(lambda: errors.pop(0) if errors else None)
+    response, latency, retries = _pipeline(client)._create('relevance', 'prompt', max_tokens=10)
+    assert (client.messages.calls, retries) == (3, 2)
+
+def test_gives_up_at_once_on_a_rejected_request():
+    client = FaultyClient(lambda: APIStatusError(400))
+    with pytest.raises(LLMCallFailed) as failure:
+        _pipeline(client)._create('relevance', 'prompt', max_tokens=10)
+    assert client.messages.calls == 1
+    assert (failure.value.attempts, failure.value.retryable) == (1, False)
+
+def test_gives_up_after_max_retries():
+    client = FaultyClient(lambda: APIStatusError(503))
+    with pytest.raises(LLMCallFailed) as failure:
+        _pipeline(client, max_retries=2)._create('relevance', 'prompt', max_tokens=10)
+    assert client.messages.calls == 3
+    assert (failure.value.attempts, failure.value.retryable) == (3, True)
+
+def test_circuit_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=0.05, max_cooldown=0.2)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    assert (breaker.state, breaker.opened) == ('open', 1)
+
+    # Calls wait out the cooldown; the first one through is the half-open probe
+    started = time.monotonic()
+    breaker.before_call()
+    assert time.monotonic() - started >= 0.04
+    assert breaker.state == 'half_open'
+
+    # A failed probe reopens the circuit for twice as long
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    started = time.monotonic()
+    breaker.before_call()
+    assert time.monotonic() - started >= 0.09
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    started = time.monotonic()
+    breaker.before_call()
+    assert time.monotonic() - started < 0.05
+
+def test_other_callers_wait_for_the_probe():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.02)
+    breaker.record_failure()
+    breaker.before_call()
+    assert breaker.state == 'half_open'
+    passed = threading.Event()
+    waiter = threading.Thread(target=lambda: (breaker.before_call(), passed.set()))
+    waiter.start()
+    assert not passed.wait(0.1)
+    breaker.record_success()
+    assert passed.wait(1.0)
+    waiter.join()
+
+@pytest.fixture
+def orchestrator(tmp_path):
+    orchestrator = RegulatoryIntelligenceOrchestrator(db_url='sqlite://', ai_client=FaultyClient(), use_llm_cache=False, use_prefilter=False,
+                                                      fetch_full_text=False, connector_state_path=str(tmp_path / 'state.json'))
+    orchestrator.ai_pipeline.retry_policy = RetryPolicy(max_retries=1, base_delay=0.001, max_delay=0.5)
+    orchestrator.ai_pipeline.circuit_breaker = CircuitBreaker(failure_threshold=100, cooldown=0.01)
+    orchestrator.data_store.add_items([{'source': 'SEC', 'type': 'press_release', 'published_at': datetime(2026, 1, 1) + timedelta(hours=i),
+                                        'title': f'Investment adviser rule {i}', 'summary_raw': None, 'url': f'https://example.com/{i}'} for i in range(3)])
+    return orchestrator
+
+def _rows(orchestrator):
+    with orchestrator.data_store.session_scope() as session:
+        return [(item.is_relevant, item.analysis_status, item.analysis_attempts, item.retry_at) for item in session.query(RegulatoryItem).order_by(RegulatoryItem.id)]
+
+def test_failed_items_are_deferred_then_retried(orchestrator):
+    orchestrator.ai_pipeline.client.messages.inject = lambda: APIStatusError(529)
+    assert orchestrator.analyze_unanalyzed_items() == 0
+    assert orchestrator.last_analysis_report == {'analyzed': 0, 'deferred': 3}
+    rows = _rows(orchestrator)
+    # Nothing stored as an analysis; every item waits for its retry_at
+    assert all(relevant is None and status == 'failed' and attempts == 1 and retry_at > datetime.utcnow() for relevant, status, attempts, retry_at in rows)
+    assert orchestrator.data_store.count_failed_analyses() == 3
+    assert orchestrator.data_store.get_unanalyzed_items() == []
+
+    orchestrator.ai_pipeline.client.messages.inject = lambda: None
+    with orchestrator.data_store.session_scope(write=True) as session:
+        session.query(RegulatoryItem).update({'retry_at': datetime.utcnow() - timedelta(seconds=1)})
+    assert orchestrator.analyze_unanalyzed_items() == 3
+    assert _rows(orchestrator) == [(1, None, None, None)] * 3
+    assert orchestrator.data_store.count_failed_analyses() == 0
+
+def test_unusable_reply_is_deferred_not_stored(orchestrator):
+    orchestrator.ai_pipeline.client.messages.create = lambda **kwargs: SimpleNamespace(content=[SimpleNamespace(text='not json')], usage=None)
+    assert orchestrator.analyze_unanalyzed_items() == 0
+    assert [row[:2] for row in _rows(orchestrator)] == [(None, 'failed')] * 3
+
+def test_rejected_request_fails_permanently(orchestrator):
+    orchestrator.ai_pipeline.client.messages.inject = lambda: APIStatusError(400)
+    orchestrator.analyze_unanalyzed_items()
+    assert [row[1:] for row in _rows(orchestrator)] == [('failed_permanent', 1, None)] * 3
+    assert orchestrator.data_store.get_unanalyzed_items() == []
+    assert orchestrator.data_store.count_failed_analyses() == 0
+
+def test_retries_stop_after_max_attempts(orchestrator):
+    orchestrator.ai_pipeline.client.messages.inject = lambda: APIStatusError(529)
+    for _ in range(orchestrator.data_store.ANALYSIS_MAX_ATTEMPTS):
+        with orchestrator.data_store.session_scope(write=True) as session:
+            session.query(RegulatoryItem).update({'retry_at': None})
+        orchestrator.analyze_unanalyzed_items()
+    assert [row[1:3] for row in _rows(orchestrator)] == [('failed_permanent', orchestrator.data_store.ANALYSIS_MAX_ATTEMPTS)] * 3
+    assert orchestrator.data_store.get_unanalyzed_items() == []
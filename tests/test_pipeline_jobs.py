@@ -0,0 +1,36 @@
+from utils.data_store import DataStore, PipelineJob
+from datetime import datetime, timedelta
+import pytest
+
+STALE_AFTER = timedelta(minutes=15)
+
+@pytest.fixture
+def data_store():
+    return DataStore('sqlite://')
+
+def _stop_heartbeat(data_store: DataStore, job_id: int):
+    # What a crashed process leaves behind: a running job nobody updates any more
+    data_store.update_pipeline_job(job_id, status='running')
+    with data_store.session_scope(write=True) as session:
+        session.get(PipelineJob, job_id).heartbeat_at = datetime.utcnow() - STALE_AFTER - timedelta(minutes=1)
+
+def test_latest_job_fails_a_job_whose_heartbeat_stopped(data_store):
+    job_id = data_store.create_pipeline_job({}, STALE_AFTER)
+    _stop_heartbeat(data_store, job_id)
+    job = data_store.get_latest_pipeline_job(STALE_AFTER)
+    assert (job['id'], job['status'], job['error']) == (job_id, 'failed', 'heartbeat lost')
+    assert job['finished_at'] is not None
+
+def test_live_job_is_left_running(data_store):
+    job_id = data_store.create_pipeline_job({}, STALE_AFTER)
+    data_store.update_pipeline_job(job_id, status='running')
+    assert data_store.get_latest_pipeline_job(STALE_AFTER)['status'] == 'running'
+    assert data_store.create_pipeline_job({}, STALE_AFTER) is None
+
+def test_new_job_replaces_a_crashed_one(data_store):
+    crashed_id = data_store.create_pipeline_job({}, STALE_AFTER)
+    _stop_heartbeat(data_store, crashed_id)
+    job_id = data_store.create_pipeline_job({}, STALE_AFTER)
+    assert job_id is not None and job_id != crashed_id
+    crashed = data_store.get_pipeline_job(crashed_id)
+    assert (crashed['status'], crashed['error']) == ('failed', 'heartbeat lost')
@@ -0,0 +1,52 @@
+from utils.data_store import DataStore
+from utils.dashboard_queries import DashboardQueries
+from sqlalchemy import event
+from datetime import datetime, timedelta
+import pytest
+
+SOURCES = ['SEC', 'FINRA', 'FedReg']
+IMPACTS = ['Low', 'Medium', 'High', 'Critical']
+
+def _analysis(index: int):
+    return {'relevant': index % 3 == 0, 'relevance_reason': 'r', 'business_area': ['RIA', 'Broker-Dealer', 'AML'][index % 3],
+            'impact_severity': 1 + index % 5, 'impact_time_sensitivity': 3, 'impact_operational_effort': 3, 'impact_customer': 2,
+            'impact_enforcement_risk': 3, 'impact_overall': IMPACTS[index % 4], 'executive_summary': 'a\nb',
+            'tasks': [{'task': f'Task {index % 50}', 'owner_role': 'Compliance', 'due_window': '30'}]}
+
+@pytest.fixture
+def data_store(tmp_path):
+    data_store = DataStore(f"sqlite:///{tmp_path / 'items.db'}")
+    ids = data_store.add_items([{'source': SOURCES[i % 3], 'type': 'press_release', 'published_at': datetime(2026, 1, 1) + timedelta(hours=i),
+                                 'title': f'Item {i}', 'summary_raw': None, 'url': f'https://example.com/{i}'} for i in range(2000)])
+    # Two thirds analyzed, so the unanalyzed queue is not empty
+    data_store.update_analyses({item_id: _analysis(index) for index, item_id in enumerate(ids[:1400])})
+    return data_store
+
+def test_hot_queries_use_indexes(data_store):
+    assert data_store.find_full_scans() == {}
+
+def test_dashboard_queries_use_indexes(data_store):
+    # Every SELECT the dashboard issues, captured as executed and explained with its own parameters
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+    event.listen(data_store.engine, 'before_cursor_execute', capture)
+    try:
+        queries = DashboardQueries(data_store, ttl=0)
+        queries.counts()
+        queries.high_impact_alerts()
+        queries.impact_digest()
+        queries.task_backlog(page=2)
+        queries.analysis_details(SOURCES[:2], IMPACTS[2:], ['RIA'], page=2)
+        queries.changelog()
+        queries.llm_usage()
+    finally:
+        event.remove(data_store.engine, 'before_cursor_execute', capture)
+
+    plans = {}
+    with data_store.connect() as conn:
+        for statement, parameters in statements:
+            plans[statement] = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    assert any('tasks' in statement for statement in plans)
+    assert data_store.find_full_scans(plans) == {}
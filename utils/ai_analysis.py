@@ -1,26 +1,394 @@
 import anthropic
 import json
-from typing import Dict
+from utils.llm_cache import LLMResponseCache
+from utils.llm_usage import LLMUsageTracker
+from utils.relevance_filter import RelevanceFilter
+from utils.long_documents import split_chunks, merge_facts, format_facts, CHARS_PER_TOKEN
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import random
+import threading
+import time
+from typing import Dict, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+class RateLimiter:
+    # Token buckets for requests/minute and tokens/minute, shared by all worker threads
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60.0)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60.0)
+    
+    def acquire(self, tokens: int = 0):
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60.0 / self.requests_per_minute)
+                if self.tokens_per_minute and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60.0 / self.tokens_per_minute)
+                if wait == 0.0:
+                    if self.requests_per_minute:
+                        self._requests -= 1
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    return
+            time.sleep(wait)
+
+class LLMCallFailed(Exception):
+    # The API could not be reached or kept failing after retries; nothing was learned about the item, so it is analyzed again later.
+    # retryable is False when the API rejected the request itself (400, 401, 413, ...): sending it again cannot succeed.
+    def __init__(self, step: str, error: Exception, attempts: int, retryable: bool = True):
+        super().__init__(f"{step} call failed after {attempts} attempt(s): {type(error).__name__}: {error}")
+        self.step = step
+        self.error = error
+        self.attempts = attempts
+        self.retryable = retryable
+
+class RetryPolicy:
+    # Exponential backoff with full jitter for overload and transport errors; a Retry-After header from the API takes precedence
+    RETRYABLE_STATUSES = (408, 409, 429)
+    
+    def __init__(self, max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    def is_retryable(self, error: Exception) -> bool:
+        status = getattr(error, 'status_code', None)
+        if status is not None:
+            return status in self.RETRYABLE_STATUSES or status >= 500
+        return isinstance(error, (anthropic.APIConnectionError, ConnectionError, TimeoutError))
+    
+    @staticmethod
+    def retry_after(error: Exception) -> Optional[float]:
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        try:
+            if headers.get('retry-after-ms'):
+                return float(headers['retry-after-ms']) / 1000
+            value = headers.get('retry-after')
+            if not value:
+                return None
+            try:
+                return float(value)
+            except ValueError:
+                return (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    
+    def delay(self, attempt: int, error: Exception) -> float:
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            return max(0.0, retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+class CircuitBreaker:
+    # Shared by all worker threads. After failure_threshold consecutive overload errors the circuit opens and every call waits out
+    # the cooldown, pausing the run instead of hammering the API; one probe call then closes it, or reopens it for twice as long.
+    # A Retry-After from the API holds the circuit open for at least that long.
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0, max_cooldown: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = 'closed'  # closed, open, half_open
+        self.opened = 0
+        self._failures = 0
+        self._cooldown = cooldown
+        self._open_until = 0.0
+        self._condition = threading.Condition()
+    
+    def before_call(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self.state == 'closed':
+                    return
+                if self.state == 'open' and now >= self._open_until:
+                    # This caller is the probe; the others wait for its outcome
+                    self.state = 'half_open'
+                    return
+                self._condition.wait(timeout=self._open_until - now if self.state == 'open' else 1.0)
+    
+    def record_success(self):
+        # Any answer from the API, error responses included, shows it is not overloaded
+        with self._condition:
+            self._failures = 0
+            self._cooldown = self.base_cooldown
+            if self.state != 'closed':
+                logger.info("Circuit breaker closed")
+                self.state = 'closed'
+                self._condition.notify_all()
+    
+    def record_failure(self, retry_after: Optional[float] = None):
+        with self._condition:
+            self._failures += 1
+            if self.state == 'half_open':
+                self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+                pause = self._cooldown
+            elif self.state == 'closed' and self._failures >= self.failure_threshold:
+                pause = self._cooldown
+            else:
+                # Calls already in flight when the circuit opened do not extend the pause
+                pause = 0.0
+            if retry_after:
+                pause = max(pause, min(retry_after, self.max_cooldown))
+            if not pause:
+                return
+            if self.state != 'open':
+                self.opened += 1
+                logger.warning(f"Circuit breaker open for {pause:.1f}s after {self._failures} consecutive overload errors")
+            self.state = 'open'
+            self._open_until = max(self._open_until, time.monotonic() + pause)
+            self._condition.notify_all()
+
 class AIAnalysisPipeline:
-    def __init__(self, api_key: str = None):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    MODES = ('staged', 'fused')
+    IMPACT_LEVELS = ('Low', 'Medium', 'High', 'Critical')
+    IMPACT_DIMENSIONS = ('severity', 'time_sensitivity', 'operational_effort', 'customer_impact', 'enforcement_risk')
+    FUSED_MAX_TOKENS = 1500
+    # Long-document mode: items whose fetched full text is longer than one chunk are mapped chunk by chunk
+    CHUNK_TOKENS = 3000
+    LONG_DOCUMENT_CHARS = CHUNK_TOKENS * CHARS_PER_TOKEN
+    MAX_CHUNKS = 32
+    
+    def __init__(self, api_key: str = None, client=None, rate_limiter: Optional[RateLimiter] = None, mode: str = 'staged',
+                 cache: Optional[LLMResponseCache] = None, prefilter: Optional[RelevanceFilter] = None, usage: Optional[LLMUsageTracker] = None,
+                 retry_policy: Optional[RetryPolicy] = None, circuit_breaker: Optional[CircuitBreaker] = None, chunk_concurrency: int = 4):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown analysis mode: {mode}")
+        # Retries happen in _create, where they are counted and share the circuit breaker, not inside the SDK
+        self.client = client or anthropic.Anthropic(api_key=api_key, max_retries=0)
         self.model = 'claude-3-5-sonnet-20241022'
+        self.rate_limiter = rate_limiter
+        self.mode = mode
+        self.cache = cache
+        self.prefilter = prefilter
+        self.usage = usage
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.chunk_concurrency = chunk_concurrency
+    
+    def _create(self, step: str, prompt: str, max_tokens: int):
+        # Returns (response, latency, retries); raises LLMCallFailed once the error is not retryable or retries run out
+        attempt = 0
+        while True:
+            self.circuit_breaker.before_call()
+            if self.rate_limiter:
+                # Rough prompt estimate (~4 chars/token) plus the completion ceiling
+                self.rate_limiter.acquire(len(prompt) // 4 + max_tokens)
+            # Timed after the breaker and rate limiter, so latency is the API call alone
+            started = time.monotonic()
+            try:
+                response = self.client.messages.create(model=self.model, max_tokens=max_tokens, messages=[{'role': 'user', 'content': prompt}])
+            except Exception as e:
+                if not self.retry_policy.is_retryable(e):
+                    self.circuit_breaker.record_success()
+                    # Only a status the API returned proves the request itself is bad; anything else is left to the attempt cap
+                    raise LLMCallFailed(step, e, attempt + 1, retryable=getattr(e, 'status_code', None) is None) from e
+                retry_after = self.retry_policy.retry_after(e)
+                self.circuit_breaker.record_failure(retry_after)
+                if attempt >= self.retry_policy.max_retries or (retry_after or 0) > self.retry_policy.max_delay:
+                    raise LLMCallFailed(step, e, attempt + 1) from e
+                delay = self.retry_policy.delay(attempt, e)
+                logger.warning(f"{step} call failed ({type(e).__name__}: {e}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.circuit_breaker.record_success()
+            return response, time.monotonic() - started, attempt
+    
+    def record_usage(self, step: str, item_dict: Optional[Dict], response=None, latency: float = 0.0, prompt: str = '',
+                     max_tokens: Optional[int] = None, cached: bool = False, parse_failed: bool = False, retries: int = 0):
+        if not self.usage:
+            return
+        usage = getattr(response, 'usage', None)
+        self.usage.record(step, self.model, item_dict, input_tokens=getattr(usage, 'input_tokens', 0) or 0,
+                          output_tokens=getattr(usage, 'output_tokens', 0) or 0, latency=latency, prompt_chars=len(prompt),
+                          max_tokens=max_tokens, cached=cached, parse_failed=parse_failed, retries=retries)
+    
+    @staticmethod
+    def _parse_json(text: str) -> Dict:
+        json_start = text.find('{')
+        json_end = text.rfind('}') + 1
+        return json.loads(text[json_start:json_end])
+    
+    def _call_json(self, step: str, prompt: str, max_tokens: int, item_dict: Optional[Dict] = None) -> Dict:
+        if self.cache:
+            cached = self.cache.get(self.model, step, prompt)
+            if cached is not None:
+                self.record_usage(step, item_dict, prompt=prompt, max_tokens=max_tokens, cached=True)
+                return self._parse_json(cached)
+        response, latency, retries = self._create(step, prompt, max_tokens=max_tokens)
+        text = response.content[0].text
+        try:
+            result = self._parse_json(text)
+        except ValueError:
+            self.record_usage(step, item_dict, response, latency, prompt, max_tokens, parse_failed=True, retries=retries)
+            raise
+        self.record_usage(step, item_dict, response, latency, prompt, max_tokens, retries=retries)
+        # Only responses that parse are cached, so a malformed reply is retried next run
+        if self.cache:
+            self.cache.put(self.model, step, prompt, text)
+        return result
     
     def analyze_item(self, item_dict: Dict) -> Dict:
-        logger.info(f"Analyzing: {item_dict['title'][:50]}")
-        
-        relevance = self.check_relevance(item_dict)
+        # item_dict may carry 'full_text'; a long one is reduced to document facts before the analysis steps run, a short one is used whole
+        logger.info(f"Analyzing: {(item_dict.get('title') or '')[:50]}")
+        if self.mode == 'fused':
+            # The fused call also scores and summarizes, so only a confident "not relevant" can stand in for it
+            relevance = self.prefilter.decide(item_dict) if self.prefilter else None
+            if relevance and not relevance['relevant']:
+                return {'relevant': False, 'relevance_reason': relevance['reason']}
+            item_dict = self.with_document_facts(item_dict)
+            fused = self.analyze_item_fused(item_dict)
+            if fused is not None:
+                return fused
+            logger.warning(f"Fused analysis failed validation, using staged path: {(item_dict.get('title') or '')[:50]}")
+        return self.analyze_item_staged(item_dict)
+    
+    def analyze_item_staged(self, item_dict: Dict) -> Dict:
+        # The pre-filter runs before the document is mapped, so items it rejects cost no chunk calls either
+        relevance = self.prefilter.decide(item_dict) if self.prefilter else None
+        if relevance and not relevance['relevant']:
+            return {'relevant': False, 'relevance_reason': relevance['reason']}
+        item_dict = self.with_document_facts(item_dict)
+        relevance = relevance or self.check_relevance(item_dict, use_prefilter=False)
         if not relevance['relevant']:
             return {'relevant': False, 'relevance_reason': relevance['reason']}
         
         impact = self.score_impact(item_dict, relevance['business_area'])
         summary = self.generate_executive_summary(item_dict, relevance, impact)
         tasks = self.generate_tasks(item_dict, relevance, impact)
+        return self._build_analysis(relevance, impact, summary, tasks)
+    
+    def with_document_facts(self, item_dict: Dict) -> Dict:
+        # A document that fits in one chunk goes into the prompts as it is, so an amended one changes them (and their cache keys) too
+        text = item_dict.get('full_text')
+        if 'document_facts' in item_dict or not text or not text.strip():
+            return item_dict
+        if len(text) <= self.LONG_DOCUMENT_CHARS:
+            return {**item_dict, 'document_facts': text.strip()}
+        return {**item_dict, 'document_facts': format_facts(self.extract_document_facts(item_dict, text))}
+    
+    def extract_document_facts(self, item_dict: Dict, text: str) -> Dict:
+        # Map: facts per token-bounded chunk, in parallel; reduce: merged in document order (merge_facts)
+        chunks = split_chunks(text, self.CHUNK_TOKENS)
+        if len(chunks) > self.MAX_CHUNKS:
+            # Dates, scope and the rule text sit in the preamble and at the end; the middle of a long rule is mostly discussion
+            logger.info(f"Document has {len(chunks)} chunks, mapping the first and last {self.MAX_CHUNKS // 2}: {(item_dict.get('title') or '')[:50]}")
+            chunks = chunks[:self.MAX_CHUNKS // 2] + chunks[-(self.MAX_CHUNKS - self.MAX_CHUNKS // 2):]
+        if len(chunks) == 1:
+            return merge_facts([self.extract_chunk_facts(item_dict, chunks[0])])
+        with ThreadPoolExecutor(max_workers=min(self.chunk_concurrency, len(chunks))) as executor:
+            return merge_facts(list(executor.map(lambda chunk: self.extract_chunk_facts(item_dict, chunk), chunks)))
+    
+    def extract_chunk_facts(self, item_dict: Dict, chunk: str) -> Dict:
+        # Only the title and the chunk go into the prompt, so the response cache is keyed by the chunk's text: an amended
+        # document re-runs the chunks that changed
+        prompt = f"""Extract the facts a wealth management firm needs from this section of a regulatory document.
+Document: {item_dict.get('title') or ''}
+Section:
+{chunk}
+Return JSON: {{"deadlines": ["date: what is due"], "registrant_types": ["who is affected"], "obligations": ["what firms must do"]}}
+Use empty lists for anything the section does not state."""
+        try:
+            return self._call_json('chunk_facts', prompt, max_tokens=600, item_dict=item_dict)
+        except LLMCallFailed:
+            raise
+        except Exception:
+            return {}
+    
+    @staticmethod
+    def _facts_block(item_dict: Dict) -> str:
+        # Empty without document facts, so prompts (and their cache keys) for other items are unchanged
+        facts = item_dict.get('document_facts')
+        return f"\nFrom the full document:\n{facts}" if facts else ''
+    
+    def build_fused_prompt(self, item_dict: Dict) -> str:
+        return f"""Analyze this regulatory item for a wealth management firm (RIA, Broker-Dealer, Retirement).
+Title: {item_dict.get('title') or ''}
+Summary: {(item_dict.get('summary_raw') or '')[:500]}{self._facts_block(item_dict)}
+1. Relevance: is it relevant to wealth management? Pick business_area from RIA/Broker-Dealer/Retirement/AML/Other.
+2. Impact: score 1-5 for severity, time_sensitivity, operational_effort, customer_impact, enforcement_risk; overall is Low/Medium/High/Critical.
+3. Summary: 5 bullets - What happened, Who affected, What changes, Timing, Evidence needed.
+4. Tasks: 3-5 actionable tasks.
+If not relevant, return only relevant, business_area and reason.
+Return JSON: {{"relevant": bool, "business_area": "RIA/Broker-Dealer/Retirement/AML/Other", "reason": "short reason", "impact": {{"severity": 1-5, "time_sensitivity": 1-5, "operational_effort": 1-5, "customer_impact": 1-5, "enforcement_risk": 1-5, "overall": "Low/Medium/High/Critical"}}, "summary": ["bullet1", "bullet2", "bullet3", "bullet4", "bullet5"], "tasks": [{{"task": "action", "owner_role": "Compliance/Legal/Ops/Tech", "due_window": "Now/30/60/90", "evidence_artifact": "policy/training/comms", "dependency": "none"}}]}}"""
+    
+    def analyze_item_fused(self, item_dict: Dict) -> Optional[Dict]:
+        prompt = self.build_fused_prompt(item_dict)
+        try:
+            result = self._call_json('fused', prompt, max_tokens=self.FUSED_MAX_TOKENS, item_dict=item_dict)
+        except ValueError as e:
+            logger.debug(f"Fused response is not valid JSON: {e}")
+            return None
+        except LLMCallFailed:
+            raise
+        except Exception as e:
+            # Nothing was learned about the item; it is retried later instead of being stored as "not relevant"
+            raise LLMCallFailed('fused', e, 1) from e
+        return self.parse_fused_result(result)
+    
+    def parse_fused_result(self, result: Dict) -> Optional[Dict]:
+        try:
+            self._validate_fused(result)
+        except ValueError as e:
+            logger.debug(f"Fused response rejected: {e}")
+            return None
         
+        if not result['relevant']:
+            return {'relevant': False, 'relevance_reason': result.get('reason', '')}
+        relevance = {'relevant': True, 'business_area': result['business_area'], 'reason': result.get('reason', '')}
+        impact = {dim: min(5, max(1, int(result['impact'][dim]))) for dim in self.IMPACT_DIMENSIONS}
+        impact['overall'] = result['impact']['overall']
+        summary = {'summary': '\n'.join(result['summary'][:5])}
+        return self._build_analysis(relevance, impact, summary, {'tasks': result['tasks']})
+    
+    def _validate_fused(self, result: Dict):
+        if not isinstance(result, dict) or not isinstance(result.get('relevant'), bool):
+            raise ValueError("'relevant' must be a boolean")
+        if not result['relevant']:
+            return
+        if not isinstance(result.get('business_area'), str):
+            raise ValueError("'business_area' must be a string")
+        impact = result.get('impact')
+        if not isinstance(impact, dict):
+            raise ValueError("'impact' must be an object")
+        for dim in self.IMPACT_DIMENSIONS:
+            if isinstance(impact.get(dim), bool) or not isinstance(impact.get(dim), (int, float)):
+                raise ValueError(f"'impact.{dim}' must be a number")
+        if impact.get('overall') not in self.IMPACT_LEVELS:
+            raise ValueError("'impact.overall' must be one of Low/Medium/High/Critical")
+        summary = result.get('summary')
+        if not isinstance(summary, list) or not summary or not all(isinstance(b, str) for b in summary):
+            raise ValueError("'summary' must be a non-empty list of strings")
+        tasks = result.get('tasks')
+        if not isinstance(tasks, list) or not tasks:
+            raise ValueError("'tasks' must be a non-empty list")
+        for task in tasks:
+            if not isinstance(task, dict) or not isinstance(task.get('task'), str) or not isinstance(task.get('owner_role'), str):
+                raise ValueError("each task needs 'task' and 'owner_role' strings")
+    
+    @staticmethod
+    def _build_analysis(relevance: Dict, impact: Dict, summary: Dict, tasks: Dict) -> Dict:
         return {
             'relevant': True,
             'relevance_reason': relevance['reason'],
@@ -35,31 +403,31 @@ class AIAnalysisPipeline:
             'tasks': tasks['tasks'],
         }
     
-    def check_relevance(self, item_dict: Dict) -> Dict:
+    def check_relevance(self, item_dict: Dict, use_prefilter: bool = True) -> Dict:
+        if self.prefilter and use_prefilter:
+            decision = self.prefilter.decide(item_dict)
+            if decision:
+                return decision
         prompt = f"""Is this regulatory item relevant to wealth management (RIA, Broker-Dealer, Retirement)?
-Title: {item_dict['title']}
-Summary: {item_dict['summary_raw'][:500]}
+Title: {item_dict.get('title') or ''}
+Summary: {(item_dict.get('summary_raw') or '')[:500]}{self._facts_block(item_dict)}
 Return JSON: {{"relevant": bool, "business_area": "RIA/Broker-Dealer/Retirement/AML/Other", "reason": "short reason"}}"""
         try:
-            response = self.client.messages.create(model=self.model, max_tokens=300, messages=[{'role': 'user', 'content': prompt}])
-            text = response.content[0].text
-            json_start = text.find('{')
-            json_end = text.rfind('}') + 1
-            result = json.loads(text[json_start:json_end])
+            result = self._call_json('relevance', prompt, max_tokens=300, item_dict=item_dict)
             return {'relevant': result.get('relevant', False), 'business_area': result.get('business_area'), 'reason': result.get('reason', '')}
-        except:
-            return {'relevant': False, 'business_area': None, 'reason': 'Analysis error'}
+        except LLMCallFailed:
+            # A failed call says nothing about the item: the caller leaves it unanalyzed instead of storing a default
+            raise
+        except Exception as e:
+            # Nor does a reply that is not the JSON asked for
+            raise LLMCallFailed('relevance', e, 1) from e
     
     def score_impact(self, item_dict: Dict, business_area: str) -> Dict:
-        prompt = f"""Score impact 1-5 for: {item_dict['title'][:100]}
+        prompt = f"""Score impact 1-5 for: {(item_dict.get('title') or '')[:100]}{self._facts_block(item_dict)}
 Dimensions: severity, time_sensitivity, operational_effort, customer_impact, enforcement_risk
 Return JSON: {{"severity": 1-5, "time_sensitivity": 1-5, "operational_effort": 1-5, "customer_impact": 1-5, "enforcement_risk": 1-5, "overall": "Low/Medium/High/Critical"}}"""
         try:
-            response = self.client.messages.create(model=self.model, max_tokens=300, messages=[{'role': 'user', 'content': prompt}])
-            text = response.content[0].text
-            json_start = text.find('{')
-            json_end = text.rfind('}') + 1
-            result = json.loads(text[json_start:json_end])
+            result = self._call_json('impact', prompt, max_tokens=300, item_dict=item_dict)
             return {
                 'severity': min(5, max(1, result.get('severity', 3))),
                 'time_sensitivity': min(5, max(1, result.get('time_sensitivity', 3))),
@@ -68,32 +436,30 @@ Return JSON: {{"severity": 1-5, "time_sensitivity": 1-5, "operational_effort": 1
                 'enforcement_risk': min(5, max(1, result.get('enforcement_risk', 3))),
                 'overall': result.get('overall', 'Medium'),
             }
-        except:
+        except LLMCallFailed:
+            raise
+        except Exception:
             return {'severity': 3, 'time_sensitivity': 3, 'operational_effort': 3, 'customer_impact': 2, 'enforcement_risk': 3, 'overall': 'Medium'}
     
     def generate_executive_summary(self, item_dict: Dict, relevance: Dict, impact: Dict) -> Dict:
-        prompt = f"""Generate 5 bullets for: {item_dict['title'][:100]}
+        prompt = f"""Generate 5 bullets for: {(item_dict.get('title') or '')[:100]}{self._facts_block(item_dict)}
 Format: What happened, Who affected, What changes, Timing, Evidence needed.
 Return JSON: {{"summary": ["bullet1", "bullet2", "bullet3", "bullet4", "bullet5"]}}"""
         try:
-            response = self.client.messages.create(model=self.model, max_tokens=400, messages=[{'role': 'user', 'content': prompt}])
-            text = response.content[0].text
-            json_start = text.find('{')
-            json_end = text.rfind('}') + 1
-            result = json.loads(text[json_start:json_end])
+            result = self._call_json('summary', prompt, max_tokens=400, item_dict=item_dict)
             return {'summary': '\n'.join(result.get('summary', [])[:5])}
-        except:
+        except LLMCallFailed:
+            raise
+        except Exception:
             return {'summary': 'See source for details'}
     
     def generate_tasks(self, item_dict: Dict, relevance: Dict, impact: Dict) -> Dict:
-        prompt = f"""Generate 3-5 actionable tasks for: {item_dict['title'][:100]}
+        prompt = f"""Generate 3-5 actionable tasks for: {(item_dict.get('title') or '')[:100]}{self._facts_block(item_dict)}
 Return JSON: {{"tasks": [{{"task": "action", "owner_role": "Compliance/Legal/Ops/Tech", "due_window": "Now/30/60/90", "evidence_artifact": "policy/training/comms", "dependency": "none"}}]}}"""
         try:
-            response = self.client.messages.create(model=self.model, max_tokens=500, messages=[{'role': 'user', 'content': prompt}])
-            text = response.content[0].text
-            json_start = text.find('{')
-            json_end = text.rfind('}') + 1
-            result = json.loads(text[json_start:json_end])
+            result = self._call_json('tasks', prompt, max_tokens=500, item_dict=item_dict)
             return {'tasks': result.get('tasks', [])}
-        except:
-            return {'tasks': [{'task': f'Review {item_dict["title"][:50]}', 'owner_role': 'Compliance', 'due_window': '30', 'evidence_artifact': 'memo', 'dependency': 'none'}]}
+        except LLMCallFailed:
+            raise
+        except Exception:
+            return {'tasks': [{'task': f"Review {(item_dict.get('title') or '')[:50]}", 'owner_role': 'Compliance', 'due_window': '30', 'evidence_artifact': 'memo', 'dependency': 'none'}]}
@@ -0,0 +1,130 @@
+from utils.data_store import DataStore
+from utils.ai_analysis import AIAnalysisPipeline, LLMCallFailed
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+import itertools
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LocalBatchEndpoint:
+    # Stand-in for client.messages.batches: runs each request through a plain messages client
+    def __init__(self, messages_client):
+        self.messages_client = messages_client
+        self._batches = {}
+        self._ids = itertools.count(1)
+
+    def create(self, requests: List[Dict]):
+        batch_id = f"local_batch_{next(self._ids)}"
+        self._batches[batch_id] = {'requests': requests, 'results': None}
+        return SimpleNamespace(id=batch_id, processing_status='in_progress')
+
+    def retrieve(self, batch_id: str):
+        batch = self._batches[batch_id]
+        if batch['results'] is None:
+            batch['results'] = [self._run(request) for request in batch['requests']]
+        return SimpleNamespace(id=batch_id, processing_status='ended')
+
+    def results(self, batch_id: str):
+        return iter(self._batches[batch_id]['results'] or [])
+
+    def _run(self, request: Dict):
+        try:
+            message = self.messages_client.create(**request['params'])
+            result = SimpleNamespace(type='succeeded', message=message)
+        except Exception as e:
+            result = SimpleNamespace(type='errored', error=str(e))
+        return SimpleNamespace(custom_id=request['custom_id'], result=result)
+
+class BatchBackfill:
+    def __init__(self, data_store: DataStore, ai_pipeline: AIAnalysisPipeline, batch_client=None, batch_size: int = 1000, poll_interval: float = 60.0):
+        self.data_store = data_store
+        self.ai_pipeline = ai_pipeline
+        self.batch_client = batch_client or ai_pipeline.client.messages.batches
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+    def run(self, name: str, only_unanalyzed: bool = False, source: Optional[str] = None, max_polls: Optional[int] = None) -> Dict:
+        # Batches recorded under `name` are the checkpoint: unfinished ones are polled again, and their items are not resubmitted
+        batches = self.data_store.get_backfill_batches(name)
+        claimed = set()
+        for batch in batches:
+            claimed.update(json.loads(batch.item_ids))
+        pending = [batch.batch_id for batch in batches if batch.status != 'applied']
+        if pending:
+            logger.info(f"Resuming backfill '{name}' with {len(pending)} unfinished batches")
+
+        item_ids = [item_id for item_id in self.data_store.get_backfill_item_ids(only_unanalyzed=only_unanalyzed, source=source) if item_id not in claimed]
+        for start in range(0, len(item_ids), self.batch_size):
+            batch_id = self._submit(name, item_ids[start:start + self.batch_size])
+            if batch_id:
+                pending.append(batch_id)
+
+        applied = 0
+        polls = 0
+        while pending:
+            for batch_id in list(pending):
+                if self.batch_client.retrieve(batch_id).processing_status == 'ended':
+                    applied += self._apply(batch_id)
+                    pending.remove(batch_id)
+            polls += 1
+            if not pending or (max_polls is not None and polls >= max_polls):
+                break
+            time.sleep(self.poll_interval)
+
+        logger.info(f"Backfill '{name}': applied {applied} analyses, {len(pending)} batches still processing")
+        return {'name': name, 'submitted_items': len(item_ids), 'applied': applied, 'pending_batches': pending}
+
+    def _submit(self, name: str, item_ids: List[int]) -> Optional[str]:
+        requests = []
+        submitted_ids = []
+        for item in self.data_store.get_items_by_ids(item_ids):
+            try:
+                prompt = self.ai_pipeline.build_fused_prompt(item.to_dict())
+            except Exception as e:
+                # One bad row must not abort the backfill; it stays unclaimed, so the next run tries it again
+                logger.error(f"Error preparing item {item.id} for batch: {e}")
+                continue
+            requests.append({'custom_id': f"item-{item.id}", 'params': {'model': self.ai_pipeline.model, 'max_tokens': self.ai_pipeline.FUSED_MAX_TOKENS, 'messages': [{'role': 'user', 'content': prompt}]}})
+            submitted_ids.append(item.id)
+        if not requests:
+            return None
+        batch = self.batch_client.create(requests=requests)
+        self.data_store.add_backfill_batch(name, batch.id, submitted_ids)
+        logger.info(f"Submitted batch {batch.id} with {len(requests)} items")
+        return batch.id
+
+    def _apply(self, batch_id: str) -> int:
+        analyses = {}
+        fallback_ids = []
+        for entry in self.batch_client.results(batch_id):
+            item_id = int(entry.custom_id.split('-', 1)[1])
+            analysis = None
+            if entry.result.type == 'succeeded':
+                parse_failed = False
+                try:
+                    analysis = self.ai_pipeline.parse_fused_result(self.ai_pipeline._parse_json(entry.result.message.content[0].text))
+                except ValueError:
+                    analysis = None
+                    parse_failed = True
+                self.ai_pipeline.record_usage('batch', {'id': item_id}, entry.result.message, max_tokens=self.ai_pipeline.FUSED_MAX_TOKENS, parse_failed=parse_failed)
+            if analysis is None:
+                fallback_ids.append(item_id)
+            else:
+                analyses[item_id] = analysis
+
+        # Rejected or errored entries go through the regular per-item path
+        for item in self.data_store.get_items_by_ids(fallback_ids):
+            try:
+                analyses[item.id] = self.ai_pipeline.analyze_item_staged(item.to_dict())
+            except LLMCallFailed as e:
+                logger.warning(f"Item {item.id} deferred: {e}")
+                self.data_store.mark_analysis_failed(item.id, str(e), permanent=not e.retryable)
+            except Exception as e:
+                logger.error(f"Error analyzing item {item.id}: {e}")
+
+        self.data_store.update_analyses(analyses)
+        self.data_store.mark_backfill_batch_applied(batch_id)
+        return len(analyses)
@@ -1,24 +1,82 @@
 ﻿import feedparser
 import requests
-from datetime import datetime
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Tuple
+import json
 import logging
+import os
+import threading
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class ConnectorState:
+    # Small JSON key/value store for per-feed HTTP validators and polling watermarks
+    def __init__(self, path: str = './connector_state.json'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._data = json.load(f)
+            except Exception as e:
+                logger.error(f"Could not read connector state {path}: {e}")
+    
+    def get(self, key: str, default=None):
+        with self._lock:
+            return self._data.get(key, default)
+    
+    def set(self, key: str, value):
+        self.update({key: value})
+    
+    def update(self, values: Dict):
+        # Connectors hand back validators and watermarks instead of saving them; the caller saves them here once the items are stored
+        with self._lock:
+            self._data.update(values)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._data, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+def fetch_feed(session: requests.Session, url: str, state: Optional[ConnectorState], timeout: int = 15):
+    # Conditional GET through the pooled session; returns (feed, validators to save), with feed None when the server answers 304
+    validators = state.get(f"feed:{url}", {}) if state else {}
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    resp = session.get(url, headers=headers, timeout=timeout)
+    if resp.status_code == 304:
+        return None, {}
+    resp.raise_for_status()
+    feed = feedparser.parse(resp.content, response_headers=dict(resp.headers))
+    if not (resp.headers.get('ETag') or resp.headers.get('Last-Modified')):
+        return feed, {}
+    return feed, {f"feed:{url}": {'etag': resp.headers.get('ETag'), 'last_modified': resp.headers.get('Last-Modified')}}
+
 class SecRSSConnector:
     BASE_URL = "https://www.sec.gov/cgi-bin/browse-edgar"
     PRESS_RELEASE_FEED = "https://www.sec.gov/rss/litigation/press-release.xml"
     
-    def __init__(self):
+    def __init__(self, state: Optional[ConnectorState] = None):
         self.session = requests.Session()
         self.session.headers.update({'User-Agent': 'RiskIntelligence/1.0'})
+        self.state = state
+        self.last_status = None
     
-    def fetch_press_releases(self) -> List[Dict]:
+    def fetch_press_releases(self) -> Tuple[List[Dict], Dict]:
+        # Returns the items and the feed validators; saved only once the items are stored, so a lost run is fetched again
         items = []
         try:
-            feed = feedparser.parse(self.PRESS_RELEASE_FEED)
+            feed, validators = fetch_feed(self.session, self.PRESS_RELEASE_FEED, self.state)
+            if feed is None:
+                self.last_status = 'unchanged'
+                logger.info("SEC feed unchanged since last poll")
+                return items, {}
+            self.last_status = 'ok'
             logger.info(f"Fetched SEC feed with {len(feed.entries)} entries")
             for entry in feed.entries:
                 item = {
@@ -33,8 +91,10 @@ class SecRSSConnector:
                 }
                 items.append(item)
         except Exception as e:
+            self.last_status = 'error'
             logger.error(f"Error: {e}")
-        return items
+            return items, {}
+        return items, validators
     
     def _extract_tags(self, text: str) -> List[str]:
         keywords = ['investment adviser', 'broker-dealer', 'AML', 'custody']
@@ -43,13 +103,21 @@ class SecRSSConnector:
 class FinraConnector:
     RSS_FEED = "https://www.finra.org/feeds/news-and-events"
     
-    def __init__(self):
+    def __init__(self, state: Optional[ConnectorState] = None):
         self.session = requests.Session()
+        self.state = state
+        self.last_status = None
     
-    def fetch_notices(self) -> List[Dict]:
+    def fetch_notices(self) -> Tuple[List[Dict], Dict]:
+        # Returns the items and the feed validators, like SecRSSConnector.fetch_press_releases
         items = []
         try:
-            feed = feedparser.parse(self.RSS_FEED)
+            feed, validators = fetch_feed(self.session, self.RSS_FEED, self.state)
+            if feed is None:
+                self.last_status = 'unchanged'
+                logger.info("FINRA feed unchanged since last poll")
+                return items, {}
+            self.last_status = 'ok'
             logger.info(f"Fetched FINRA feed")
             for entry in feed.entries:
                 item = {
@@ -64,38 +132,108 @@ class FinraConnector:
                 }
                 items.append(item)
         except Exception as e:
+            self.last_status = 'error'
             logger.error(f"Error: {e}")
-        return items
+            return items, {}
+        return items, validators
 
 class FedRegConnector:
     API_BASE = "https://www.federalregister.gov/api/v1"
     AGENCIES = ['SEC', 'DOL']
+    AGENCY_SLUGS = {'SEC': 'securities-and-exchange-commission', 'DOL': 'labor-department'}
     KEYWORDS = ['investment adviser', 'broker-dealer']
+    FIELDS = ['title', 'abstract', 'publication_date', 'html_url', 'agencies']
+    REQUEST_TIMEOUT = 10
+    PER_PAGE = 1000
+    # How far back the first poll of a new agency/keyword pair reaches
+    INITIAL_LOOKBACK_DAYS = 30
     
-    def __init__(self):
+    def __init__(self, state: Optional[ConnectorState] = None):
         self.session = requests.Session()
+        self.state = state
+        self.last_requests = 0
+        self._lock = threading.Lock()
     
-    def fetch_regulations(self) -> List[Dict]:
-        items = []
+    def fetch_regulations(self, max_workers: int = 1) -> Tuple[List[Dict], Dict[str, str]]:
+        # Returns the items and the watermarks they advance to; the caller saves those (ConnectorState.update) once the
+        # items are stored, so a run whose items never reach the database polls the same dates again
+        self.last_requests = 0
+        queries = self.plan_queries()
+        if max_workers <= 1 or len(queries) == 1:
+            results = [self._fetch_query(*query) for query in queries]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(lambda query: self._fetch_query(*query), queries))
+        logger.info(f"Fetched FedReg documents with {len(queries)} queries, {self.last_requests} requests")
+        watermarks = {}
+        for _, query_watermarks in results:
+            watermarks.update(query_watermarks)
+        return [item for query_items, _ in results for item in query_items], watermarks
+    
+    def _watermark_key(self, agency: str, keyword: str) -> str:
+        return f"fedreg:{agency}:{keyword}"
+    
+    def plan_queries(self) -> List[Tuple[str, List[str], List[str]]]:
+        # (since, agencies, keywords) per query. Pairs polled up to the same date share one query: agencies are OR-ed by
+        # conditions[agencies][] and keywords by the search syntax, so the steady state is a single query for every pair.
+        default_since = (datetime.utcnow() - timedelta(days=self.INITIAL_LOOKBACK_DAYS)).date().isoformat()
+        by_since = {}
         for agency in self.AGENCIES:
             for keyword in self.KEYWORDS:
-                try:
-                    params = {'agencies': agency, 'search': keyword, 'per_page': 5, 'format': 'json'}
-                    resp = self.session.get(f"{self.API_BASE}/documents", params=params, timeout=10)
-                    resp.raise_for_status()
-                    data = resp.json()
-                    for doc in data.get('results', []):
-                        item = {
-                            'source': 'FedReg',
-                            'type': 'rule',
-                            'title': doc.get('title', 'N/A'),
-                            'summary_raw': doc.get('abstract', ''),
-                            'published_at': doc.get('publication_date', datetime.now().isoformat()),
-                            'url': doc.get('html_url', ''),
-                            'tags': [keyword],
-                            'entities': [agency],
-                        }
-                        items.append(item)
-                except Exception as e:
-                    logger.error(f"Error: {e}")
-        return items
+                since = (self.state.get(self._watermark_key(agency, keyword)) if self.state else None) or default_since
+                by_since.setdefault(since, {}).setdefault(agency, []).append(keyword)
+        queries = []
+        for since, keywords_by_agency in sorted(by_since.items()):
+            # Agencies with the same keyword set form a full agency x keyword product, which one query covers exactly
+            by_keywords = {}
+            for agency, keywords in keywords_by_agency.items():
+                by_keywords.setdefault(tuple(keywords), []).append(agency)
+            queries.extend((since, agencies, list(keywords)) for keywords, agencies in by_keywords.items())
+        return queries
+    
+    def _fetch_query(self, since: str, agencies: List[str], keywords: List[str]) -> Tuple[List[Dict], Dict[str, str]]:
+        # Documents published on or after `since`, oldest first, every page. The watermark moves to the newest date seen,
+        # even after a failed page: everything before that date was already covered, and the date itself is fetched again.
+        items = []
+        newest = None
+        params = {
+            'conditions[agencies][]': [self.AGENCY_SLUGS.get(agency, agency) for agency in agencies],
+            'conditions[term]': ' | '.join(f'"{keyword}"' for keyword in keywords),
+            'conditions[publication_date][gte]': since,
+            'fields[]': self.FIELDS,
+            'order': 'oldest',
+            'per_page': self.PER_PAGE,
+        }
+        url = f"{self.API_BASE}/documents.json"
+        try:
+            while url:
+                resp = self.session.get(url, params=params, timeout=self.REQUEST_TIMEOUT)
+                with self._lock:
+                    self.last_requests += 1
+                resp.raise_for_status()
+                data = resp.json()
+                for doc in data.get('results', []):
+                    items.append(self._to_item(doc, agencies, keywords))
+                    newest = max(newest or '', doc.get('publication_date') or '') or None
+                # next_page_url carries every condition already
+                url, params = data.get('next_page_url'), None
+        except Exception as e:
+            logger.error(f"Error: {e}")
+        if not newest:
+            return items, {}
+        return items, {self._watermark_key(agency, keyword): newest for agency in agencies for keyword in keywords}
+    
+    def _to_item(self, doc: Dict, agencies: List[str], keywords: List[str]) -> Dict:
+        text = f"{doc.get('title') or ''} {doc.get('abstract') or ''}".lower()
+        slugs = {agency.get('slug') for agency in doc.get('agencies') or [] if isinstance(agency, dict)}
+        return {
+            'source': 'FedReg',
+            'type': 'rule',
+            'title': doc.get('title', 'N/A'),
+            'summary_raw': doc.get('abstract') or '',
+            'published_at': doc.get('publication_date', datetime.now().isoformat()),
+            'url': doc.get('html_url', ''),
+            # Search matches stems, so a document need not contain a keyword verbatim
+            'tags': [keyword for keyword in keywords if keyword in text] or list(keywords),
+            'entities': [agency for agency in agencies if self.AGENCY_SLUGS.get(agency, agency) in slugs] or list(agencies),
+        }
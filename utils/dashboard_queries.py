@@ -0,0 +1,111 @@
+from utils.data_store import DataStore, RegulatoryItem, IMPACT_SCORE_COLUMNS
+from sqlalchemy import and_, or_
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class DashboardQueries:
+    # Read layer for streamlit_app.py: filters run in SQL, results are plain dicts cached per data version with a TTL
+    LIST_COLUMNS = DataStore.ROW_COLUMNS + IMPACT_SCORE_COLUMNS
+    # Pages that render the executive summary also read that column; nothing here loads summary_raw
+    DETAIL_COLUMNS = LIST_COLUMNS + ('executive_summary',)
+
+    def __init__(self, data_store: DataStore, ttl: float = 300.0):
+        self.data_store = data_store
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _cached(self, name: str, args: Tuple, loader):
+        # New items or newly committed analysis change the version, so stale entries are never served past a pipeline run
+        key = (name, args, self.data_store.get_data_version())
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit and hit[0] > now:
+                return hit[1]
+        value = loader()
+        with self._lock:
+            self._cache = {k: v for k, v in self._cache.items() if v[0] > now and k[2] == key[2]}
+            self._cache[key] = (now + self.ttl, value)
+        return value
+
+    @staticmethod
+    def _row(row) -> Dict:
+        return dict(row._mapping)
+
+    def counts(self) -> Dict:
+        return self._cached('counts', (), lambda: {'total': self.data_store.count_items(), 'relevant': self.data_store.count_items(relevant_only=True)})
+
+    def high_impact_alerts(self, limit: int = 3) -> Dict:
+        def load():
+            high = RegulatoryItem.impact_overall.in_(['High', 'Critical'])
+            rows = self.data_store.fetch_rows(self.data_store.select_rows(self.LIST_COLUMNS).where(high).order_by(RegulatoryItem.impact_rank.desc(), RegulatoryItem.id.desc()).limit(limit))
+            return {'count': self.data_store.count_rows(high), 'items': [self._row(row) for row in rows]}
+        return self._cached('high_impact_alerts', (limit,), load)
+
+    def impact_digest(self, limit: int = 10) -> List[Dict]:
+        return self._cached('impact_digest', (limit,), lambda: [self._row(row) for row in self.data_store.get_top_impact_rows(limit=limit, columns=self.DETAIL_COLUMNS)])
+
+    def task_backlog(self, page: int = 1, page_size: int = 50) -> Dict:
+        # Every task of every relevant item (not deduped), highest impact first; counts are GROUP BYs on the tasks table
+        def load():
+            tasks = self.data_store.get_task_backlog(dedupe=False, order_by_impact=True, offset=(max(page, 1) - 1) * page_size, limit=page_size)
+            return {
+                'total': self.data_store.count_tasks(dedupe=False),
+                'tasks': [{key: 'N/A' if value is None else value for key, value in task.items()} for task in tasks],
+                'by_owner': self._labelled(self.data_store.get_task_counts('owner_role', dedupe=False)),
+                'by_due_window': self._labelled(self.data_store.get_task_counts('due_window', dedupe=False)),
+            }
+        return self._cached('task_backlog', (page, page_size), load)
+
+    @staticmethod
+    def _labelled(counts: Dict) -> Dict:
+        labelled = {}
+        for value, count in counts.items():
+            key = 'N/A' if value is None else value
+            labelled[key] = labelled.get(key, 0) + count
+        return labelled
+
+    def analysis_details(self, sources: List[str], impacts: List[str], areas: List[str], page: int = 1, page_size: int = 20) -> Dict:
+        def load():
+            criteria = (RegulatoryItem.is_relevant == 1, RegulatoryItem.source.in_(sources), RegulatoryItem.impact_overall.in_(impacts), RegulatoryItem.business_area.in_(areas))
+            rows = self.data_store.fetch_rows(self.data_store.select_rows(self.DETAIL_COLUMNS).where(*criteria).order_by(
+                RegulatoryItem.published_at.desc()).offset((max(page, 1) - 1) * page_size).limit(page_size))
+            return {'total_relevant': self.counts()['relevant'], 'total': self.data_store.count_rows(*criteria), 'items': [self._row(row) for row in rows]}
+        return self._cached('analysis_details', (tuple(sources), tuple(impacts), tuple(areas), page, page_size), load)
+
+    def changelog(self, since: Optional[datetime] = None, limit: int = 10) -> Dict:
+        since = since or datetime.utcnow() - timedelta(hours=24)
+        def load():
+            new = RegulatoryItem.ingested_at > since
+            # Amended pages whose new text has been re-analyzed can escalate too
+            amended = and_(RegulatoryItem.amended_at > since, RegulatoryItem.analyzed_at >= RegulatoryItem.amended_at)
+            high = RegulatoryItem.impact_overall.in_(['High', 'Critical'])
+            newest = self.data_store.select_rows(self.LIST_COLUMNS).where(new).order_by(RegulatoryItem.published_at.desc()).limit(limit)
+            escalated = self.data_store.select_rows(self.LIST_COLUMNS).where(or_(new, amended), high).order_by(RegulatoryItem.impact_rank.desc()).limit(50)
+            return {
+                'new_count': self.data_store.count_rows(new),
+                'amended_count': self.data_store.count_rows(amended, ~new),
+                'escalated_count': self.data_store.count_rows(or_(new, amended), high),
+                'new_items': [self._row(row) for row in self.data_store.fetch_rows(newest)],
+                'escalated_items': [self._row(row) for row in self.data_store.fetch_rows(escalated)],
+                'total_items': self.counts()['total'],
+            }
+        # Round the window start so reruns within the same minute share a cache entry
+        return self._cached('changelog', (since.replace(second=0, microsecond=0), limit), load)
+
+    def llm_usage(self, days: int = 7, runs: int = 10) -> Dict:
+        # Token spend and latency per step and source over the window, plus totals of the most recent runs
+        since = (datetime.utcnow() - timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+        def load():
+            return {**self.data_store.get_llm_usage_summary(since=since), 'runs': self.data_store.get_llm_usage_runs(limit=runs)}
+        return self._cached('llm_usage', (since, runs), load)
@@ -1,14 +1,28 @@
-from sqlalchemy import create_engine, Column, String, DateTime, Text, Integer
+from sqlalchemy import create_engine, event, Column, String, DateTime, Text, Integer, Float, LargeBinary, Index, ForeignKey, insert, update, delete, bindparam, inspect, func, select, case, and_, or_, exists, literal
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
-from typing import List, Dict
+from sqlalchemy.orm import sessionmaker, scoped_session, defer
+from sqlalchemy.pool import StaticPool
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+from typing import List, Dict, Iterator, Optional, Tuple
+import pandas as pd
+import hashlib
 import json
+import threading
+import zlib
 import logging
 
 logger = logging.getLogger(__name__)
 Base = declarative_base()
 
+IMPACT_RANKS = {'Critical': 4, 'High': 3, 'Medium': 2, 'Low': 1}
+IMPACT_SCORE_COLUMNS = ('impact_severity', 'impact_time_sensitivity', 'impact_operational_effort', 'impact_customer', 'impact_enforcement_risk')
+
+def task_dedupe_key(task: Dict) -> str:
+    # The same task for the same owner is one backlog entry, whichever item it came from
+    return hashlib.sha256(f"{task.get('task', '')}-{task.get('owner_role', '')}".lower().encode('utf-8')).hexdigest()
+
 class RegulatoryItem(Base):
     __tablename__ = 'regulatory_items'
     
@@ -18,6 +32,7 @@ class RegulatoryItem(Base):
     published_at = Column(DateTime)
     title = Column(String(500))
     summary_raw = Column(Text)
+    # Not filled: fetched documents are stored compressed in item_documents (get_full_text) so item rows stay small
     full_text = Column(Text, nullable=True)
     url = Column(String(500), unique=True)
     tags = Column(Text)
@@ -34,9 +49,41 @@ class RegulatoryItem(Base):
     impact_customer = Column(Integer, nullable=True)
     impact_enforcement_risk = Column(Integer, nullable=True)
     impact_overall = Column(String(20), nullable=True)
+    impact_rank = Column(Integer, nullable=True)
+    impact_score = Column(Float, nullable=True)
     
     executive_summary = Column(Text, nullable=True)
     tasks = Column(Text, nullable=True)
+    analyzed_at = Column(DateTime, nullable=True)
+    # 'failed' when the last attempt could not reach the model; the item stays unanalyzed and is retried from retry_at.
+    # 'failed_permanent' after ANALYSIS_MAX_ATTEMPTS, or at once for a request the API rejects; such items leave the queue
+    analysis_status = Column(String(20), nullable=True)
+    analysis_error = Column(Text, nullable=True)
+    analysis_attempts = Column(Integer, nullable=True)
+    retry_at = Column(DateTime, nullable=True)
+    
+    # MinHash signature of title + summary and the earlier copy this item duplicates; see NearDuplicateDetector
+    minhash = Column(LargeBinary, nullable=True)
+    canonical_id = Column(Integer, ForeignKey('regulatory_items.id'), nullable=True)
+    
+    # Set when the linked document's text changes after the item was analyzed; the item is analyzed again and the old text
+    # goes to regulatory_item_versions
+    needs_reanalysis = Column(Integer, nullable=True)
+    amended_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Serves both get_unanalyzed_items (is_relevant IS NULL) and the dashboard's relevant-newest-first
+        # listings without a sort step
+        Index('ix_regulatory_items_relevant_published', is_relevant, published_at),
+        Index('ix_regulatory_items_impact_overall', impact_overall),
+        # Impact digest: top-N relevant items as one ORDER BY ... LIMIT walk of the index
+        Index('ix_regulatory_items_digest', is_relevant, impact_rank, impact_score),
+        Index('ix_regulatory_items_published_at', published_at),
+        Index('ix_regulatory_items_ingested_at', ingested_at),
+        Index('ix_regulatory_items_analyzed_at', analyzed_at),
+        Index('ix_regulatory_items_canonical_id', canonical_id),
+        Index('ix_regulatory_items_reanalysis_published', needs_reanalysis, published_at),
+    )
     
     def to_dict(self) -> Dict:
         return {
@@ -51,48 +98,593 @@ class RegulatoryItem(Base):
             'entities': json.loads(self.entities) if self.entities else [],
         }
 
+class ItemMinhashBand(Base):
+    # LSH index over RegulatoryItem.minhash: one row per item and band
+    __tablename__ = 'item_minhash_bands'
+    
+    id = Column(Integer, primary_key=True)
+    item_id = Column(Integer, ForeignKey('regulatory_items.id', ondelete='CASCADE'), nullable=False)
+    band = Column(Integer, nullable=False)
+    value = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        Index('ix_item_minhash_bands_lookup', band, value),
+        Index('ix_item_minhash_bands_item_id', item_id),
+    )
+
+class ItemDocument(Base):
+    # Full text of the document an item links to, written by FullTextFetcher
+    __tablename__ = 'item_documents'
+    
+    item_id = Column(Integer, ForeignKey('regulatory_items.id', ondelete='CASCADE'), primary_key=True)
+    status = Column(String(20))  # ok, unsupported, error
+    content = Column(LargeBinary, nullable=True)  # zlib-compressed UTF-8 text
+    content_hash = Column(String(64), nullable=True)  # sha256 of the extracted text
+    chars = Column(Integer, nullable=True)
+    content_type = Column(String(100), nullable=True)
+    http_status = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    fetched_at = Column(DateTime, nullable=True)
+    changed_at = Column(DateTime, nullable=True)
+    # HTTP validators from the last 200, sent back on re-checks so an unchanged page costs a 304
+    etag = Column(String(200), nullable=True)
+    last_modified = Column(String(100), nullable=True)
+    version = Column(Integer, default=1)
+
+class ItemVersion(Base):
+    # Superseded document texts: one row per change, with the analysis that was based on that text
+    __tablename__ = 'regulatory_item_versions'
+    
+    id = Column(Integer, primary_key=True)
+    item_id = Column(Integer, ForeignKey('regulatory_items.id', ondelete='CASCADE'), nullable=False)
+    version = Column(Integer, nullable=False)
+    content = Column(LargeBinary, nullable=True)  # zlib-compressed UTF-8 text
+    content_hash = Column(String(64), nullable=True)
+    chars = Column(Integer, nullable=True)
+    impact_overall = Column(String(20), nullable=True)
+    analyzed_at = Column(DateTime, nullable=True)
+    current_from = Column(DateTime, nullable=True)
+    superseded_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index('ix_regulatory_item_versions_item_version', item_id, version),
+    )
+
+class BackfillBatch(Base):
+    __tablename__ = 'backfill_batches'
+    
+    id = Column(Integer, primary_key=True)
+    backfill_name = Column(String(100), index=True)
+    batch_id = Column(String(100), unique=True)
+    item_ids = Column(Text)
+    status = Column(String(20), default='submitted')
+    submitted_at = Column(DateTime, default=datetime.utcnow)
+    applied_at = Column(DateTime, nullable=True)
+
+class DeliverableState(Base):
+    __tablename__ = 'deliverable_state'
+    
+    name = Column(String(100), primary_key=True)
+    value = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Task(Base):
+    __tablename__ = 'tasks'
+    
+    id = Column(Integer, primary_key=True)
+    item_id = Column(Integer, ForeignKey('regulatory_items.id', ondelete='CASCADE'), nullable=False)
+    task = Column(Text)
+    owner_role = Column(String(100), nullable=True)
+    due_window = Column(String(50), nullable=True)
+    evidence_artifact = Column(Text, nullable=True)
+    dependency = Column(Text, nullable=True)
+    status = Column(String(20), default='open')  # open, in_progress, done
+    dedupe_key = Column(String(64))
+    # dedupe_key of the cluster's first task; starts as the task's own key and is widened to near-duplicates by TaskClusterer
+    cluster_key = Column(String(64))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_tasks_item_id', item_id),
+        # Backlog dedupe keeps the first task per cluster in item order; the window function reads this index in order
+        Index('ix_tasks_cluster', cluster_key, item_id, id),
+        Index('ix_tasks_owner_role', owner_role),
+        Index('ix_tasks_due_window', due_window),
+        Index('ix_tasks_status', status),
+    )
+
+class PipelineJob(Base):
+    __tablename__ = 'pipeline_jobs'
+    ACTIVE_STATUSES = ('queued', 'running')
+    
+    id = Column(Integer, primary_key=True)
+    status = Column(String(20), default='queued', index=True)  # queued, running, succeeded, failed, cancelled
+    stage = Column(String(20), nullable=True)
+    progress = Column(Text)
+    params = Column(Text)
+    cancel_requested = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, default=datetime.utcnow)
+    
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': json.loads(self.progress) if self.progress else {},
+            'params': json.loads(self.params) if self.params else {},
+            'cancel_requested': bool(self.cancel_requested),
+            'error': self.error,
+            'result': json.loads(self.result) if self.result else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+        }
+
+class LLMUsage(Base):
+    # One row per model call or cache hit made by AIAnalysisPipeline; written in batches by LLMUsageTracker
+    __tablename__ = 'llm_usage'
+    
+    id = Column(Integer, primary_key=True)
+    run_id = Column(String(100))
+    item_id = Column(Integer, nullable=True)
+    source = Column(String(50), nullable=True)
+    step = Column(String(50))
+    model = Column(String(100))
+    input_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    latency_ms = Column(Integer, default=0)
+    prompt_chars = Column(Integer, default=0)
+    max_tokens = Column(Integer, nullable=True)
+    cached = Column(Integer, default=0)
+    retries = Column(Integer, default=0)
+    parse_failed = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_llm_usage_run_id', run_id),
+        Index('ix_llm_usage_created_at', created_at),
+    )
+
 class DataStore:
+    INSERT_CHUNK_SIZE = 500
+    EXPORT_COLUMNS = ('id', 'title', 'source', 'type', 'published_at', 'impact_overall', 'impact_score', 'business_area', 'url')
+    # Default projection for the lightweight read path: everything the deliverables and list views use, none of the large text columns
+    ROW_COLUMNS = ('id', 'source', 'type', 'published_at', 'title', 'url', 'is_relevant', 'business_area', 'impact_overall', 'impact_rank',
+                   'impact_score', 'ingested_at', 'analyzed_at', 'amended_at')
+    # Fills newly added derived columns on databases created before they existed
+    COLUMN_BACKFILLS = {
+        'regulatory_items.impact_rank': "UPDATE regulatory_items SET impact_rank = CASE impact_overall "
+                                        + ' '.join(f"WHEN '{level}' THEN {rank}" for level, rank in IMPACT_RANKS.items()) + " END",
+        'regulatory_items.impact_score': f"UPDATE regulatory_items SET impact_score = ({' + '.join(IMPACT_SCORE_COLUMNS)}) / 5.0",
+        'tasks.cluster_key': "UPDATE tasks SET cluster_key = dedupe_key",
+        # API failures used to be stored as a "not relevant" analysis; put those items back in the queue
+        'regulatory_items.retry_at': "UPDATE regulatory_items SET is_relevant = NULL, analysis_status = 'failed', analysis_error = relevance_reason, "
+                                     "analysis_attempts = 1 WHERE relevance_reason = 'Analysis error'",
+    }
+    DOCUMENT_MAX_ATTEMPTS = 3
+    # Failed analyses are retried after RETRY_BASE_DELAY, doubling per attempt up to RETRY_MAX_DELAY
+    RETRY_BASE_DELAY = timedelta(minutes=5)
+    RETRY_MAX_DELAY = timedelta(hours=6)
+    # About a day of retries with the backoff above
+    ANALYSIS_MAX_ATTEMPTS = 8
+    
+    POOL_SIZE = 10
+    MAX_OVERFLOW = 20
+    BUSY_TIMEOUT_MS = 30000
+    
     def __init__(self, db_url: str = 'sqlite:///./regulatory_items.db'):
-        self.engine = create_engine(db_url)
+        self.is_sqlite = db_url.startswith('sqlite')
+        if db_url in ('sqlite://', 'sqlite:///:memory:'):
+            # Every thread has to see the same in-memory database, so they share its one connection, a thread at a time
+            self.engine = create_engine(db_url, connect_args={'check_same_thread': False}, poolclass=StaticPool)
+        elif self.is_sqlite:
+            self.engine = create_engine(db_url, connect_args={'check_same_thread': False}, pool_size=self.POOL_SIZE, max_overflow=self.MAX_OVERFLOW)
+        else:
+            self.engine = create_engine(db_url, pool_size=self.POOL_SIZE, max_overflow=self.MAX_OVERFLOW, pool_pre_ping=True)
+        shared_connection = self.engine.pool.__class__ is StaticPool
+        # Held by session scopes and Core reads; re-entrant, as reads run inside scopes on the same thread
+        self._connection_lock = threading.RLock() if shared_connection else nullcontext()
+        if self.is_sqlite:
+            self._configure_sqlite(wal=not shared_connection)
+        existing_tables = set(inspect(self.engine).get_table_names())
         Base.metadata.create_all(self.engine)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
+        self._migrate()
+        # One session per thread; every DataStore method runs as its own unit of work in session_scope()
+        self.Session = scoped_session(sessionmaker(bind=self.engine, expire_on_commit=False))
+        self._scope = threading.local()
+        if 'regulatory_items' in existing_tables and 'tasks' not in existing_tables:
+            logger.info(f"Migrating tasks: backfilled {self.backfill_tasks()} rows from regulatory_items.tasks")
+    
+    def _configure_sqlite(self, wal: bool):
+        @event.listens_for(self.engine, 'connect')
+        def on_connect(dbapi_connection, _):
+            # Take transaction control away from pysqlite so writers can BEGIN IMMEDIATE (see on_begin)
+            dbapi_connection.isolation_level = None
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f'PRAGMA busy_timeout={self.BUSY_TIMEOUT_MS}')
+            if wal:
+                # WAL lets readers keep reading while the pipeline writes
+                cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.close()
+        
+        @event.listens_for(self.engine, 'begin')
+        def on_begin(conn):
+            # Write scopes take the write lock up front, so they wait on busy_timeout instead of failing to upgrade a stale read snapshot
+            conn.exec_driver_sql(conn.get_execution_options().get('sqlite_begin', 'BEGIN'))
+    
+    @property
+    def session(self):
+        return self.Session()
+    
+    @contextmanager
+    def session_scope(self, write: bool = False):
+        # Nested scopes on the same thread join the outermost one; only that one commits and releases the connection
+        if getattr(self._scope, 'depth', 0):
+            self._scope.depth += 1
+            try:
+                yield self.Session()
+            finally:
+                self._scope.depth -= 1
+            return
+        with self._connection_lock:
+            session = self.Session()
+            if write and self.is_sqlite:
+                session.connection(execution_options={'sqlite_begin': 'BEGIN IMMEDIATE'})
+            self._scope.depth = 1
+            try:
+                yield session
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                self._scope.depth = 0
+                self.Session.remove()
+    
+    def _migrate(self):
+        # create_all only creates missing tables; bring existing ones up to the model's columns and indexes.
+        # Inspected on the migrating connection: with StaticPool (in-memory) there is only one, already in a transaction.
+        changed = False
+        with self.engine.begin() as conn:
+            inspector = inspect(conn)
+            for table in Base.metadata.sorted_tables:
+                existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing_columns:
+                        logger.info(f"Migrating {table.name}: adding column {column.name}")
+                        column_type = column.type.compile(dialect=self.engine.dialect)
+                        conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+                        backfill = self.COLUMN_BACKFILLS.get(f"{table.name}.{column.name}")
+                        if backfill:
+                            conn.exec_driver_sql(backfill)
+                        changed = True
+                existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in existing_indexes:
+                        logger.info(f"Migrating {table.name}: creating index {index.name}")
+                        index.create(conn)
+                        changed = True
+        if changed and self.engine.pool.__class__ is not StaticPool:
+            # Pooled connections may hold a pre-migration schema and plan around the new indexes
+            self.engine.dispose()
     
     def add_items(self, items: List[Dict]) -> List[int]:
-        added_ids = []
+        rows = {}
         for item_dict in items:
             try:
-                existing = self.session.query(RegulatoryItem).filter_by(url=item_dict['url']).first()
-                if existing:
+                if item_dict['url'] in rows:
                     continue
-                
-                item = RegulatoryItem(
-                    source=item_dict['source'],
-                    type=item_dict['type'],
-                    published_at=datetime.fromisoformat(item_dict['published_at']) if isinstance(item_dict['published_at'], str) else item_dict['published_at'],
-                    title=item_dict['title'],
-                    summary_raw=item_dict['summary_raw'],
-                    url=item_dict['url'],
-                    tags=json.dumps(item_dict.get('tags', [])),
-                    entities=json.dumps(item_dict.get('entities', [])),
-                )
-                self.session.add(item)
-                self.session.flush()
-                added_ids.append(item.id)
+                rows[item_dict['url']] = {
+                    'source': item_dict['source'],
+                    'type': item_dict['type'],
+                    'published_at': datetime.fromisoformat(item_dict['published_at']) if isinstance(item_dict['published_at'], str) else item_dict['published_at'],
+                    'title': item_dict['title'],
+                    'summary_raw': item_dict['summary_raw'],
+                    'url': item_dict['url'],
+                    'tags': json.dumps(item_dict.get('tags', [])),
+                    'entities': json.dumps(item_dict.get('entities', [])),
+                }
             except Exception as e:
                 logger.error(f"Error adding item: {e}")
         
-        self.session.commit()
+        added_ids = []
+        stmt = insert(RegulatoryItem).returning(RegulatoryItem.id, sort_by_parameter_order=True)
+        with self.session_scope(write=True) as session:
+            existing = self._existing_urls(list(rows))
+            new_rows = [row for url, row in rows.items() if url not in existing]
+            for start in range(0, len(new_rows), self.INSERT_CHUNK_SIZE):
+                result = session.execute(stmt, new_rows[start:start + self.INSERT_CHUNK_SIZE])
+                added_ids.extend(result.scalars().all())
         return added_ids
     
+    def _existing_urls(self, urls: List[str]) -> set:
+        existing = set()
+        for start in range(0, len(urls), self.INSERT_CHUNK_SIZE):
+            chunk = urls[start:start + self.INSERT_CHUNK_SIZE]
+            existing.update(url for (url,) in self.session.query(RegulatoryItem.url).filter(RegulatoryItem.url.in_(chunk)))
+        return existing
+    
     def get_unanalyzed_items(self, limit: int = 50) -> List[RegulatoryItem]:
-        return self.session.query(RegulatoryItem).filter(RegulatoryItem.is_relevant == None).order_by(RegulatoryItem.published_at.desc()).limit(limit).all()
+        # Amended items come first: they are known items whose stored analysis is now stale
+        with self.session_scope():
+            amended = self._reanalysis_query(limit).all()
+            return amended + (self._unanalyzed_query(limit - len(amended)).all() if len(amended) < limit else [])
+    
+    def _unanalyzed_query(self, limit: int):
+        # Linked duplicates are not analyzed; they receive their canonical item's analysis. Failed items wait for their retry_at; permanent failures are skipped.
+        return self.session.query(RegulatoryItem).filter(RegulatoryItem.is_relevant == None, RegulatoryItem.canonical_id == None,
+                                                         self._retry_due(), self._not_failed_permanently()).order_by(RegulatoryItem.published_at.desc()).limit(limit)
+    
+    def _reanalysis_query(self, limit: int):
+        # A separate query rather than an OR in _unanalyzed_query, which would cost that query its index walk
+        return self.session.query(RegulatoryItem).filter(RegulatoryItem.needs_reanalysis == 1, RegulatoryItem.canonical_id == None,
+                                                         self._retry_due(), self._not_failed_permanently()).order_by(RegulatoryItem.published_at.desc()).limit(limit)
+    
+    @staticmethod
+    def _retry_due():
+        return or_(RegulatoryItem.retry_at == None, RegulatoryItem.retry_at <= datetime.utcnow())
+    
+    @staticmethod
+    def _not_failed_permanently():
+        return or_(RegulatoryItem.analysis_status == None, RegulatoryItem.analysis_status != 'failed_permanent')
+    
+    def get_items_by_ids(self, item_ids: List[int], chunk_size: int = 500) -> List[RegulatoryItem]:
+        with self.session_scope() as session:
+            items = []
+            for start in range(0, len(item_ids), chunk_size):
+                items.extend(session.query(RegulatoryItem).filter(RegulatoryItem.id.in_(item_ids[start:start + chunk_size])).all())
+            return items
+    
+    def get_item_texts(self, after_id: int = 0, limit: int = 1000) -> List:
+        return self.fetch_rows(select(RegulatoryItem.id, RegulatoryItem.title, RegulatoryItem.summary_raw, RegulatoryItem.published_at)
+                               .where(RegulatoryItem.id > after_id).order_by(RegulatoryItem.id).limit(limit))
+    
+    def find_minhash_candidates(self, band_keys: Dict[int, set]) -> List:
+        # Fingerprinted items sharing at least one band key; rows carry id, minhash, published_at and canonical_id
+        candidates = {}
+        for band, keys in band_keys.items():
+            keys = list(keys)
+            for start in range(0, len(keys), self.INSERT_CHUNK_SIZE):
+                stmt = select(RegulatoryItem.id, RegulatoryItem.minhash, RegulatoryItem.published_at, RegulatoryItem.canonical_id).join(
+                    ItemMinhashBand, ItemMinhashBand.item_id == RegulatoryItem.id).where(
+                    ItemMinhashBand.band == band, ItemMinhashBand.value.in_(keys[start:start + self.INSERT_CHUNK_SIZE]))
+                for row in self.fetch_rows(stmt):
+                    candidates[row.id] = row
+        return [candidates[item_id] for item_id in sorted(candidates)]
+    
+    def save_fingerprints(self, minhashes: Dict[int, bytes], band_keys: Dict[int, List[int]], links: Dict[int, int]) -> int:
+        # Stores signatures and band rows, links duplicates, and copies analysis to duplicates whose canonical is already analyzed.
+        # Returns the number of items that reused an analysis.
+        items = RegulatoryItem.__table__
+        with self.session_scope(write=True) as session:
+            set_minhash = update(items).where(items.c.id == bindparam('item_id')).values(minhash=bindparam('signature'))
+            params = [{'item_id': item_id, 'signature': signature} for item_id, signature in minhashes.items()]
+            # Inserted in index order, so each chunk touches the (band, value) index sequentially instead of at random
+            band_rows = sorted(({'item_id': item_id, 'band': band, 'value': key} for item_id, keys in band_keys.items() for band, key in enumerate(keys)),
+                               key=lambda row: (row['band'], row['value']))
+            set_canonical = update(items).where(items.c.id == bindparam('item_id')).values(canonical_id=bindparam('canonical'))
+            link_params = [{'item_id': item_id, 'canonical': canonical_id} for item_id, canonical_id in links.items()]
+            for start in range(0, len(params), self.INSERT_CHUNK_SIZE):
+                session.execute(set_minhash, params[start:start + self.INSERT_CHUNK_SIZE])
+            for start in range(0, len(band_rows), self.INSERT_CHUNK_SIZE):
+                session.execute(insert(ItemMinhashBand.__table__), band_rows[start:start + self.INSERT_CHUNK_SIZE])
+            for start in range(0, len(link_params), self.INSERT_CHUNK_SIZE):
+                session.execute(set_canonical, link_params[start:start + self.INSERT_CHUNK_SIZE])
+            
+            canonicals = {item.id: item for item in self.get_items_by_ids(sorted(set(links.values()))) if item.is_relevant is not None}
+            duplicates = [item for item in self.get_items_by_ids([item_id for item_id, canonical_id in links.items() if canonical_id in canonicals])
+                          if item.is_relevant is None]
+            analyses = {}
+            for duplicate in duplicates:
+                analyses[duplicate.id] = self._stored_analysis(canonicals[links[duplicate.id]])
+                self._apply_analysis(duplicate, analyses[duplicate.id])
+            self._replace_tasks(session, {item_id: analysis['tasks'] for item_id, analysis in analyses.items()})
+        return len(analyses)
+    
+    @staticmethod
+    def _relevance_labelled(excluded_reasons: Tuple[str, ...]):
+        # Items whose is_relevant came from a model judgement of their own (not a failure, a copied duplicate or an excluded source)
+        reason = func.coalesce(RegulatoryItem.relevance_reason, '')
+        return (RegulatoryItem.is_relevant != None, RegulatoryItem.canonical_id == None, *[~reason.like(f"{prefix}%") for prefix in excluded_reasons])
+    
+    def get_relevance_labels(self, excluded_reasons: Tuple[str, ...] = ()) -> List:
+        return self.fetch_rows(select(RegulatoryItem.id, RegulatoryItem.source, RegulatoryItem.type, RegulatoryItem.title, RegulatoryItem.summary_raw,
+                                      RegulatoryItem.is_relevant).where(*self._relevance_labelled(excluded_reasons)).order_by(RegulatoryItem.id))
+    
+    def count_relevance_labels(self, excluded_reasons: Tuple[str, ...] = ()) -> int:
+        return self.count_rows(*self._relevance_labelled(excluded_reasons))
+    
+    def get_unlabelled_item_texts(self, excluded_reasons: Tuple[str, ...] = ()) -> List:
+        return self.fetch_rows(select(RegulatoryItem.id, RegulatoryItem.source, RegulatoryItem.type, RegulatoryItem.title, RegulatoryItem.summary_raw)
+                               .where(~and_(*self._relevance_labelled(excluded_reasons))).order_by(RegulatoryItem.id))
+    
+    def get_items_for_full_text(self, limit: int = 200, refresh: bool = False, source: Optional[str] = None,
+                                checked_before: Optional[datetime] = None) -> List:
+        # Items without a document (or whose fetch failed fewer than DOCUMENT_MAX_ATTEMPTS times), newest first;
+        # refresh=True instead re-checks stored documents (fetched before checked_before), least recently fetched first.
+        # Rows carry the stored HTTP validators. Linked duplicates share their canonical's text.
+        with self.session_scope() as session:
+            query = session.query(RegulatoryItem.id, RegulatoryItem.url, RegulatoryItem.source, ItemDocument.etag, ItemDocument.last_modified).outerjoin(
+                ItemDocument, ItemDocument.item_id == RegulatoryItem.id).filter(RegulatoryItem.canonical_id == None)
+            if source:
+                query = query.filter(RegulatoryItem.source == source)
+            if refresh:
+                if checked_before:
+                    query = query.filter(or_(ItemDocument.fetched_at == None, ItemDocument.fetched_at < checked_before))
+                query = query.order_by(ItemDocument.fetched_at.asc().nulls_first(), RegulatoryItem.id)
+            else:
+                retry = and_(ItemDocument.status == 'error', ItemDocument.attempts < self.DOCUMENT_MAX_ATTEMPTS)
+                query = query.filter(or_(ItemDocument.item_id == None, retry)).order_by(RegulatoryItem.published_at.desc())
+            return query.limit(limit).all()
+    
+    def save_documents(self, documents: Dict[int, Dict]) -> Tuple[set, set]:
+        # documents: FullTextFetcher.fetch results by item id. Returns (changed, amended): ids whose text is new or changed,
+        # and those of them that replaced earlier text. A failed or not-modified re-check keeps the text already stored.
+        changed = set()
+        superseded = {}
+        now = datetime.utcnow()
+        item_ids = list(documents)
+        with self.session_scope(write=True) as session:
+            existing = {}
+            for start in range(0, len(item_ids), self.INSERT_CHUNK_SIZE):
+                for row in session.query(ItemDocument).options(defer(ItemDocument.content)).filter(
+                        ItemDocument.item_id.in_(item_ids[start:start + self.INSERT_CHUNK_SIZE])):
+                    existing[row.item_id] = row
+            for item_id, document in documents.items():
+                row = existing.get(item_id)
+                if row is None:
+                    row = ItemDocument(item_id=item_id, attempts=0, version=1)
+                    session.add(row)
+                row.fetched_at = now
+                row.http_status = document.get('http_status')
+                row.error = document.get('error')
+                if document['status'] == 'not_modified':
+                    continue
+                if document['status'] != 'ok':
+                    if row.status != 'ok':
+                        row.status = document['status']
+                        row.content_type = document.get('content_type')
+                        row.attempts = (row.attempts or 0) + 1
+                    continue
+                row.status = 'ok'
+                row.content_type = document.get('content_type')
+                row.attempts = 0
+                row.etag = document.get('etag')
+                row.last_modified = document.get('last_modified')
+                if row.content_hash == document['content_hash']:
+                    continue
+                if row.content_hash:
+                    # Loads the deferred old text, only for the (rare) documents that changed
+                    superseded[item_id] = {'version': row.version or 1, 'content': row.content, 'content_hash': row.content_hash,
+                                           'chars': row.chars, 'current_from': row.changed_at, 'superseded_at': now}
+                    row.version = (row.version or 1) + 1
+                row.content = document['content']
+                row.content_hash = document['content_hash']
+                row.chars = document['chars']
+                row.changed_at = now
+                changed.add(item_id)
+            if superseded:
+                self._record_versions(session, superseded, now)
+        return changed, set(superseded)
+    
+    def _record_versions(self, session, superseded: Dict[int, Dict], now: datetime):
+        # Keeps the old text with the analysis made from it, and queues analyzed items for re-analysis
+        item_ids = list(superseded)
+        for start in range(0, len(item_ids), self.INSERT_CHUNK_SIZE):
+            for item in session.query(RegulatoryItem).filter(RegulatoryItem.id.in_(item_ids[start:start + self.INSERT_CHUNK_SIZE])):
+                session.add(ItemVersion(item_id=item.id, impact_overall=item.impact_overall, analyzed_at=item.analyzed_at, **superseded[item.id]))
+                item.amended_at = now
+                if item.is_relevant is not None:
+                    item.needs_reanalysis = 1
+                if item.analysis_status == 'failed_permanent':
+                    # The new text is a new request, with a fresh set of attempts
+                    item.analysis_status = None
+                    item.analysis_attempts = None
+    
+    def get_item_versions(self, item_id: int) -> List:
+        # Superseded versions, newest first, without their text
+        return self.fetch_rows(select(ItemVersion.version, ItemVersion.content_hash, ItemVersion.chars, ItemVersion.impact_overall,
+                                      ItemVersion.analyzed_at, ItemVersion.current_from, ItemVersion.superseded_at).where(
+                                      ItemVersion.item_id == item_id).order_by(ItemVersion.version.desc()))
+    
+    def get_item_version_text(self, item_id: int, version: int) -> Optional[str]:
+        content = self.fetch_rows(select(ItemVersion.content).where(ItemVersion.item_id == item_id, ItemVersion.version == version))
+        return zlib.decompress(content[0].content).decode('utf-8') if content and content[0].content else None
+    
+    def get_full_texts(self, item_ids: List[int]) -> Dict[int, str]:
+        # Duplicates read their canonical item's document
+        texts = {}
+        with self.session_scope() as session:
+            for start in range(0, len(item_ids), self.INSERT_CHUNK_SIZE):
+                chunk = item_ids[start:start + self.INSERT_CHUNK_SIZE]
+                source_id = func.coalesce(RegulatoryItem.canonical_id, RegulatoryItem.id)
+                rows = session.query(RegulatoryItem.id, ItemDocument.content).join(ItemDocument, ItemDocument.item_id == source_id).filter(
+                    RegulatoryItem.id.in_(chunk), ItemDocument.status == 'ok')
+                texts.update({row.id: zlib.decompress(row.content).decode('utf-8') for row in rows if row.content})
+        return texts
+    
+    def get_full_text(self, item_id: int) -> Optional[str]:
+        return self.get_full_texts([item_id]).get(item_id)
+    
+    def get_backfill_item_ids(self, only_unanalyzed: bool = False, source: str = None) -> List[int]:
+        with self.session_scope() as session:
+            # Linked duplicates are never submitted, even on a full re-run; they receive their canonical item's analysis
+            query = session.query(RegulatoryItem.id).filter(RegulatoryItem.canonical_id == None)
+            if only_unanalyzed:
+                query = query.filter(or_(RegulatoryItem.is_relevant == None, RegulatoryItem.needs_reanalysis == 1), self._not_failed_permanently())
+            if source:
+                query = query.filter(RegulatoryItem.source == source)
+            return [row.id for row in query.order_by(RegulatoryItem.id)]
     
     def update_analysis(self, item_id: int, analysis: Dict):
-        item = self.session.query(RegulatoryItem).filter_by(id=item_id).first()
-        if not item:
-            return
-        
+        with self.session_scope(write=True) as session:
+            item = session.query(RegulatoryItem).filter_by(id=item_id).first()
+            if not item:
+                return
+            self._apply_analysis(item, analysis)
+            self._replace_tasks(session, {item_id: analysis.get('tasks', [])})
+            self._propagate_analyses(session, {item_id: analysis})
+    
+    def update_analyses(self, analyses: Dict[int, Dict]):
+        with self.session_scope(write=True) as session:
+            items = self.get_items_by_ids(list(analyses))
+            for item in items:
+                self._apply_analysis(item, analyses[item.id])
+            self._replace_tasks(session, {item.id: analyses[item.id].get('tasks', []) for item in items})
+            self._propagate_analyses(session, {item.id: analyses[item.id] for item in items})
+    
+    def mark_analysis_failed(self, item_id: int, error: str, permanent: bool = False):
+        # Leaves the item unanalyzed (is_relevant stays NULL, or its previous analysis stays for an amended item) and
+        # schedules the next attempt with exponential backoff. permanent (a request the API rejected) or running out of
+        # attempts takes it out of the queue instead.
+        with self.session_scope(write=True) as session:
+            item = session.get(RegulatoryItem, item_id)
+            if not item or (item.is_relevant is not None and not item.needs_reanalysis):
+                return
+            attempts = (item.analysis_attempts or 0) + 1
+            item.analysis_error = error[:1000]
+            item.analysis_attempts = attempts
+            if permanent or attempts >= self.ANALYSIS_MAX_ATTEMPTS:
+                logger.warning(f"Item {item_id} failed permanently after {attempts} attempt(s)")
+                item.analysis_status = 'failed_permanent'
+                item.retry_at = None
+                return
+            item.analysis_status = 'failed'
+            item.retry_at = datetime.utcnow() + min(self.RETRY_MAX_DELAY, self.RETRY_BASE_DELAY * 2 ** min(attempts - 1, 16))
+    
+    def count_failed_analyses(self) -> int:
+        with self.session_scope() as session:
+            queued = or_(RegulatoryItem.is_relevant == None, RegulatoryItem.needs_reanalysis == 1)
+            return session.query(func.count(RegulatoryItem.id)).filter(queued, RegulatoryItem.analysis_status == 'failed').scalar()
+    
+    def _propagate_analyses(self, session, analyses: Dict[int, Dict]) -> int:
+        # Items linked to a canonical item take over its analysis whenever the canonical is (re-)analyzed
+        duplicates = []
+        canonical_ids = list(analyses)
+        for start in range(0, len(canonical_ids), self.INSERT_CHUNK_SIZE):
+            duplicates.extend(session.query(RegulatoryItem).filter(RegulatoryItem.canonical_id.in_(canonical_ids[start:start + self.INSERT_CHUNK_SIZE])).all())
+        for duplicate in duplicates:
+            self._apply_analysis(duplicate, analyses[duplicate.canonical_id])
+        self._replace_tasks(session, {duplicate.id: analyses[duplicate.canonical_id].get('tasks', []) for duplicate in duplicates})
+        return len(duplicates)
+    
+    @staticmethod
+    def _stored_analysis(item: RegulatoryItem) -> Dict:
+        # Inverse of _apply_analysis, for handing an analyzed item's results to a newly linked duplicate
+        analysis = {column: getattr(item, column) for column in ('relevance_reason', 'business_area', 'impact_overall', 'executive_summary') + IMPACT_SCORE_COLUMNS}
+        analysis['relevant'] = bool(item.is_relevant)
+        analysis['tasks'] = json.loads(item.tasks) if item.tasks else []
+        return analysis
+    
+    def _apply_analysis(self, item: RegulatoryItem, analysis: Dict):
         item.is_relevant = 1 if analysis.get('relevant') else 0
         item.relevance_reason = analysis.get('relevance_reason')
         item.business_area = analysis.get('business_area')
@@ -102,15 +694,399 @@ class DataStore:
         item.impact_customer = analysis.get('impact_customer')
         item.impact_enforcement_risk = analysis.get('impact_enforcement_risk')
         item.impact_overall = analysis.get('impact_overall')
+        item.impact_rank = IMPACT_RANKS.get(item.impact_overall)
+        scores = [getattr(item, column) for column in IMPACT_SCORE_COLUMNS]
+        item.impact_score = sum(scores) / len(scores) if all(score is not None for score in scores) else None
         item.executive_summary = analysis.get('executive_summary')
         item.tasks = json.dumps(analysis.get('tasks', []))
-        
-        self.session.commit()
+        item.analyzed_at = datetime.utcnow()
+        item.analysis_status = None
+        item.analysis_error = None
+        item.analysis_attempts = None
+        item.retry_at = None
+        item.needs_reanalysis = None
+    
+    def _replace_tasks(self, session, tasks_by_item: Dict[int, List[Dict]]) -> int:
+        # Re-analysis replaces an item's tasks; a task that comes back unchanged keeps its status
+        item_ids = list(tasks_by_item)
+        statuses = {}
+        for start in range(0, len(item_ids), self.INSERT_CHUNK_SIZE):
+            chunk = item_ids[start:start + self.INSERT_CHUNK_SIZE]
+            for item_id, dedupe_key, status in session.execute(select(Task.item_id, Task.dedupe_key, Task.status).where(Task.item_id.in_(chunk))):
+                statuses[(item_id, dedupe_key)] = status
+            session.execute(delete(Task).where(Task.item_id.in_(chunk)))
+        rows = []
+        now = datetime.utcnow()
+        for item_id, tasks in tasks_by_item.items():
+            for task in tasks or []:
+                if not isinstance(task, dict):
+                    continue
+                dedupe_key = task_dedupe_key(task)
+                rows.append({'item_id': item_id, 'task': task.get('task'), 'owner_role': task.get('owner_role'), 'due_window': task.get('due_window'),
+                             'evidence_artifact': task.get('evidence_artifact'), 'dependency': task.get('dependency'),
+                             'status': statuses.get((item_id, dedupe_key), 'open'), 'dedupe_key': dedupe_key, 'cluster_key': dedupe_key, 'created_at': now})
+        for start in range(0, len(rows), self.INSERT_CHUNK_SIZE):
+            session.execute(insert(Task), rows[start:start + self.INSERT_CHUNK_SIZE])
+        return len(rows)
+    
+    def backfill_tasks(self, chunk_size: int = 1000) -> int:
+        # Rebuilds the tasks table from the JSON in RegulatoryItem.tasks (databases analyzed before the table existed)
+        added = 0
+        with self.session_scope(write=True) as session:
+            session.execute(delete(Task))
+            last_id = 0
+            while True:
+                rows = session.execute(select(RegulatoryItem.id, RegulatoryItem.tasks).where(RegulatoryItem.id > last_id, RegulatoryItem.tasks != None)
+                                       .order_by(RegulatoryItem.id).limit(chunk_size)).all()
+                if not rows:
+                    break
+                tasks_by_item = {}
+                for item_id, tasks_json in rows:
+                    try:
+                        tasks = json.loads(tasks_json)
+                    except ValueError:
+                        logger.error(f"Skipping unreadable tasks JSON on item {item_id}")
+                        continue
+                    tasks_by_item[item_id] = tasks if isinstance(tasks, list) else []
+                added += self._replace_tasks(session, tasks_by_item)
+                last_id = rows[-1].id
+        return added
+    
+    def _task_select(self, dedupe: bool):
+        # Tasks of relevant items; with dedupe only the first task per cluster in item order (exact duplicates always share a cluster)
+        def relevant_tasks(*columns):
+            return select(*columns).join(RegulatoryItem, RegulatoryItem.id == Task.item_id).where(RegulatoryItem.is_relevant == 1)
+        stmt = relevant_tasks(Task.id, Task.item_id, Task.task, Task.owner_role, Task.due_window, Task.evidence_artifact, Task.dependency, Task.status,
+                              Task.cluster_key, RegulatoryItem.title.label('item_title'))
+        if dedupe:
+            position = func.row_number().over(partition_by=Task.cluster_key, order_by=(Task.item_id, Task.id)).label('position')
+            first = relevant_tasks(Task.id, position).subquery()
+            stmt = stmt.join(first, first.c.id == Task.id).where(first.c.position == 1)
+        return stmt
+    
+    def get_task_backlog(self, dedupe: bool = True, order_by_impact: bool = False, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        stmt = self._task_select(dedupe)
+        if order_by_impact:
+            stmt = stmt.order_by(RegulatoryItem.impact_rank.desc(), Task.item_id.desc(), Task.id)
+        else:
+            stmt = stmt.order_by(Task.item_id, Task.id)
+        stmt = stmt.offset(offset).limit(limit)
+        tasks = [dict(row._mapping) for row in self.fetch_rows(stmt)]
+        if dedupe:
+            # Link each backlog entry back to every relevant item that produced a task in its cluster
+            item_ids = defaultdict(set)
+            keys = list({task['cluster_key'] for task in tasks})
+            for start in range(0, len(keys), self.INSERT_CHUNK_SIZE):
+                stmt = select(Task.cluster_key, Task.item_id).join(RegulatoryItem, RegulatoryItem.id == Task.item_id).where(
+                    RegulatoryItem.is_relevant == 1, Task.cluster_key.in_(keys[start:start + self.INSERT_CHUNK_SIZE]))
+                for cluster_key, item_id in self.fetch_rows(stmt):
+                    item_ids[cluster_key].add(item_id)
+            for task in tasks:
+                task['item_ids'] = sorted(item_ids[task['cluster_key']])
+        return tasks
+    
+    def count_tasks(self, dedupe: bool = True) -> int:
+        return self.fetch_rows(select(func.count()).select_from(self._task_select(dedupe).subquery()))[0][0]
+    
+    def get_task_counts(self, group_by: str = 'owner_role', dedupe: bool = True) -> Dict[str, int]:
+        # group_by: owner_role, due_window or status
+        tasks = self._task_select(dedupe).subquery()
+        column = tasks.c[group_by]
+        return {value: count for value, count in self.fetch_rows(select(column, func.count()).group_by(column).order_by(func.count().desc()))}
+    
+    def get_task_texts(self) -> List:
+        # Input for TaskClusterer, in the same item order the backlog dedupe uses
+        return self.fetch_rows(select(Task.id, Task.task, Task.owner_role, Task.dedupe_key, Task.cluster_key).order_by(Task.item_id, Task.id))
+    
+    def get_task_version(self) -> Tuple:
+        # Task rows are only ever inserted or deleted, so count and max id change whenever the set of tasks does
+        return tuple(self.fetch_rows(select(func.count(Task.id), func.max(Task.id)))[0])
+    
+    def set_task_clusters(self, cluster_keys: Dict[int, str]) -> int:
+        table = Task.__table__
+        stmt = update(table).where(table.c.id == bindparam('task_id')).values(cluster_key=bindparam('key'))
+        params = [{'task_id': task_id, 'key': key} for task_id, key in cluster_keys.items()]
+        with self.session_scope(write=True) as session:
+            for start in range(0, len(params), self.INSERT_CHUNK_SIZE):
+                session.execute(stmt, params[start:start + self.INSERT_CHUNK_SIZE])
+        return len(params)
+    
+    def set_task_status(self, task_id: int, status: str):
+        with self.session_scope(write=True) as session:
+            session.query(Task).filter(Task.id == task_id).update({'status': status}, synchronize_session=False)
+    
+    def add_backfill_batch(self, backfill_name: str, batch_id: str, item_ids: List[int]):
+        with self.session_scope(write=True) as session:
+            session.add(BackfillBatch(backfill_name=backfill_name, batch_id=batch_id, item_ids=json.dumps(item_ids)))
+    
+    def get_backfill_batches(self, backfill_name: str) -> List[BackfillBatch]:
+        with self.session_scope() as session:
+            return session.query(BackfillBatch).filter_by(backfill_name=backfill_name).order_by(BackfillBatch.id).all()
+    
+    def mark_backfill_batch_applied(self, batch_id: str):
+        with self.session_scope(write=True) as session:
+            batch = session.query(BackfillBatch).filter_by(batch_id=batch_id).first()
+            if batch:
+                batch.status = 'applied'
+                batch.applied_at = datetime.utcnow()
     
     def get_recent_items(self, days: int = 7) -> List[RegulatoryItem]:
-        from datetime import timedelta
+        with self.session_scope():
+            return self._recent_query(days).all()
+    
+    def _recent_query(self, days: int):
         cutoff = datetime.utcnow() - timedelta(days=days)
-        return self.session.query(RegulatoryItem).filter(RegulatoryItem.published_at >= cutoff).all()
+        return self.session.query(RegulatoryItem).filter(RegulatoryItem.published_at >= cutoff)
     
     def get_high_impact_items(self) -> List[RegulatoryItem]:
-        return self.session.query(RegulatoryItem).filter(RegulatoryItem.impact_overall.in_(['High', 'Critical'])).all()
+        with self.session_scope():
+            return self._high_impact_query().all()
+    
+    def _high_impact_query(self):
+        return self.session.query(RegulatoryItem).filter(RegulatoryItem.impact_overall.in_(['High', 'Critical']))
+    
+    def get_top_impact_items(self, limit: int = 10) -> List[RegulatoryItem]:
+        with self.session_scope():
+            return self._top_impact_query(limit).all()
+    
+    def _top_impact_query(self, limit: int):
+        return self.session.query(RegulatoryItem).filter(RegulatoryItem.is_relevant == 1).order_by(*self._top_impact_order()).limit(limit)
+    
+    @staticmethod
+    def _top_impact_order() -> Tuple:
+        return (RegulatoryItem.impact_rank.desc(), RegulatoryItem.impact_score.desc(), RegulatoryItem.id.desc())
+    
+    def iter_export_rows(self, relevant_only: bool = True, batch_size: int = 1000) -> Iterator:
+        # Column-projected rows fetched batch_size at a time on a dedicated connection; nothing is hydrated into the session
+        columns = [getattr(RegulatoryItem, name) for name in self.EXPORT_COLUMNS]
+        stmt = select(*columns).order_by(RegulatoryItem.id)
+        if relevant_only:
+            stmt = stmt.where(RegulatoryItem.is_relevant == 1)
+        with self.connect() as conn:
+            for row in conn.execution_options(yield_per=batch_size).execute(stmt):
+                yield row
+    
+    # Lightweight read path: Core selects over projected columns, returned as Row tuples without ORM hydration.
+    # Rows support attribute access (row.title, row.impact_overall), so they can stand in for RegulatoryItem in OutputGenerators.
+    def select_rows(self, columns: Optional[Tuple[str, ...]] = None):
+        return select(*[getattr(RegulatoryItem, name) for name in columns or self.ROW_COLUMNS])
+    
+    @contextmanager
+    def connect(self):
+        # Connection for Core reads outside the session; waits for other threads' scopes on a shared in-memory connection
+        with self._connection_lock, self.engine.connect() as conn:
+            yield conn
+    
+    def fetch_rows(self, stmt) -> List:
+        with self.connect() as conn:
+            return conn.execute(stmt).all()
+    
+    def fetch_frame(self, stmt) -> pd.DataFrame:
+        with self.connect() as conn:
+            return pd.read_sql(stmt, conn)
+    
+    def count_rows(self, *criteria) -> int:
+        with self.connect() as conn:
+            return conn.execute(select(func.count(RegulatoryItem.id)).where(*criteria)).scalar()
+    
+    def get_item_rows(self, columns: Optional[Tuple[str, ...]] = None, relevant_only: bool = False) -> List:
+        stmt = self.select_rows(columns).order_by(RegulatoryItem.id)
+        if relevant_only:
+            stmt = stmt.where(RegulatoryItem.is_relevant == 1)
+        return self.fetch_rows(stmt)
+    
+    def get_items_frame(self, columns: Optional[Tuple[str, ...]] = None, relevant_only: bool = False) -> pd.DataFrame:
+        stmt = self.select_rows(columns).order_by(RegulatoryItem.id)
+        if relevant_only:
+            stmt = stmt.where(RegulatoryItem.is_relevant == 1)
+        return self.fetch_frame(stmt)
+    
+    def get_rows_by_ids(self, item_ids: List[int], columns: Optional[Tuple[str, ...]] = None, chunk_size: int = 500) -> List:
+        rows = []
+        for start in range(0, len(item_ids), chunk_size):
+            rows.extend(self.fetch_rows(self.select_rows(columns).where(RegulatoryItem.id.in_(item_ids[start:start + chunk_size]))))
+        return rows
+    
+    def get_top_impact_rows(self, limit: int = 10, columns: Optional[Tuple[str, ...]] = None) -> List:
+        return self.fetch_rows(self.select_rows(columns).where(RegulatoryItem.is_relevant == 1).order_by(*self._top_impact_order()).limit(limit))
+    
+    def get_rows_changed_since(self, since: datetime, columns: Optional[Tuple[str, ...]] = None) -> List:
+        return self.fetch_rows(self.select_rows(columns).where(or_(RegulatoryItem.ingested_at > since, RegulatoryItem.analyzed_at > since)))
+    
+    def get_items_changed_since(self, since: datetime) -> List[RegulatoryItem]:
+        with self.session_scope():
+            return self._changed_since_query(since).all()
+    
+    def _changed_since_query(self, since: datetime):
+        return self.session.query(RegulatoryItem).filter(or_(RegulatoryItem.ingested_at > since, RegulatoryItem.analyzed_at > since))
+    
+    def get_state(self, name: str) -> Optional[Dict]:
+        with self.session_scope() as session:
+            state = session.get(DeliverableState, name)
+            return json.loads(state.value) if state else None
+    
+    def set_state(self, name: str, value: Dict):
+        with self.session_scope(write=True) as session:
+            session.merge(DeliverableState(name=name, value=json.dumps(value), updated_at=datetime.utcnow()))
+    
+    def _active_job_filter(self, stale_after: timedelta):
+        # A job whose heartbeat stopped (crashed process) no longer blocks new runs
+        return PipelineJob.status.in_(PipelineJob.ACTIVE_STATUSES), PipelineJob.heartbeat_at >= datetime.utcnow() - stale_after
+    
+    def create_pipeline_job(self, params: Dict, stale_after: timedelta) -> Optional[int]:
+        # Single INSERT ... SELECT WHERE NOT EXISTS, so two processes cannot both start a run
+        with self.session_scope(write=True) as session:
+            self.fail_stale_pipeline_jobs(stale_after)
+            now = datetime.utcnow()
+            table = PipelineJob.__table__
+            active = select(PipelineJob.id).where(*self._active_job_filter(stale_after))
+            values = {'status': 'queued', 'progress': '{}', 'params': json.dumps(params), 'cancel_requested': 0, 'created_at': now, 'heartbeat_at': now}
+            statement = insert(table).from_select(list(values), select(*[literal(value, type_=table.c[name].type) for name, value in values.items()]).where(~exists(active)))
+            created = session.execute(statement).rowcount
+            if not created:
+                return None
+            return session.query(func.max(PipelineJob.id)).scalar()
+    
+    def get_pipeline_job(self, job_id: int) -> Optional[Dict]:
+        with self.session_scope() as session:
+            job = session.get(PipelineJob, job_id)
+            return job.to_dict() if job else None
+    
+    def get_latest_pipeline_job(self, stale_after: Optional[timedelta] = None) -> Optional[Dict]:
+        with self.session_scope() as session:
+            job = session.query(PipelineJob).order_by(PipelineJob.id.desc()).first()
+            stale = bool(stale_after and job and job.status in PipelineJob.ACTIVE_STATUSES and job.heartbeat_at < datetime.utcnow() - stale_after)
+            latest = job.to_dict() if job else None
+        # Only a stale active job costs a write; the dashboard polls this
+        if stale:
+            self.fail_stale_pipeline_jobs(stale_after)
+            return self.get_pipeline_job(latest['id'])
+        return latest
+    
+    def fail_stale_pipeline_jobs(self, stale_after: timedelta) -> int:
+        # A crashed process never reports again; without this its job would stay 'running' forever
+        with self.session_scope(write=True) as session:
+            now = datetime.utcnow()
+            failed = session.query(PipelineJob).filter(PipelineJob.status.in_(PipelineJob.ACTIVE_STATUSES), PipelineJob.heartbeat_at < now - stale_after).update(
+                {'status': 'failed', 'error': 'heartbeat lost', 'finished_at': now}, synchronize_session=False)
+            if failed:
+                logger.warning(f"Marked {failed} pipeline job(s) failed: heartbeat lost")
+            return failed
+    
+    def get_active_pipeline_job(self, stale_after: timedelta) -> Optional[Dict]:
+        with self.session_scope() as session:
+            job = session.query(PipelineJob).filter(*self._active_job_filter(stale_after)).order_by(PipelineJob.id.desc()).first()
+            return job.to_dict() if job else None
+    
+    def update_pipeline_job(self, job_id: int, **fields):
+        with self.session_scope(write=True) as session:
+            job = session.get(PipelineJob, job_id)
+            if not job:
+                return
+            for name, value in fields.items():
+                setattr(job, name, json.dumps(value, default=str) if name in ('progress', 'result') else value)
+            job.heartbeat_at = datetime.utcnow()
+    
+    def request_pipeline_job_cancel(self, job_id: int) -> bool:
+        with self.session_scope(write=True) as session:
+            updated = session.query(PipelineJob).filter(PipelineJob.id == job_id, PipelineJob.status.in_(PipelineJob.ACTIVE_STATUSES)).update(
+                {'cancel_requested': 1}, synchronize_session=False)
+            return bool(updated)
+    
+    def is_pipeline_job_cancelled(self, job_id: int) -> bool:
+        with self.session_scope() as session:
+            return bool(session.query(PipelineJob.cancel_requested).filter(PipelineJob.id == job_id).scalar())
+    
+    def add_llm_usage(self, rows: List[Dict]):
+        with self.session_scope(write=True) as session:
+            for start in range(0, len(rows), self.INSERT_CHUNK_SIZE):
+                session.execute(insert(LLMUsage.__table__), rows[start:start + self.INSERT_CHUNK_SIZE])
+    
+    @staticmethod
+    def _usage_totals() -> Tuple:
+        # Cache hits are counted apart from API calls; latency is averaged over API calls only
+        return (
+            func.count(LLMUsage.id).label('calls'),
+            func.coalesce(func.sum(LLMUsage.cached), 0).label('cached'),
+            func.coalesce(func.sum(LLMUsage.input_tokens), 0).label('input_tokens'),
+            func.coalesce(func.sum(LLMUsage.output_tokens), 0).label('output_tokens'),
+            func.avg(case((LLMUsage.cached == 0, LLMUsage.latency_ms))).label('avg_latency_ms'),
+            func.max(LLMUsage.latency_ms).label('max_latency_ms'),
+            func.coalesce(func.sum(LLMUsage.retries), 0).label('retries'),
+            func.coalesce(func.sum(LLMUsage.parse_failed), 0).label('parse_failures'),
+        )
+    
+    @staticmethod
+    def _usage_dict(row) -> Dict:
+        return {
+            'api_calls': row.calls - row.cached,
+            'cached': row.cached,
+            'input_tokens': row.input_tokens,
+            'output_tokens': row.output_tokens,
+            'total_tokens': row.input_tokens + row.output_tokens,
+            'avg_latency_ms': round(row.avg_latency_ms) if row.avg_latency_ms is not None else None,
+            'max_latency_ms': row.max_latency_ms,
+            'retries': row.retries,
+            'parse_failures': row.parse_failures,
+        }
+    
+    def get_llm_usage_summary(self, run_id: Optional[str] = None, since: Optional[datetime] = None) -> Dict:
+        # Totals plus breakdowns per step and per source, for one run or everything since a point in time
+        criteria = []
+        if run_id is not None:
+            criteria.append(LLMUsage.run_id == run_id)
+        if since is not None:
+            criteria.append(LLMUsage.created_at >= since)
+        with self.session_scope() as session:
+            total = session.query(*self._usage_totals()).filter(*criteria).one()
+            by_step = session.query(LLMUsage.step, *self._usage_totals()).filter(*criteria).group_by(LLMUsage.step).all()
+            by_source = session.query(LLMUsage.source, *self._usage_totals()).filter(*criteria).group_by(LLMUsage.source).all()
+            return {
+                'total': self._usage_dict(total),
+                'by_step': {row.step: self._usage_dict(row) for row in by_step},
+                'by_source': {row.source or 'unknown': self._usage_dict(row) for row in by_source},
+            }
+    
+    def get_llm_usage_runs(self, limit: int = 10) -> List[Dict]:
+        # Most recent runs first, with their totals
+        with self.session_scope() as session:
+            rows = session.query(LLMUsage.run_id, func.min(LLMUsage.created_at).label('started_at'), *self._usage_totals()).group_by(
+                LLMUsage.run_id).order_by(func.max(LLMUsage.id).desc()).limit(limit).all()
+            return [{'run_id': row.run_id, 'started_at': row.started_at, **self._usage_dict(row)} for row in rows]
+    
+    def get_data_version(self) -> Tuple:
+        # Changes whenever an item is inserted or analysis is committed; both lookups are index seeks
+        # Two single-aggregate queries: SQLite only applies its min/max index shortcut to a lone aggregate
+        with self.session_scope() as session:
+            max_id = session.query(func.max(RegulatoryItem.id)).scalar()
+            last_analyzed = session.query(func.max(RegulatoryItem.analyzed_at)).scalar()
+            return (max_id, last_analyzed.isoformat() if last_analyzed else None)
+    
+    def count_items(self, relevant_only: bool = False) -> int:
+        with self.session_scope() as session:
+            query = session.query(func.count(RegulatoryItem.id))
+            if relevant_only:
+                query = query.filter(RegulatoryItem.is_relevant == 1)
+            return query.scalar()
+    
+    def explain_query_plans(self) -> Dict[str, List[str]]:
+        # SQLite EXPLAIN QUERY PLAN for each hot query; a 'SCAN regulatory_items' step without an index is a regression
+        queries = {
+            'get_unanalyzed_items': self._unanalyzed_query(50),
+            'get_unanalyzed_items (amended)': self._reanalysis_query(50),
+            'get_recent_items': self._recent_query(7),
+            'get_high_impact_items': self._high_impact_query(),
+            'get_top_impact_items': self._top_impact_query(10),
+            'get_items_changed_since': self._changed_since_query(datetime.utcnow() - timedelta(hours=24)),
+        }
+        plans = {}
+        with self.connect() as conn:
+            for name, query in queries.items():
+                sql = str(query.statement.compile(self.engine, compile_kwargs={'literal_binds': True}))
+                plans[name] = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+        return plans
+    
+    def find_full_scans(self, plans: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
+        # plans defaults to explain_query_plans(); callers can pass plans of their own queries to check them the same way
+        plans = self.explain_query_plans() if plans is None else plans
+        return {name: plan for name, plan in plans.items() if any(step.startswith('SCAN') and 'INDEX' not in step for step in plan)}
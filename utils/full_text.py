@@ -0,0 +1,203 @@
+from utils.data_store import DataStore
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import zip_longest
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+import hashlib
+import lxml.html
+import requests
+import threading
+import time
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+BOILERPLATE_TAGS = ('script', 'style', 'noscript', 'template', 'nav', 'header', 'footer', 'aside', 'form', 'iframe', 'svg', 'button')
+# Main-content containers, most specific first; the first one holding real text wins over <body>
+CONTENT_XPATHS = ('//article', '//main', '//*[@role="main"]', '//*[@id="content"]', '//*[@id="main-content"]')
+BLOCK_TAGS = ('p', 'div', 'section', 'article', 'li', 'ul', 'ol', 'table', 'tr', 'br', 'pre', 'blockquote', 'dd', 'dt',
+              'h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+MIN_CONTENT_CHARS = 200
+
+def extract_text(content, encoding: Optional[str] = None) -> str:
+    # Visible text of an HTML page with navigation and scripts stripped, one block per line
+    if isinstance(content, bytes) and encoding:
+        content = content.decode(encoding, errors='replace')
+    if not content or not content.strip():
+        return ''
+    doc = lxml.html.document_fromstring(content)
+    for element in doc.xpath(' | '.join(f'//{tag}' for tag in BOILERPLATE_TAGS)):
+        element.drop_tree()
+    root = doc.body if doc.find('body') is not None else doc
+    for xpath in CONTENT_XPATHS:
+        candidates = doc.xpath(xpath)
+        if candidates and len(candidates[0].text_content().strip()) >= MIN_CONTENT_CHARS:
+            root = candidates[0]
+            break
+    for element in root.iter(*BLOCK_TAGS):
+        element.tail = '\n' + (element.tail or '')
+    lines = (' '.join(line.split()) for line in root.text_content().splitlines())
+    return '\n'.join(line for line in lines if line)
+
+def compress_text(text: str) -> bytes:
+    return zlib.compress(text.encode('utf-8'), 6)
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class HostThrottle:
+    # Per-host politeness shared by all fetch threads: at most max_concurrent requests in flight per host and
+    # min_interval seconds between request starts; a 429/503 pushes the host's next start back
+    def __init__(self, max_concurrent: int = 2, min_interval: float = 1.0):
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host: str) -> Dict:
+        with self._lock:
+            return self._hosts.setdefault(host, {'slots': threading.Semaphore(self.max_concurrent), 'next_at': 0.0})
+
+    @contextmanager
+    def slot(self, host: str):
+        state = self._host(host)
+        with state['slots']:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    wait = state['next_at'] - now
+                    if wait <= 0:
+                        state['next_at'] = now + self.min_interval
+                        break
+                time.sleep(wait)
+            yield
+
+    def back_off(self, host: str, seconds: float):
+        state = self._host(host)
+        with self._lock:
+            state['next_at'] = max(state['next_at'], time.monotonic() + seconds)
+
+class FullTextFetcher:
+    # Enrichment stage between ingest and analysis: downloads each item's linked document, extracts clean text with lxml
+    # and stores it zlib-compressed in item_documents with a hash of the text. A re-fetch whose text hashes the same is not rewritten.
+    HTML_TYPES = ('text/html', 'application/xhtml+xml')
+    RETRY_STATUSES = (429, 503)
+    SAVE_EVERY = 50
+    # Sources whose pages are amended in place after publication, and how often their stored documents are re-checked
+    RECHECK_INTERVALS = {'FINRA': timedelta(hours=24)}
+
+    def __init__(self, data_store: DataStore, max_workers: int = 8, per_host: int = 2, min_interval: float = 1.0, timeout: float = 20.0,
+                 max_bytes: int = 5 * 1024 * 1024, session: Optional[requests.Session] = None):
+        self.data_store = data_store
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.throttle = HostThrottle(per_host, min_interval)
+        self.session = session or requests.Session()
+        self.session.headers.setdefault('User-Agent', 'RiskIntelligence/1.0')
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def run(self, limit: int = 200, refresh: bool = False, source: Optional[str] = None, checked_before: Optional[datetime] = None) -> Dict:
+        # refresh=True also re-fetches items that already have a document, keeping only those whose text changed
+        items = self.data_store.get_items_for_full_text(limit=limit, refresh=refresh, source=source, checked_before=checked_before)
+        counts = {'fetched': 0, 'changed': 0, 'unchanged': 0, 'not_modified': 0, 'amended': 0, 'unsupported': 0, 'errors': 0}
+        if not items:
+            return counts
+        started = time.monotonic()
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.fetch, item.url, item.etag, item.last_modified): item.id for item in self._interleave_hosts(items)}
+            # Documents are saved from this thread in batches as fetches complete
+            for future in as_completed(futures):
+                pending[futures[future]] = future.result()
+                if len(pending) >= self.SAVE_EVERY:
+                    self._save(pending, counts)
+                    pending = {}
+        self._save(pending, counts)
+        logger.info(f"Full text: {counts} in {time.monotonic() - started:.1f}s")
+        return counts
+    
+    def recheck(self, limit: int = 200) -> Dict:
+        # Conditional re-fetch of RECHECK_INTERVALS sources' stored pages; a changed text queues the item for re-analysis
+        counts = {}
+        now = datetime.utcnow()
+        for source, interval in self.RECHECK_INTERVALS.items():
+            source_counts = self.run(limit=limit, refresh=True, source=source, checked_before=now - interval)
+            counts = {key: counts.get(key, 0) + value for key, value in source_counts.items()}
+        if counts.get('amended'):
+            logger.info(f"Re-check: {counts['amended']} documents amended since their last fetch")
+        return counts
+
+    def _save(self, documents: Dict[int, Dict], counts: Dict):
+        if not documents:
+            return
+        changed, amended = self.data_store.save_documents(documents)
+        counts['amended'] += len(amended)
+        for item_id, document in documents.items():
+            if document['status'] == 'ok':
+                counts['fetched'] += 1
+                counts['changed' if item_id in changed else 'unchanged'] += 1
+            elif document['status'] == 'not_modified':
+                counts['not_modified'] += 1
+            else:
+                counts['unsupported' if document['status'] == 'unsupported' else 'errors'] += 1
+
+    @staticmethod
+    def _interleave_hosts(items: List) -> List:
+        # Round-robin over hosts, so the worker pool is spread across sites instead of queueing on one host's politeness limit
+        by_host = {}
+        for item in items:
+            by_host.setdefault(urlparse(item.url or '').netloc.lower(), []).append(item)
+        return [item for group in zip_longest(*by_host.values()) for item in group if item is not None]
+
+    def fetch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Dict:
+        # One document as {'status': ok | not_modified | unsupported | error, ...}; never raises.
+        # With the validators of the stored copy this is a conditional GET, and a 304 skips download and extraction.
+        parsed = urlparse(url or '')
+        if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+            return {'status': 'unsupported', 'error': 'not an http(s) URL'}
+        host = parsed.netloc.lower()
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        try:
+            with self.throttle.slot(host):
+                with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as resp:
+                    if resp.status_code == 304:
+                        return {'status': 'not_modified', 'http_status': 304}
+                    if resp.status_code in self.RETRY_STATUSES:
+                        retry_after = resp.headers.get('Retry-After', '')
+                        self.throttle.back_off(host, float(retry_after) if retry_after.isdigit() else 30.0)
+                    resp.raise_for_status()
+                    content_type = resp.headers.get('Content-Type', '').split(';')[0].strip().lower()
+                    body = bytearray()
+                    for chunk in resp.iter_content(64 * 1024):
+                        body.extend(chunk)
+                        if len(body) > self.max_bytes:
+                            return {'status': 'unsupported', 'http_status': resp.status_code, 'content_type': content_type,
+                                    'error': f"larger than {self.max_bytes} bytes"}
+                    encoding = resp.encoding if 'charset=' in resp.headers.get('Content-Type', '').lower() else None
+                    status_code = resp.status_code
+                    validators = {'etag': resp.headers.get('ETag'), 'last_modified': resp.headers.get('Last-Modified')}
+        except Exception as e:
+            return {'status': 'error', 'http_status': getattr(getattr(e, 'response', None), 'status_code', None), 'error': str(e)[:500]}
+
+        if content_type in self.HTML_TYPES:
+            text = extract_text(bytes(body), encoding)
+        elif content_type == 'text/plain':
+            text = body.decode(encoding or 'utf-8', errors='replace').strip()
+        else:
+            return {'status': 'unsupported', 'http_status': status_code, 'content_type': content_type, 'error': f"content type {content_type or 'unknown'}"}
+        if not text:
+            return {'status': 'unsupported', 'http_status': status_code, 'content_type': content_type, 'error': 'no text extracted'}
+        # The hash is of the extracted text, so a page whose markup, scripts or navigation change is still unchanged
+        return {'status': 'ok', 'http_status': status_code, 'content_type': content_type, 'content': compress_text(text),
+                'content_hash': content_hash(text), 'chars': len(text), **validators}
@@ -0,0 +1,78 @@
+from utils.data_store import DataStore, IMPACT_RANKS
+from utils.output_generators import OutputGenerators
+from datetime import datetime, timedelta
+from typing import Dict, List
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+class IncrementalDeliverables:
+    STATE_NAME = 'deliverables'
+    INITIAL_CHANGELOG_WINDOW = timedelta(hours=24)
+    # Projected rows are enough for the digest and changelog; the backlog is read from the tasks table
+    COLUMNS = DataStore.ROW_COLUMNS
+
+    def __init__(self, data_store: DataStore, digest_size: int = 10):
+        self.data_store = data_store
+        self.digest_size = digest_size
+
+    def generate(self, rebuild: bool = False) -> Dict:
+        run_started = datetime.utcnow()
+        state = self.data_store.get_state(self.STATE_NAME)
+        if rebuild or state is None:
+            return self._rebuild(state, run_started)
+
+        watermark = datetime.fromisoformat(state['watermark'])
+        delta = self.data_store.get_rows_changed_since(watermark, columns=self.COLUMNS)
+        logger.info(f"Incremental deliverables: {len(delta)} items changed since {watermark.isoformat()}")
+
+        # Heap entries are [rank, score, id]; re-analyzed items are dropped and re-inserted with their new scores
+        delta_ids = {item.id for item in delta}
+        rescored = {item.id: self._digest_entry(item) for item in delta if item.is_relevant}
+        entries = [entry for entry in state['digest'] if entry[2] not in delta_ids]
+        entries.extend(rescored.values())
+        top = heapq.nlargest(self.digest_size, entries)
+        relevant_count = self.data_store.count_items(relevant_only=True)
+        # A top-K item that dropped in rank or stopped being relevant may now belong below items the saved digest never held
+        demoted = any(entry[2] in delta_ids and (entry[2] not in rescored or rescored[entry[2]] < entry) for entry in state['digest'])
+        if demoted or len(top) < min(self.digest_size, relevant_count):
+            # Refill from the digest index
+            top = [self._digest_entry(row) for row in self.data_store.get_top_impact_rows(limit=self.digest_size)]
+
+        deliverables = {
+            'digest': self._digest(top, relevant_count),
+            'backlog': self._backlog(),
+            'changelog': OutputGenerators.generate_changelog(delta, watermark),
+        }
+        self.data_store.set_state(self.STATE_NAME, {'watermark': run_started.isoformat(), 'digest': top})
+        return deliverables
+
+    def _rebuild(self, state, run_started: datetime) -> Dict:
+        # Full recompute over the whole table; also re-seeds the persisted state
+        logger.info("Rebuilding deliverables from scratch")
+        watermark = datetime.fromisoformat(state['watermark']) if state else run_started - self.INITIAL_CHANGELOG_WINDOW
+        all_items = self.data_store.get_item_rows(columns=self.COLUMNS)
+
+        top = [self._digest_entry(row) for row in self.data_store.get_top_impact_rows(limit=self.digest_size)]
+        deliverables = {
+            'digest': OutputGenerators.generate_impact_digest(all_items, limit=self.digest_size),
+            'backlog': self._backlog(),
+            'changelog': OutputGenerators.generate_changelog(all_items, watermark),
+        }
+        self.data_store.set_state(self.STATE_NAME, {'watermark': run_started.isoformat(), 'digest': top})
+        return deliverables
+
+    @staticmethod
+    def _digest_entry(item) -> List:
+        return [IMPACT_RANKS.get(item.impact_overall or 'Low', 0), item.impact_score or 0, item.id]
+
+    def _digest(self, top: List, relevant_count: int) -> Dict:
+        items = {row.id: row for row in self.data_store.get_rows_by_ids([entry[2] for entry in top])}
+        ranked = [items[entry[2]] for entry in top if entry[2] in items]
+        return OutputGenerators.generate_impact_digest(ranked, limit=self.digest_size, total_items=self.data_store.count_items(), relevant_items=relevant_count)
+
+    def _backlog(self) -> Dict:
+        tasks = self.data_store.get_task_backlog()
+        return {'generated_at': datetime.utcnow().isoformat(), 'total_tasks': len(tasks), 'tasks': tasks}
+
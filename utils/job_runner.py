@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('ingest', 'enrich', 'analyze', 'generate', 'export')
+
+class PipelineCancelled(Exception):
+    pass
+
+class JobAlreadyRunning(Exception):
+    pass
+
+class PipelineJobRunner:
+    # Runs orchestrator.run_full_pipeline on a worker thread; job status lives in the pipeline_jobs table so any process can poll or cancel it
+    def __init__(self, orchestrator, stale_after: timedelta = timedelta(minutes=15)):
+        self.orchestrator = orchestrator
+        self.jobs = orchestrator.data_store
+        self.stale_after = stale_after
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, limit_analysis: int = 50) -> int:
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                raise JobAlreadyRunning("A pipeline run is already in progress in this process")
+            job_id = self.jobs.create_pipeline_job({'limit_analysis': limit_analysis}, self.stale_after)
+            if job_id is None:
+                active = self.jobs.get_active_pipeline_job(self.stale_after)
+                raise JobAlreadyRunning(f"Pipeline job {active['id'] if active else '?'} is already running")
+            self._thread = threading.Thread(target=self._run, args=(job_id, limit_analysis), name=f"pipeline-job-{job_id}", daemon=True)
+            self._thread.start()
+        logger.info(f"Started pipeline job {job_id}")
+        return job_id
+
+    def _run(self, job_id: int, limit_analysis: int):
+        progress = {stage: {'status': 'pending'} for stage in STAGES}
+
+        def report(stage: str, detail: Dict):
+            progress[stage] = {**progress[stage], **detail}
+            self._update(job_id, stage=stage, progress=progress)
+
+        def should_cancel() -> bool:
+            return self.jobs.is_pipeline_job_cancelled(job_id)
+
+        self._update(job_id, status='running', started_at=datetime.utcnow(), progress=progress)
+        try:
+            results = self.orchestrator.run_full_pipeline(limit_analysis=limit_analysis, progress=report, should_cancel=should_cancel, run_id=f"job-{job_id}")
+            summary = {key: results[key] for key in ('ingested', 'duplicates', 'ingest_sources', 'full_text', 'analyzed', 'deferred', 'llm_usage', 'exports')}
+            self._update(job_id, status='succeeded', result=summary, finished_at=datetime.utcnow())
+            logger.info(f"Pipeline job {job_id} succeeded")
+        except PipelineCancelled as e:
+            self._update(job_id, status='cancelled', error=str(e), finished_at=datetime.utcnow())
+            logger.info(f"Pipeline job {job_id} cancelled: {e}")
+        except Exception as e:
+            self._update(job_id, status='failed', error=str(e), finished_at=datetime.utcnow())
+            logger.error(f"Pipeline job {job_id} failed: {e}")
+
+    def _update(self, job_id: int, **fields):
+        self.jobs.update_pipeline_job(job_id, **fields)
+
+    def cancel(self, job_id: int) -> bool:
+        # Honoured between stages and between analyzed items; work already committed is kept
+        return self.jobs.request_pipeline_job_cancel(job_id)
+
+    def get_job(self, job_id: int) -> Optional[Dict]:
+        return self.jobs.get_pipeline_job(job_id)
+
+    def latest_job(self) -> Optional[Dict]:
+        return self.jobs.get_latest_pipeline_job(self.stale_after)
+
+    def active_job(self) -> Optional[Dict]:
+        return self.jobs.get_active_pipeline_job(self.stale_after)
+
+    def wait(self, job_id: int, poll_interval: float = 1.0) -> Dict:
+        while True:
+            job = self.get_job(job_id)
+            if job is None or job['status'] not in ('queued', 'running'):
+                return job
+            time.sleep(poll_interval)
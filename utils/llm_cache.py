@@ -0,0 +1,99 @@
+from sqlalchemy import create_engine, Column, String, DateTime, Text, Integer, select, delete, update, func, event
+from sqlalchemy.orm import declarative_base
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import hashlib
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+CacheBase = declarative_base()
+
+class CachedResponse(CacheBase):
+    __tablename__ = 'llm_response_cache'
+
+    key = Column(String(64), primary_key=True)
+    model = Column(String(100))
+    step = Column(String(50))
+    response = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    last_accessed_at = Column(DateTime, default=datetime.utcnow, index=True)
+    hits = Column(Integer, default=0)
+
+def default_cache_url(db_url: str) -> str:
+    # Keep the cache file beside a SQLite items DB; other backends get a local file
+    if db_url.startswith('sqlite:///') and db_url != 'sqlite:///:memory:':
+        db_dir = os.path.dirname(db_url[len('sqlite:///'):]) or '.'
+        return f"sqlite:///{os.path.join(db_dir, 'llm_cache.db')}"
+    return 'sqlite:///./llm_cache.db'
+
+class LLMResponseCache:
+    EVICT_EVERY = 100
+
+    def __init__(self, db_url: str = 'sqlite:///./llm_cache.db', max_entries: Optional[int] = 50000, max_age_days: Optional[int] = 90):
+        self.engine = create_engine(db_url, connect_args={'check_same_thread': False} if db_url.startswith('sqlite') else {})
+        if db_url.startswith('sqlite'):
+            event.listen(self.engine, 'connect', lambda conn, _: conn.execute('PRAGMA busy_timeout=5000'))
+        CacheBase.metadata.create_all(self.engine)
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self.evict()
+
+    @staticmethod
+    def make_key(model: str, step: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\x00{step}\x00{prompt}".encode('utf-8')).hexdigest()
+
+    def get(self, model: str, step: str, prompt: str) -> Optional[str]:
+        key = self.make_key(model, step, prompt)
+        table = CachedResponse.__table__
+        with self.engine.begin() as conn:
+            response = conn.execute(select(table.c.response).where(table.c.key == key)).scalar()
+            if response is not None:
+                conn.execute(update(table).where(table.c.key == key).values(last_accessed_at=datetime.utcnow(), hits=table.c.hits + 1))
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def put(self, model: str, step: str, prompt: str, response: str):
+        now = datetime.utcnow()
+        row = {'key': self.make_key(model, step, prompt), 'model': model, 'step': step, 'response': response, 'created_at': now, 'last_accessed_at': now, 'hits': 0}
+        table = CachedResponse.__table__
+        with self.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.key == row['key']))
+            conn.execute(table.insert(), row)
+        with self._lock:
+            self._puts += 1
+            evict_now = self._puts % self.EVICT_EVERY == 0
+        if evict_now:
+            self.evict()
+
+    def evict(self) -> int:
+        table = CachedResponse.__table__
+        removed = 0
+        with self.engine.begin() as conn:
+            if self.max_age_days:
+                cutoff = datetime.utcnow() - timedelta(days=self.max_age_days)
+                removed += conn.execute(delete(table).where(table.c.created_at < cutoff)).rowcount
+            if self.max_entries:
+                count = conn.execute(select(func.count()).select_from(table)).scalar()
+                if count > self.max_entries:
+                    stale = select(table.c.key).order_by(table.c.last_accessed_at).limit(count - self.max_entries)
+                    removed += conn.execute(delete(table).where(table.c.key.in_(stale))).rowcount
+        if removed:
+            logger.info(f"Evicted {removed} cached LLM responses")
+        return removed
+
+    def stats(self) -> Dict:
+        table = CachedResponse.__table__
+        with self.engine.connect() as conn:
+            entries = conn.execute(select(func.count()).select_from(table)).scalar()
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0, 'entries': entries}
@@ -0,0 +1,64 @@
+from utils.data_store import DataStore
+from datetime import datetime
+from typing import Dict, Optional
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LLMUsageTracker:
+    # Per-call accounting for AIAnalysisPipeline: tokens from response.usage, latency, retries, parse failures and cache hits.
+    # Rows are buffered and written to llm_usage in batches; the current run's token total is kept in memory for the budget.
+    FLUSH_EVERY = 50
+
+    def __init__(self, data_store: DataStore, token_budget: Optional[int] = None):
+        self.data_store = data_store
+        self.token_budget = token_budget
+        self.run_id = None
+        self.run_tokens = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self.start_run()
+
+    def start_run(self, run_id: Optional[str] = None, token_budget: Optional[int] = None) -> str:
+        # token_budget=None keeps the tracker's default; 0 disables the budget for this run
+        self.flush()
+        with self._lock:
+            self.run_id = run_id or datetime.utcnow().strftime('run-%Y%m%d-%H%M%S-%f')
+            self.run_tokens = 0
+            self._run_budget = self.token_budget if token_budget is None else token_budget
+        return self.run_id
+
+    def record(self, step: str, model: str, item_dict: Optional[Dict], input_tokens: int = 0, output_tokens: int = 0, latency: float = 0.0,
+               prompt_chars: int = 0, max_tokens: Optional[int] = None, cached: bool = False, retries: int = 0, parse_failed: bool = False):
+        item_dict = item_dict or {}
+        row = {'item_id': item_dict.get('id'), 'source': item_dict.get('source'), 'step': step, 'model': model, 'input_tokens': input_tokens,
+               'output_tokens': output_tokens, 'latency_ms': int(latency * 1000), 'prompt_chars': prompt_chars, 'max_tokens': max_tokens,
+               'cached': int(cached), 'retries': retries, 'parse_failed': int(parse_failed), 'created_at': datetime.utcnow()}
+        with self._lock:
+            row['run_id'] = self.run_id
+            self._pending.append(row)
+            self.run_tokens += input_tokens + output_tokens
+            flush_now = len(self._pending) >= self.FLUSH_EVERY
+        if flush_now:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return
+        try:
+            self.data_store.add_llm_usage(rows)
+        except Exception as e:
+            # Accounting never fails an analysis; the rows are lost, the run's in-memory total is not
+            logger.error(f"Error saving LLM usage: {e}")
+
+    def budget_exhausted(self) -> bool:
+        with self._lock:
+            return bool(self._run_budget) and self.run_tokens >= self._run_budget
+
+    def run_summary(self) -> Dict:
+        self.flush()
+        summary = self.data_store.get_llm_usage_summary(run_id=self.run_id)
+        return {'run_id': self.run_id, 'token_budget': self._run_budget or None, 'budget_exhausted': self.budget_exhausted(), **summary}
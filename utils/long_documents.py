@@ -0,0 +1,84 @@
+from typing import Dict, List
+import re
+import zlib
+
+# ~4 characters per token, the same estimate RateLimiter callers use
+CHARS_PER_TOKEN = 4
+# A paragraph whose crc32 is a multiple of this ends a chunk (once the chunk has min_chars); ~16 paragraphs per chunk on average
+BOUNDARY_EVERY = 16
+FACT_KINDS = ('deadlines', 'registrant_types', 'obligations')
+FACT_LIMITS = {'deadlines': 10, 'registrant_types': 10, 'obligations': 15}
+
+def _pieces(text: str, max_chars: int) -> List[str]:
+    # Paragraphs, with any paragraph longer than max_chars split at sentence ends (or hard-split when it has none)
+    pieces = []
+    for paragraph in text.split('\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        current = ''
+        for sentence in re.split(r'(?<=[.;:])\s+', paragraph):
+            while len(sentence) > max_chars:
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if current and len(current) + len(sentence) + 1 > max_chars:
+                pieces.append(current)
+                current = ''
+            current = f"{current} {sentence}" if current else sentence
+        if current:
+            pieces.append(current)
+    return pieces
+
+def split_chunks(text: str, max_tokens: int = 3000) -> List[str]:
+    # Token-bounded chunks with content-defined boundaries: a chunk ends after a paragraph whose hash hits BOUNDARY_EVERY,
+    # so editing one section changes only the chunk holding it (and at most the next), and every other chunk keeps its
+    # text and therefore its cached facts. Chunks are cut early only when the next paragraph would overflow max_tokens.
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    min_chars = max_chars // 4
+    chunks = []
+    current = []
+    size = 0
+    for piece in _pieces(text, max_chars):
+        if current and size + len(piece) > max_chars:
+            chunks.append('\n'.join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece) + 1
+        if size >= min_chars and zlib.crc32(piece.encode('utf-8')) % BOUNDARY_EVERY == 0:
+            chunks.append('\n'.join(current))
+            current, size = [], 0
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+def merge_facts(results: List[Dict]) -> Dict[str, List[str]]:
+    # Reduce step: per-chunk facts in document order, deduplicated case-insensitively and capped per kind
+    merged = {kind: [] for kind in FACT_KINDS}
+    seen = {kind: set() for kind in FACT_KINDS}
+    for result in results:
+        for kind in FACT_KINDS:
+            values = result.get(kind) if isinstance(result, dict) else None
+            for value in values if isinstance(values, list) else []:
+                if not isinstance(value, str) or not value.strip():
+                    continue
+                key = ' '.join(value.lower().split())
+                if key in seen[kind] or len(merged[kind]) >= FACT_LIMITS[kind]:
+                    continue
+                seen[kind].add(key)
+                merged[kind].append(value.strip())
+    return merged
+
+def format_facts(facts: Dict[str, List[str]]) -> str:
+    # The block the analysis prompts receive in place of the document
+    lines = []
+    if facts.get('deadlines'):
+        lines.append(f"Deadlines: {'; '.join(facts['deadlines'])}")
+    if facts.get('registrant_types'):
+        lines.append(f"Affected registrants: {'; '.join(facts['registrant_types'])}")
+    if facts.get('obligations'):
+        lines.append('Obligations:')
+        lines.extend(f"- {obligation}" for obligation in facts['obligations'])
+    return '\n'.join(lines)
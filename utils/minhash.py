@@ -0,0 +1,52 @@
+from typing import List
+import numpy as np
+import re
+import zlib
+
+STOPWORDS = {'a', 'an', 'and', 'the', 'to', 'for', 'of', 'on', 'in', 'with', 'by', 'as', 'at', 'any', 'all', 'new', 'our'}
+
+class MinHasher:
+    # MinHash signatures over shingles of normalized text, plus LSH band keys; shared by TaskClusterer and NearDuplicateDetector.
+    # Shingles are character n-grams by default (short task lines) or word n-grams (word_shingles=True, paragraph-length text).
+    PRIME = (1 << 31) - 1
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 4, seed: int = 7, word_shingles: bool = False):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.word_shingles = word_shingles
+        rng = np.random.default_rng(seed)
+        # (a * h + b) mod PRIME with h reduced below PRIME first: every product fits in uint64 and the modulus actually wraps
+        self._a = rng.integers(1, self.PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, self.PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._mixer = rng.integers(1, 1 << 63, size=num_perm, dtype=np.uint64)
+
+    def signatures(self, texts: List[str], batch_size: int = 2000) -> np.ndarray:
+        # One (len(texts), num_perm) matrix; shingle hashes of a whole batch are permuted together and min-reduced per text
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint64)
+        for start in range(0, len(texts), batch_size):
+            shingle_sets = [self.shingles(text) for text in texts[start:start + batch_size]]
+            offsets = np.cumsum([0] + [len(shingles) for shingles in shingle_sets[:-1]])
+            hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingles in shingle_sets for shingle in shingles), dtype=np.uint64) % self.PRIME
+            permuted = (self._a * hashes + self._b) % self.PRIME
+            signatures[start:start + len(shingle_sets)] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        return signatures
+
+    def shingles(self, text: str) -> List[str]:
+        if self.word_shingles:
+            words = self.words(text)
+            if len(words) <= self.shingle_size:
+                return [' '.join(words)]
+            return list({' '.join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)})
+        normalized = ' '.join(self.words(text))
+        if len(normalized) <= self.shingle_size:
+            return [normalized]
+        return list({normalized[i:i + self.shingle_size] for i in range(len(normalized) - self.shingle_size + 1)})
+
+    @staticmethod
+    def words(text: str) -> List[str]:
+        return [word for word in re.findall(r'[a-z0-9]+', (text or '').lower()) if word not in STOPWORDS]
+
+    def band_keys(self, signatures: np.ndarray, bands: int) -> np.ndarray:
+        # (len(signatures), bands) uint64: each band's rows folded into one key (wrapping arithmetic); equal bands give equal keys
+        rows = self.num_perm // bands
+        return (signatures * self._mixer).reshape(len(signatures), bands, rows).sum(axis=2, dtype=np.uint64)
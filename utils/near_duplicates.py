@@ -0,0 +1,101 @@
+from utils.data_store import DataStore
+from utils.minhash import MinHasher
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+class NearDuplicateDetector:
+    # Ingest-time near-duplicate detection over title + summary: MinHash signatures (word bigrams) and LSH band keys are stored with each item
+    # (item_minhash_bands is the persisted index), so a new item is only compared with items sharing one of its band buckets.
+    # A match is linked to the earliest copy (canonical_id) and reuses that item's analysis instead of being analyzed again.
+    STATE_NAME = 'near_duplicates'
+    # Annual notices differ from last year's in a word or two; copies of one release show up on the feeds within days
+    MAX_PUBLISHED_GAP = timedelta(days=30)
+    # Shorter texts (title only, no summary) carry too little to tell two items apart
+    MIN_WORDS = 8
+
+    def __init__(self, data_store: DataStore, num_perm: int = 64, bands: int = 16, threshold: float = 0.85, chunk_size: int = 1000):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.data_store = data_store
+        self.bands = bands
+        self.min_matches = threshold * num_perm
+        self.chunk_size = chunk_size
+        self.minhash = MinHasher(num_perm=num_perm, shingle_size=2, word_shingles=True)
+
+    def run(self) -> Dict:
+        # Items are processed once, in id order, past a watermark; the first run also covers items stored before this existed
+        state = self.data_store.get_state(self.STATE_NAME) or {'last_id': 0}
+        fingerprinted = linked = reused = 0
+        while True:
+            items = self.data_store.get_item_texts(after_id=state['last_id'], limit=self.chunk_size)
+            if not items:
+                break
+            signatures, links = self._process(items)
+            with self.data_store.session_scope(write=True):
+                reused += self.data_store.save_fingerprints({item_id: signature.tobytes() for item_id, signature in signatures.items()},
+                                                            self._band_keys(signatures), links)
+                state = {'last_id': items[-1].id}
+                self.data_store.set_state(self.STATE_NAME, state)
+            fingerprinted += len(signatures)
+            linked += len(links)
+        if fingerprinted:
+            logger.info(f"Near-duplicates: fingerprinted {fingerprinted} items, {linked} linked to a canonical item, {reused} reused its analysis")
+        return {'fingerprinted': fingerprinted, 'linked': linked, 'reused': reused}
+
+    def _band_keys(self, signatures: Dict[int, np.ndarray]) -> Dict[int, List[int]]:
+        if not signatures:
+            return {}
+        # The top 32 bits of each band key are plenty to bucket on (matches are verified on the full signature) and keep the index small
+        keys = (self.minhash.band_keys(np.array(list(signatures.values()), dtype=np.uint64), self.bands) >> np.uint64(32)).astype(np.int64)
+        return {item_id: row for item_id, row in zip(signatures, keys.tolist())}
+
+    def _process(self, items: List) -> Tuple[Dict, Dict]:
+        texts = {item.id: f"{item.title or ''} {item.summary_raw or ''}" for item in items}
+        eligible = [item for item in items if len(self.minhash.words(texts[item.id])) >= self.MIN_WORDS]
+        matrix = self.minhash.signatures([texts[item.id] for item in eligible])
+        # Values are below 2**31, so the stored signature is 4 bytes per permutation
+        signatures = {item.id: signature.astype(np.uint32) for item, signature in zip(eligible, matrix)}
+        band_keys = self._band_keys(signatures)
+
+        # Earlier items come from the persisted index; items of this chunk join the buckets as they are processed
+        buckets = defaultdict(list)
+        candidates = {}
+        stored = self.data_store.find_minhash_candidates({band: {keys[band] for keys in band_keys.values()} for band in range(self.bands)})
+        for row in stored:
+            candidates[row.id] = (np.frombuffer(row.minhash, dtype=np.uint32), row.published_at, row.canonical_id)
+        for item_id, keys in self._band_keys({row.id: candidates[row.id][0] for row in stored}).items():
+            for band, key in enumerate(keys):
+                buckets[(band, key)].append(item_id)
+
+        links = {}
+        for item in eligible:
+            match = self._match(item, signatures[item.id], band_keys[item.id], buckets, candidates, links)
+            if match is not None:
+                links[item.id] = match
+            candidates[item.id] = (signatures[item.id], item.published_at, None)
+            for band, key in enumerate(band_keys[item.id]):
+                buckets[(band, key)].append(item.id)
+        return signatures, links
+
+    def _match(self, item, signature: np.ndarray, keys: List[int], buckets: Dict, candidates: Dict, links: Dict) -> Optional[int]:
+        seen = set()
+        best = None
+        for band, key in enumerate(keys):
+            for candidate_id in buckets.get((band, key), []):
+                if candidate_id in seen:
+                    continue
+                seen.add(candidate_id)
+                candidate_signature, published_at, canonical_id = candidates[candidate_id]
+                if np.count_nonzero(candidate_signature == signature) < self.min_matches:
+                    continue
+                if item.published_at and published_at and abs(item.published_at - published_at) > self.MAX_PUBLISHED_GAP:
+                    continue
+                # Link to the candidate's own canonical, so every copy of a release points at the first one
+                canonical = links.get(candidate_id) or canonical_id or candidate_id
+                best = canonical if best is None else min(best, canonical)
+        return best
@@ -5,97 +5,324 @@ from pathlib import Path
 if __name__ == '__main__':
     sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from utils.connectors import SecRSSConnector, FinraConnector, FedRegConnector
-from utils.data_store import DataStore, RegulatoryItem
-from utils.ai_analysis import AIAnalysisPipeline
+from utils.connectors import SecRSSConnector, FinraConnector, FedRegConnector, ConnectorState
+from utils.data_store import DataStore
+from utils.ai_analysis import AIAnalysisPipeline, RateLimiter, LLMCallFailed
+from utils.llm_cache import LLMResponseCache, default_cache_url
+from utils.llm_usage import LLMUsageTracker
+from utils.batch_backfill import BatchBackfill
+from utils.incremental_deliverables import IncrementalDeliverables
+from utils.task_clustering import TaskClusterer
+from utils.near_duplicates import NearDuplicateDetector
+from utils.full_text import FullTextFetcher
+from utils.relevance_filter import RelevanceFilter
+from utils.job_runner import PipelineJobRunner, PipelineCancelled, JobAlreadyRunning
 from utils.output_generators import OutputGenerators
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+import argparse
+import json
 import logging
 import os
+import time
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class RegulatoryIntelligenceOrchestrator:
-    def __init__(self, db_url: str = 'sqlite:///./regulatory_items.db', api_key: str = None):
+    SOURCE_TIMEOUTS = {'SEC': 30.0, 'FINRA': 30.0, 'FedReg': 60.0}
+    FEDREG_WORKERS = 4
+    
+    def __init__(self, db_url: str = 'sqlite:///./regulatory_items.db', api_key: str = None, analysis_concurrency: int = 1,
+                 requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None, ai_client=None, analysis_mode: str = 'staged',
+                 use_llm_cache: bool = True, llm_cache_url: Optional[str] = None, connector_state_path: str = './connector_state.json',
+                 use_prefilter: bool = True, token_budget: Optional[int] = None, fetch_full_text: bool = True):
         self.data_store = DataStore(db_url)
-        self.ai_pipeline = AIAnalysisPipeline(api_key=api_key or os.getenv('ANTHROPIC_API_KEY'))
+        rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute) if requests_per_minute or tokens_per_minute else None
+        self.llm_cache = LLMResponseCache(llm_cache_url or default_cache_url(db_url)) if use_llm_cache else None
+        self.relevance_filter = RelevanceFilter(self.data_store) if use_prefilter else None
+        # token_budget caps input + output tokens per analysis run; None means unlimited
+        self.llm_usage = LLMUsageTracker(self.data_store, token_budget=token_budget)
+        self.ai_pipeline = AIAnalysisPipeline(api_key=api_key or os.getenv('ANTHROPIC_API_KEY'), client=ai_client, rate_limiter=rate_limiter,
+                                              mode=analysis_mode, cache=self.llm_cache, prefilter=self.relevance_filter, usage=self.llm_usage)
+        self.analysis_concurrency = analysis_concurrency
         
-        self.sec_connector = SecRSSConnector()
-        self.finra_connector = FinraConnector()
-        self.fed_reg_connector = FedRegConnector()
+        self.connector_state = ConnectorState(connector_state_path)
+        self.sec_connector = SecRSSConnector(state=self.connector_state)
+        self.finra_connector = FinraConnector(state=self.connector_state)
+        self.fed_reg_connector = FedRegConnector(state=self.connector_state)
+        self.near_duplicates = NearDuplicateDetector(self.data_store)
+        self.full_text_fetcher = FullTextFetcher(self.data_store) if fetch_full_text else None
+        self.last_ingest_report = None
+        self.last_usage_report = None
+        self.last_analysis_report = None
+    
+    def ingest_all_sources(self, concurrent: bool = True) -> int:
+        return self.ingest_sources(concurrent=concurrent)['ingested']
     
-    def ingest_all_sources(self) -> int:
-        logger.info("=== Starting ingest ===")
+    def ingest_sources(self, concurrent: bool = True, max_workers: Optional[int] = None, source_timeouts: Optional[Dict[str, float]] = None) -> Dict:
+        logger.info(f"=== Starting ingest (concurrent={concurrent}) ===")
+        fetchers = {
+            'SEC': self.sec_connector.fetch_press_releases,
+            'FINRA': self.finra_connector.fetch_notices,
+            'FedReg': lambda: self.fed_reg_connector.fetch_regulations(max_workers=self.FEDREG_WORKERS if concurrent else 1),
+        }
+        timeouts = {**self.SOURCE_TIMEOUTS, **(source_timeouts or {})}
         all_items = []
+        # Feed validators and polling watermarks, saved only once the items they cover are stored
+        state_updates = {}
+        sources = {}
         
-        sec_items = self.sec_connector.fetch_press_releases()
-        logger.info(f"SEC: {len(sec_items)} items")
-        all_items.extend(sec_items)
+        if not concurrent:
+            for name, fetch in fetchers.items():
+                try:
+                    items, source_state, seconds = self._timed_fetch(fetch)
+                    all_items.extend(items)
+                    state_updates.update(source_state)
+                    sources[name] = {'status': 'ok', 'items': len(items), 'seconds': seconds}
+                except Exception as e:
+                    logger.error(f"{name} ingest failed: {e}")
+                    sources[name] = {'status': 'error', 'items': 0, 'seconds': None, 'error': str(e)}
+        else:
+            # No context manager: a source that overruns its timeout must not hold up the rest of the run
+            executor = ThreadPoolExecutor(max_workers=max_workers or len(fetchers))
+            started = time.monotonic()
+            futures = {name: executor.submit(self._timed_fetch, fetch) for name, fetch in fetchers.items()}
+            for name in sorted(futures, key=lambda source: timeouts[source]):
+                remaining = max(0.0, started + timeouts[name] - time.monotonic())
+                try:
+                    items, source_state, seconds = futures[name].result(timeout=remaining)
+                    all_items.extend(items)
+                    state_updates.update(source_state)
+                    sources[name] = {'status': 'ok', 'items': len(items), 'seconds': seconds}
+                except FuturesTimeoutError:
+                    logger.error(f"{name} ingest timed out after {timeouts[name]}s")
+                    sources[name] = {'status': 'timeout', 'items': 0, 'seconds': timeouts[name]}
+                except Exception as e:
+                    logger.error(f"{name} ingest failed: {e}")
+                    sources[name] = {'status': 'error', 'items': 0, 'seconds': None, 'error': str(e)}
+            executor.shutdown(wait=False, cancel_futures=True)
+            sources = {name: sources[name] for name in fetchers}
         
-        finra_items = self.finra_connector.fetch_notices()
-        logger.info(f"FINRA: {len(finra_items)} items")
-        all_items.extend(finra_items)
+        # RSS connectors swallow 304s and fetch errors into an empty list; surface which one it was
+        for name, connector in (('SEC', self.sec_connector), ('FINRA', self.finra_connector)):
+            if sources[name]['status'] == 'ok' and connector.last_status in ('unchanged', 'error'):
+                sources[name]['status'] = connector.last_status
         
-        fed_reg_items = self.fed_reg_connector.fetch_regulations()
-        logger.info(f"FedReg: {len(fed_reg_items)} items")
-        all_items.extend(fed_reg_items)
+        for name, report in sources.items():
+            logger.info(f"{name}: {report['items']} items ({report['status']}, {report['seconds']}s)")
         
         added_ids = self.data_store.add_items(all_items)
         logger.info(f"Stored {len(added_ids)} items")
-        return len(added_ids)
+        # Only sources that returned in time contributed state, and only now are their items stored
+        self.connector_state.update(state_updates)
+        # The same release arrives from several feeds under different URLs; copies are linked here and never sent to the model
+        duplicates = self.near_duplicates.run()
+        self.last_ingest_report = {'ingested': len(added_ids), 'duplicates': duplicates['linked'], 'sources': sources}
+        return self.last_ingest_report
+    
+    def enrich_full_text(self, limit: int = 200, refresh: bool = False, recheck: bool = True) -> Dict:
+        # Downloads the documents new items link to; runs after near-duplicate linking, so copies are not fetched again.
+        # recheck also re-fetches FINRA pages due for a check (conditional GET); amended ones are queued for re-analysis.
+        if not self.full_text_fetcher:
+            return {}
+        logger.info(f"=== Fetching full text (limit={limit}, refresh={refresh}) ===")
+        counts = self.full_text_fetcher.run(limit=limit, refresh=refresh)
+        if recheck and not refresh:
+            rechecked = self.full_text_fetcher.recheck(limit=limit)
+            counts = {key: value + rechecked.get(key, 0) for key, value in counts.items()}
+        return counts
     
-    def analyze_unanalyzed_items(self, limit: int = 50) -> int:
-        logger.info(f"Analyzing up to {limit} items")
+    @staticmethod
+    def _timed_fetch(fetch):
+        started = time.monotonic()
+        result = fetch()
+        # Connectors return (items, connector state to save once the items are stored)
+        items, state_updates = result if isinstance(result, tuple) else (result, {})
+        return items, state_updates, round(time.monotonic() - started, 2)
+    
+    def analyze_unanalyzed_items(self, limit: int = 50, concurrency: Optional[int] = None, progress: Optional[Callable] = None,
+                                 should_cancel: Optional[Callable[[], bool]] = None, run_id: Optional[str] = None, token_budget: Optional[int] = None) -> int:
+        concurrency = concurrency or self.analysis_concurrency
+        run_id = self.llm_usage.start_run(run_id, token_budget)
+        logger.info(f"Analyzing up to {limit} items (concurrency={concurrency}, run {run_id})")
         items = self.data_store.get_unanalyzed_items(limit=limit)
+        # Snapshot rows up front: worker threads only see plain dicts, never the shared session
+        work = [(item.id, item.to_dict()) for item in items]
+        # Fetched documents go along for the pipeline's long-document mode
+        full_texts = self.data_store.get_full_texts([item_id for item_id, _ in work])
+        for item_id, item_dict in work:
+            item_dict['full_text'] = full_texts.get(item_id)
+        if work and self.relevance_filter:
+            # Picks up labels from earlier runs; clear-cut items are then decided without an API call
+            self.relevance_filter.refresh()
         
         analyzed_count = 0
-        for item in items:
-            try:
-                item_dict = item.to_dict()
-                analysis = self.ai_pipeline.analyze_item(item_dict)
-                self.data_store.update_analysis(item.id, analysis)
-                analyzed_count += 1
-            except Exception as e:
-                logger.error(f"Error analyzing item {item.id}: {e}")
+        # Items whose model calls failed after retries; they stay unanalyzed and are picked up again after their retry_at
+        deferred_count = 0
+        cancelled = False
+        # Over budget, no new item is started; the rest stay unanalyzed for the next run
+        over_budget = False
+        if concurrency <= 1:
+            for item_id, item_dict in work:
+                if should_cancel and should_cancel():
+                    cancelled = True
+                    break
+                if self.llm_usage.budget_exhausted():
+                    over_budget = True
+                    break
+                try:
+                    analysis = self.ai_pipeline.analyze_item(item_dict)
+                    self.data_store.update_analysis(item_id, analysis)
+                    analyzed_count += 1
+                except LLMCallFailed as e:
+                    deferred_count += 1
+                    logger.warning(f"Item {item_id} deferred: {e}")
+                    self.data_store.mark_analysis_failed(item_id, str(e), permanent=not e.retryable)
+                except Exception as e:
+                    logger.error(f"Error analyzing item {item_id}: {e}")
+                if progress:
+                    progress('analyze', {'status': 'running', 'done': analyzed_count, 'total': len(work), 'deferred': deferred_count,
+                                         'tokens': self.llm_usage.run_tokens})
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = {executor.submit(self.ai_pipeline.analyze_item, item_dict): item_id for item_id, item_dict in work}
+                # Results are committed from this thread as they complete
+                for future in as_completed(futures):
+                    if not cancelled and should_cancel and should_cancel():
+                        cancelled = True
+                    elif not over_budget and self.llm_usage.budget_exhausted():
+                        over_budget = True
+                    if cancelled or over_budget:
+                        # In-flight items still finish and are committed; queued ones never start
+                        for pending in futures:
+                            pending.cancel()
+                    if future.cancelled():
+                        continue
+                    item_id = futures[future]
+                    try:
+                        self.data_store.update_analysis(item_id, future.result())
+                        analyzed_count += 1
+                    except LLMCallFailed as e:
+                        deferred_count += 1
+                        logger.warning(f"Item {item_id} deferred: {e}")
+                        self.data_store.mark_analysis_failed(item_id, str(e), permanent=not e.retryable)
+                    except Exception as e:
+                        logger.error(f"Error analyzing item {item_id}: {e}")
+                    if progress:
+                        progress('analyze', {'status': 'running', 'done': analyzed_count, 'total': len(work), 'deferred': deferred_count,
+                                             'tokens': self.llm_usage.run_tokens})
         
-        logger.info(f"Analyzed {analyzed_count} items")
+        logger.info(f"Analyzed {analyzed_count} items, {deferred_count} deferred for retry")
+        self.last_analysis_report = {'analyzed': analyzed_count, 'deferred': deferred_count}
+        self.last_usage_report = self.llm_usage.run_summary()
+        logger.info(f"LLM usage: {self.last_usage_report['total']}")
+        if over_budget:
+            logger.warning(f"Token budget of {self.last_usage_report['token_budget']} reached after {analyzed_count} of {len(work)} items")
+        if self.llm_cache:
+            logger.info(f"LLM cache: {self.llm_cache.stats()}")
+        if self.relevance_filter:
+            logger.info(f"Relevance pre-filter: {self.relevance_filter.stats()}")
+        if cancelled:
+            raise PipelineCancelled(f"Cancelled after analyzing {analyzed_count} of {len(work)} items")
         return analyzed_count
     
-    def generate_deliverables(self) -> Dict:
+    def backfill_analysis(self, name: str = 'backfill', only_unanalyzed: bool = False, source: Optional[str] = None, batch_size: int = 1000,
+                          poll_interval: float = 60.0, max_polls: Optional[int] = None, batch_client=None) -> Dict:
+        logger.info(f"=== Starting batch backfill '{name}' ===")
+        # Resumed backfills keep accounting under the same run
+        self.llm_usage.start_run(f"backfill-{name}", token_budget=0)
+        backfill = BatchBackfill(self.data_store, self.ai_pipeline, batch_client=batch_client, batch_size=batch_size, poll_interval=poll_interval)
+        report = backfill.run(name, only_unanalyzed=only_unanalyzed, source=source, max_polls=max_polls)
+        report['llm_usage'] = self.last_usage_report = self.llm_usage.run_summary()
+        return report
+    
+    def generate_deliverables(self, rebuild: bool = False) -> Dict:
         logger.info("Generating deliverables")
-        all_items = self.data_store.session.query(RegulatoryItem).all()
-        
-        digest = OutputGenerators.generate_impact_digest(all_items, limit=10)
-        backlog = OutputGenerators.generate_task_backlog(all_items)
-        
-        last_24h = datetime.utcnow() - timedelta(hours=24)
-        changelog = OutputGenerators.generate_changelog(all_items, last_24h)
-        
-        return {'digest': digest, 'backlog': backlog, 'changelog': changelog}
+        # Near-duplicate tasks share a cluster_key, so the deduped backlog lists each of them once
+        TaskClusterer(self.data_store).run(force=rebuild)
+        # Only items ingested or re-analyzed since the last run are read; rebuild=True recomputes from the full table
+        return IncrementalDeliverables(self.data_store, digest_size=10).generate(rebuild=rebuild)
     
-    def export_results(self, deliverables: Dict, output_dir: str = './reports'):
+    def export_results(self, deliverables: Dict, output_dir: str = './reports', streaming: bool = True):
         os.makedirs(output_dir, exist_ok=True)
+        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
         
-        json_file = os.path.join(output_dir, f"impact_report_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json")
+        json_file = os.path.join(output_dir, f"impact_report_{timestamp}.json")
         OutputGenerators.export_to_json(deliverables['digest'], deliverables['backlog'], deliverables['changelog'], filename=json_file)
         
-        all_items = self.data_store.session.query(RegulatoryItem).all()
-        csv_file = os.path.join(output_dir, f"impact_analysis_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv")
-        OutputGenerators.export_to_csv(all_items, filename=csv_file)
+        csv_file = os.path.join(output_dir, f"impact_analysis_{timestamp}.csv")
+        if not streaming:
+            OutputGenerators.export_to_csv(self.data_store.get_item_rows(), filename=csv_file)
+            return {'json': json_file, 'csv': csv_file}
         
-        return {'json': json_file, 'csv': csv_file}
+        # Memory stays flat: rows are read in batches and written as they arrive
+        OutputGenerators.stream_to_csv(self.data_store.iter_export_rows(), filename=csv_file)
+        jsonl_file = os.path.join(output_dir, f"impact_items_{timestamp}.jsonl")
+        OutputGenerators.stream_to_jsonl(self.data_store.iter_export_rows(), filename=jsonl_file)
+        return {'json': json_file, 'csv': csv_file, 'jsonl': jsonl_file}
     
-    def run_full_pipeline(self, limit_analysis: int = 50) -> Dict:
+    def run_full_pipeline(self, limit_analysis: int = 50, progress: Optional[Callable] = None, should_cancel: Optional[Callable[[], bool]] = None,
+                          run_id: Optional[str] = None, token_budget: Optional[int] = None) -> Dict:
+        # progress(stage, detail) is reported as each stage starts and finishes; should_cancel() is polled between stages
+        def stage(name: str, **detail):
+            if should_cancel and should_cancel():
+                raise PipelineCancelled(f"Cancelled before {name} finished")
+            if progress:
+                progress(name, detail)
+        
         logger.info("STARTING FULL PIPELINE")
-        ingested = self.ingest_all_sources()
-        analyzed = self.analyze_unanalyzed_items(limit=limit_analysis)
+        stage('ingest', status='running')
+        ingest_report = self.ingest_sources()
+        ingested = ingest_report['ingested']
+        stage('ingest', status='done', ingested=ingested, duplicates=ingest_report['duplicates'])
+        stage('enrich', status='running')
+        full_text = self.enrich_full_text()
+        stage('enrich', status='done', **full_text)
+        stage('analyze', status='running')
+        analyzed = self.analyze_unanalyzed_items(limit=limit_analysis, progress=progress, should_cancel=should_cancel, run_id=run_id, token_budget=token_budget)
+        usage = self.last_usage_report
+        deferred = self.last_analysis_report['deferred']
+        stage('analyze', status='done', analyzed=analyzed, deferred=deferred, tokens=usage['total']['total_tokens'], budget_exhausted=usage['budget_exhausted'])
+        stage('generate', status='running')
         deliverables = self.generate_deliverables()
+        stage('generate', status='done')
+        stage('export', status='running')
         exports = self.export_results(deliverables)
+        if progress:
+            progress('export', {'status': 'done'})
         logger.info("PIPELINE COMPLETE")
-        return {'ingested': ingested, 'analyzed': analyzed, 'deliverables': deliverables, 'exports': exports}
+        return {'ingested': ingested, 'duplicates': ingest_report['duplicates'], 'ingest_sources': ingest_report['sources'], 'full_text': full_text, 'analyzed': analyzed,
+                'deferred': deferred, 'llm_usage': usage, 'deliverables': deliverables, 'exports': exports}
 
 if __name__ == '__main__':
-    orchestrator = RegulatoryIntelligenceOrchestrator()
-    results = orchestrator.run_full_pipeline(limit_analysis=50)
-    print(f"✓ Complete! Ingested: {results['ingested']}, Analyzed: {results['analyzed']}")
+    parser = argparse.ArgumentParser(description='Run the regulatory intelligence pipeline')
+    parser.add_argument('--limit', type=int, default=50, help='maximum number of items to analyze')
+    parser.add_argument('--status', action='store_true', help='print the latest pipeline job and exit')
+    parser.add_argument('--cancel', type=int, metavar='JOB_ID', help='ask a running job to stop after its current step')
+    parser.add_argument('--prefilter-report', action='store_true', help='cross-validate the relevance pre-filter on stored labels and exit')
+    parser.add_argument('--token-budget', type=int, help='stop analysis once a run has used this many input + output tokens')
+    parser.add_argument('--usage', action='store_true', help='print LLM token usage per step and source for the last 7 days and exit')
+    args = parser.parse_args()
+    
+    orchestrator = RegulatoryIntelligenceOrchestrator(token_budget=args.token_budget)
+    runner = PipelineJobRunner(orchestrator)
+    if args.prefilter_report:
+        print(json.dumps(orchestrator.relevance_filter.evaluate(), indent=2))
+    elif args.usage:
+        print(json.dumps(orchestrator.data_store.get_llm_usage_summary(since=datetime.utcnow() - timedelta(days=7)), indent=2))
+    elif args.status:
+        print(json.dumps(runner.latest_job(), indent=2, default=str))
+    elif args.cancel:
+        print(f"Cancellation requested for job {args.cancel}" if runner.cancel(args.cancel) else f"Job {args.cancel} is not running")
+    else:
+        try:
+            job_id = runner.start(limit_analysis=args.limit)
+        except JobAlreadyRunning as e:
+            sys.exit(f"✗ {e}")
+        job = runner.wait(job_id)
+        if job['status'] != 'succeeded':
+            sys.exit(f"✗ Job {job_id} {job['status']}: {job['error'] or ''}")
+        usage = job['result']['llm_usage']['total']
+        print(f"✓ Complete! Ingested: {job['result']['ingested']}, Analyzed: {job['result']['analyzed']}, Tokens: {usage['total_tokens']} in {usage['api_calls']} calls")
@@ -1,6 +1,8 @@
 import pandas as pd
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional, Iterable
+import csv
+from utils.data_store import IMPACT_RANKS
 import json
 import logging
 
@@ -8,11 +10,17 @@ logger = logging.getLogger(__name__)
 
 class OutputGenerators:
     @staticmethod
-    def generate_impact_digest(items: List, limit: int = 10) -> Dict:
-        relevant_items = [item for item in items if item.is_relevant]
-        high_impact = sorted(relevant_items, key=lambda x: {'Critical': 4, 'High': 3, 'Medium': 2, 'Low': 1}.get(x.impact_overall or 'Low', 0), reverse=True)[:limit]
+    def generate_impact_digest(items: List, limit: int = 10, total_items: Optional[int] = None, relevant_items: Optional[int] = None) -> Dict:
+        # `items` may be the full table, or the top-N rows from DataStore.get_top_impact_items together with the table counts
+        relevant = [item for item in items if item.is_relevant]
+        high_impact = sorted(relevant, key=lambda x: (IMPACT_RANKS.get(x.impact_overall or 'Low', 0), getattr(x, 'impact_score', None) or 0, x.id), reverse=True)[:limit]
         
-        digest = {'generated_at': datetime.utcnow().isoformat(), 'total_items': len(items), 'relevant_items': len(relevant_items), 'items': []}
+        digest = {
+            'generated_at': datetime.utcnow().isoformat(),
+            'total_items': len(items) if total_items is None else total_items,
+            'relevant_items': len(relevant) if relevant_items is None else relevant_items,
+            'items': [],
+        }
         for item in high_impact:
             digest['items'].append({
                 'id': item.id,
@@ -40,12 +48,17 @@ class OutputGenerators:
     @staticmethod
     def generate_changelog(items_now: List, last_run_timestamp: datetime) -> Dict:
         new_items = [item for item in items_now if item.ingested_at > last_run_timestamp]
-        escalated = [i for i in new_items if i.impact_overall in ['High', 'Critical']]
+        # Amended items count once their changed text has been analyzed again
+        amended = [i for i in items_now if i.amended_at and i.amended_at > last_run_timestamp and i.ingested_at <= last_run_timestamp
+                   and i.analyzed_at and i.analyzed_at >= i.amended_at]
+        escalated = [i for i in new_items + amended if i.impact_overall in ['High', 'Critical']]
         return {
             'generated_at': datetime.utcnow().isoformat(),
             'new_count': len(new_items),
+            'amended_count': len(amended),
             'escalated_count': len(escalated),
             'new_items': [{'id': i.id, 'title': i.title, 'impact': i.impact_overall} for i in new_items],
+            'amended_items': [{'id': i.id, 'title': i.title, 'impact': i.impact_overall} for i in amended],
         }
     
     @staticmethod
@@ -55,6 +68,26 @@ class OutputGenerators:
         df.to_csv(filename, index=False)
         return filename
     
+    @staticmethod
+    def stream_to_csv(rows: Iterable, filename: str = 'impact_analysis.csv'):
+        # Same columns as export_to_csv, written row by row from DataStore.iter_export_rows
+        with open(filename, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(['ID', 'Title', 'Source', 'Impact', 'Area', 'URL'])
+            for row in rows:
+                writer.writerow([row.id, row.title, row.source, row.impact_overall, row.business_area, row.url])
+        return filename
+    
+    @staticmethod
+    def stream_to_jsonl(rows: Iterable, filename: str = 'impact_items.jsonl'):
+        with open(filename, 'w', encoding='utf-8') as f:
+            for row in rows:
+                record = dict(row._mapping)
+                if record.get('published_at'):
+                    record['published_at'] = record['published_at'].isoformat()
+                f.write(json.dumps(record) + '\n')
+        return filename
+    
     @staticmethod
     def export_to_json(digest: Dict, backlog: Dict, changelog: Dict, filename: str = 'impact_report.json'):
         report = {'generated_at': datetime.utcnow().isoformat(), 'digest': digest, 'backlog': backlog, 'changelog': changelog}
@@ -0,0 +1,190 @@
+from utils.data_store import DataStore
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import threading
+import re
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Business-area keywords (README "Business Areas & Keywords", SecRSSConnector._extract_tags); a hit always keeps an item for the LLM
+AREA_KEYWORDS = {
+    'RIA': ['investment adviser', 'investment advisor', 'advisers act', 'fiduciary', 'form adv', 'wealth management', 'private fund'],
+    'Broker-Dealer': ['broker-dealer', 'broker dealer', 'best execution', 'regulation best interest', 'reg bi', 'net capital', 'finra rule'],
+    'Retirement': ['erisa', 'retirement', '401(k)', 'ira', 'iras', 'pension', 'plan participant', 'annuity', 'annuities'],
+    'AML': ['anti-money laundering', 'aml', 'know your customer', 'kyc', 'beneficial ownership', 'sanctions', 'suspicious activity', 'bank secrecy'],
+    'Marketing': ['marketing rule', 'advertising', 'communications with the public', 'testimonial'],
+    'Trading': ['market manipulation', 'insider trading', 'short sale', 'order routing', 'trade reporting'],
+    'Supervision': ['supervision', 'supervisory', 'surveillance', 'audit trail', 'books and records', 'recordkeeping'],
+    'Custody': ['custody', 'custodian', 'safeguarding', 'segregation of'],
+}
+# Federal Register topics that never concern a wealth management firm. Specific phrases rather than agency names: an agency such as
+# NIST or the Coast Guard also issues guidance a firm may need, and rule rejects never reach the model or its training labels.
+OUT_OF_SCOPE_KEYWORDS = ['foreign-trade zone', 'fisheries', 'fishery', 'marine mammal', 'endangered species', 'wildlife', 'airworthiness',
+                         'drawbridge', 'safety zone', 'regulated navigation area', 'national institutes of health', 'infectious diseases',
+                         'pesticide', 'air quality', 'hazardous waste', 'medical device', 'drug administration', 'pipeline safety',
+                         'energy conservation', 'nuclear regulatory', 'meat and poultry', 'crop insurance', 'highway', 'railroad']
+
+def _keyword_pattern(keywords: List[str]):
+    # Whole words only, so 'ira' does not fire on 'Iran' or 'aml' on 'Hamlet'
+    return re.compile('|'.join(f"(?<![a-z0-9]){re.escape(keyword)}(?![a-z0-9])" for keyword in keywords))
+
+AREA_PATTERNS = {area: _keyword_pattern(keywords) for area, keywords in AREA_KEYWORDS.items()}
+OUT_OF_SCOPE_PATTERN = _keyword_pattern(OUT_OF_SCOPE_KEYWORDS)
+
+class RelevanceFilter:
+    # Local pre-filter in front of AIAnalysisPipeline.check_relevance: keyword rules plus a logistic regression over hashed
+    # title/summary features, trained on past LLM relevance labels. Items it is confident about never reach the API.
+    STATE_NAME = 'relevance_model'
+    REASON_PREFIX = 'Pre-filter'
+    # Labels that are not model judgements: analysis failures and the pre-filter's own decisions
+    EXCLUDED_REASONS = (REASON_PREFIX, 'Analysis error')
+
+    def __init__(self, data_store: DataStore, skip_below: float = 0.03, accept_above: float = 0.97, num_features: int = 1 << 16,
+                 min_labels: int = 200, retrain_every: int = 200):
+        self.data_store = data_store
+        self.skip_below = skip_below
+        self.accept_above = accept_above
+        self.num_features = num_features
+        self.min_labels = min_labels
+        self.retrain_every = retrain_every
+        self.weights = None
+        self.bias = 0.0
+        self.trained_on = 0
+        self.decisions = {'irrelevant': 0, 'relevant': 0, 'ambiguous': 0}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> bool:
+        # Loads the stored model, retraining once retrain_every new labels have accumulated; returns whether a model is in use
+        labels = self.data_store.count_relevance_labels(self.EXCLUDED_REASONS)
+        if self.weights is None:
+            self._load(self.data_store.get_state(self.STATE_NAME))
+        if labels >= self.min_labels and (self.weights is None or labels - self.trained_on >= self.retrain_every):
+            rows = self.data_store.get_relevance_labels(self.EXCLUDED_REASONS)
+            if self.train(rows):
+                nonzero = np.flatnonzero(self.weights)
+                self.data_store.set_state(self.STATE_NAME, {'labels': self.trained_on, 'bias': self.bias, 'num_features': self.num_features,
+                                                            'weights': dict(zip(nonzero.tolist(), np.round(self.weights[nonzero], 5).tolist()))})
+        return self.weights is not None
+
+    def _load(self, state: Optional[Dict]):
+        if not state or state.get('num_features') != self.num_features:
+            return
+        self.weights = np.zeros(self.num_features)
+        self.weights[[int(index) for index in state['weights']]] = list(state['weights'].values())
+        self.bias = state['bias']
+        self.trained_on = state['labels']
+
+    def train(self, rows: List, iterations: int = 300, learning_rate: float = 0.5, l2: float = 1e-4) -> bool:
+        # Full-batch gradient descent with per-feature (AdaGrad) step sizes; rows carry title, summary_raw, source, type, is_relevant
+        labels = np.array([1.0 if row.is_relevant else 0.0 for row in rows])
+        if len(rows) < self.min_labels or labels.sum() < 10 or (1 - labels).sum() < 10:
+            logger.info(f"Relevance pre-filter: not enough labelled items to train ({len(rows)})")
+            return False
+        row_index, columns = self._feature_matrix([self._text(row.title, row.summary_raw, row.source, row.type) for row in rows])
+        weights = np.zeros(self.num_features)
+        bias = 0.0
+        squared = np.full(self.num_features, 1e-8)
+        for _ in range(iterations):
+            probabilities = 1 / (1 + np.exp(-(np.bincount(row_index, weights=weights[columns], minlength=len(rows)) + bias)))
+            error = probabilities - labels
+            gradient = np.bincount(columns, weights=error[row_index], minlength=self.num_features) / len(rows) + l2 * weights
+            squared += gradient ** 2
+            weights -= learning_rate * gradient / np.sqrt(squared)
+            bias -= learning_rate * error.mean()
+        self.weights, self.bias, self.trained_on = weights, bias, len(rows)
+        logger.info(f"Relevance pre-filter trained on {len(rows)} labelled items ({int(labels.sum())} relevant)")
+        return True
+
+    def _feature_matrix(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        # Sparse binary features as parallel (row, column) arrays
+        row_index, columns = [], []
+        for row, text in enumerate(texts):
+            features = self.features(text)
+            row_index.extend([row] * len(features))
+            columns.extend(features)
+        return np.array(row_index, dtype=np.int64), np.array(columns, dtype=np.int64)
+
+    @staticmethod
+    def _text(title: Optional[str], summary: Optional[str], source: Optional[str], item_type: Optional[str]) -> str:
+        return f"source_{source or ''} type_{item_type or ''} {title or ''} {summary or ''}".lower()
+
+    def features(self, text: str) -> List[int]:
+        # Word unigrams and bigrams, hashed with crc32 so the stored weights stay valid across processes
+        words = re.findall(r'[a-z0-9_()-]+', text)
+        tokens = set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+        return sorted({zlib.crc32(token.encode('utf-8')) % self.num_features for token in tokens})
+
+    def probability(self, item_dict: Dict) -> Optional[float]:
+        if self.weights is None:
+            return None
+        text = self._text(item_dict.get('title'), item_dict.get('summary_raw'), item_dict.get('source'), item_dict.get('type'))
+        return float(1 / (1 + np.exp(-(self.weights[self.features(text)].sum() + self.bias))))
+
+    @staticmethod
+    def keyword_areas(text: str) -> Dict[str, int]:
+        hits = {area: len(pattern.findall(text.lower())) for area, pattern in AREA_PATTERNS.items()}
+        return {area: count for area, count in hits.items() if count}
+
+    def decide(self, item_dict: Dict) -> Optional[Dict]:
+        # A relevance result in check_relevance's shape when the item is clear-cut, None when the LLM has to decide
+        text = f"{item_dict.get('title') or ''} {item_dict.get('summary_raw') or ''}".lower()
+        areas = self.keyword_areas(text)
+        out_of_scope = OUT_OF_SCOPE_PATTERN.findall(text)
+        probability = self.probability(item_dict)
+        decision = None
+        if not areas and (out_of_scope and (probability is None or probability < 0.5) or probability is not None and probability < self.skip_below):
+            reason = f"out-of-scope topic ({out_of_scope[0]})" if out_of_scope else f"p(relevant)={probability:.3f}"
+            decision = {'relevant': False, 'business_area': None, 'reason': f"{self.REASON_PREFIX}: {reason}"}
+        elif areas and probability is not None and probability >= self.accept_above:
+            area = max(areas, key=areas.get)
+            decision = {'relevant': True, 'business_area': area, 'reason': f"{self.REASON_PREFIX}: {area} keywords, p(relevant)={probability:.3f}"}
+        with self._lock:
+            self.decisions['ambiguous' if decision is None else 'relevant' if decision['relevant'] else 'irrelevant'] += 1
+        return decision
+
+    def stats(self) -> Dict:
+        with self._lock:
+            decided = self.decisions['irrelevant'] + self.decisions['relevant']
+            total = decided + self.decisions['ambiguous']
+            return {**self.decisions, 'api_calls_saved': decided, 'decided_rate': round(decided / total, 3) if total else 0.0}
+
+    def evaluate(self, folds: int = 5, seed: int = 0) -> Dict:
+        # Cross-validated on the stored labels: each fold is decided by a model trained on the other folds.
+        # skip_precision: share of items skipped as irrelevant that really were irrelevant; relevant_recall: share of relevant
+        # items still sent on (or accepted as relevant); api_calls_saved: relevance calls the pre-filter would have answered.
+        rows = self.data_store.get_relevance_labels(self.EXCLUDED_REASONS)
+        unlabelled = self.data_store.get_unlabelled_item_texts(self.EXCLUDED_REASONS)
+        rule_only = RelevanceFilter(self.data_store, num_features=self.num_features)
+        report = {'labelled': len(rows), 'unlabelled': len(unlabelled),
+                  'unlabelled_skipped_by_rules': sum(1 for row in unlabelled if (rule_only.decide(row._asdict()) or {}).get('relevant') is False)}
+        if len(rows) < max(self.min_labels, folds):
+            return report
+        order = np.random.default_rng(seed).permutation(len(rows))
+        counts = {'skipped': 0, 'skipped_relevant': 0, 'accepted': 0, 'accepted_irrelevant': 0, 'relevant': 0, 'relevant_kept': 0}
+        for fold in range(folds):
+            held_out = set(order[fold::folds].tolist())
+            model = RelevanceFilter(self.data_store, self.skip_below, self.accept_above, self.num_features, self.min_labels)
+            if not model.train([row for index, row in enumerate(rows) if index not in held_out]):
+                return report
+            for index in held_out:
+                row = rows[index]
+                decision = model.decide(row._asdict())
+                counts['relevant'] += bool(row.is_relevant)
+                if decision is None:
+                    counts['relevant_kept'] += bool(row.is_relevant)
+                elif decision['relevant']:
+                    counts['accepted'] += 1
+                    counts['accepted_irrelevant'] += not row.is_relevant
+                    counts['relevant_kept'] += bool(row.is_relevant)
+                else:
+                    counts['skipped'] += 1
+                    counts['skipped_relevant'] += bool(row.is_relevant)
+        report.update(counts)
+        report['skip_precision'] = round(1 - counts['skipped_relevant'] / counts['skipped'], 4) if counts['skipped'] else None
+        report['accept_precision'] = round(1 - counts['accepted_irrelevant'] / counts['accepted'], 4) if counts['accepted'] else None
+        report['relevant_recall'] = round(counts['relevant_kept'] / counts['relevant'], 4) if counts['relevant'] else None
+        report['api_calls_saved'] = counts['skipped'] + counts['accepted']
+        report['api_calls_saved_rate'] = round(report['api_calls_saved'] / len(rows), 4)
+        return report
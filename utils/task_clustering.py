@@ -0,0 +1,95 @@
+from utils.data_store import DataStore
+from utils.minhash import MinHasher
+from collections import defaultdict
+from typing import Dict, List
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TaskClusterer:
+    # Near-duplicate task clustering: MinHash signatures over character shingles, LSH banding for candidate pairs,
+    # union-find for clusters. Each task is compared only with tasks that share an LSH bucket, never all pairs.
+    STATE_NAME = 'task_clusters'
+    MAX_ANCHORS = 8
+
+    def __init__(self, data_store: DataStore, num_perm: int = 64, bands: int = 16, threshold: float = 0.6, shingle_size: int = 4, seed: int = 7):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.data_store = data_store
+        self.num_perm = num_perm
+        self.bands = bands
+        self.threshold = threshold
+        self.minhash = MinHasher(num_perm=num_perm, shingle_size=shingle_size, seed=seed)
+
+    def run(self, force: bool = False) -> Dict:
+        # Skipped when no task has been added or replaced since the last run
+        version = list(self.data_store.get_task_version())
+        state = self.data_store.get_state(self.STATE_NAME)
+        if not force and state and state.get('version') == version:
+            return {'tasks': 0, 'clusters': state.get('clusters'), 'updated': 0, 'skipped': True}
+
+        tasks = self.data_store.get_task_texts()
+        clusters = self.cluster([(task.task, task.owner_role) for task in tasks])
+        # Clusters are keyed by the dedupe_key of their first task in item order, so exact duplicates keep their existing key
+        assignments = {}
+        for members in clusters:
+            canonical = tasks[members[0]].dedupe_key
+            for index in members:
+                if tasks[index].cluster_key != canonical:
+                    assignments[tasks[index].id] = canonical
+        updated = self.data_store.set_task_clusters(assignments)
+        self.data_store.set_state(self.STATE_NAME, {'version': list(self.data_store.get_task_version()), 'clusters': len(clusters)})
+        logger.info(f"Task clustering: {len(tasks)} tasks in {len(clusters)} clusters, {updated} reassigned")
+        return {'tasks': len(tasks), 'clusters': len(clusters), 'updated': updated, 'skipped': False}
+
+    def cluster(self, tasks: List) -> List[List[int]]:
+        # tasks: (text, owner_role) pairs; returns clusters as sorted index lists. Tasks only merge within the same owner_role.
+        signatures = self.minhash.signatures([text or '' for text, _ in tasks])
+        parent = list(range(len(tasks)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(i: int, j: int):
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+        owner_codes = {}
+        owners = np.array([owner_codes.setdefault((owner or '').lower(), len(owner_codes)) for _, owner in tasks], dtype=np.uint64)
+        min_matches = self.threshold * self.num_perm
+        # Identical normalized text always merges, whatever the bucket verification below decides
+        identical = {}
+        for index in range(len(tasks)):
+            union(identical.setdefault((int(owners[index]), signatures[index].tobytes()), index), index)
+
+        # Bucket key per task and band: the band key plus the owner, so tasks of different owners never share a bucket
+        band_keys = self.minhash.band_keys(signatures, self.bands) + (owners * np.uint64(0x9E3779B97F4A7C15))[:, None]
+        for band in range(self.bands):
+            keys = band_keys[:, band]
+            order = np.argsort(keys, kind='stable')
+            boundaries = np.flatnonzero(np.diff(keys[order])) + 1
+            for members in np.split(order, boundaries):
+                if len(members) < 2:
+                    continue
+                # Each member is verified against at most MAX_ANCHORS earlier members, so a crowded bucket stays linear
+                anchors = []
+                for index in members.tolist():
+                    match = None
+                    for anchor in anchors:
+                        if find(anchor) == find(index) or np.count_nonzero(signatures[anchor] == signatures[index]) >= min_matches:
+                            match = anchor
+                            break
+                    if match is not None:
+                        union(match, index)
+                    elif len(anchors) < self.MAX_ANCHORS:
+                        anchors.append(index)
+
+        groups = defaultdict(list)
+        for index in range(len(tasks)):
+            groups[find(index)].append(index)
+        return sorted(groups.values())